@@ -12,6 +12,48 @@ class Settings(BaseSettings):
     BASE_URL: str = "https://dev.api.zuri.chat"
     MESSAGE_COLLECTION = "messages"
     ROOM_COLLECTION = "rooms"
+    TOMBSTONE_COLLECTION = "message_tombstones"
+    THREAD_REPLIES_COLLECTION = "thread_replies"
+    ROOM_DELETION_COLLECTION = "room_deletions"
+    ROOM_MEMBERS_COLLECTION = "room_members"
+    PLUGIN_ID_TTL: int = 3600
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_READ_TIMEOUT: float = 30.0
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 50
+    ORG_DIRECTORY_TTL: int = 300
+    ORG_DIRECTORY_STALE_TTL: int = 3600
+    ROOM_CACHE_SIZE: int = 10000
+    MESSAGE_SEQ_RETRIES: int = 5
+    THREAD_PAGE_SIZE: int = 20
+    THREAD_PARTICIPANTS_WINDOW: int = 10
+    THREAD_SUMMARY_PARTICIPANTS: int = 3
+    THREAD_SPILL_THRESHOLD: int = 200
+    THREAD_SPILL_RETRIES: int = 5
+    THREAD_MIGRATION_BATCH_SIZE: int = 50
+    MESSAGE_BUFFER_SIZE: int = 50
+    MESSAGE_BUFFER_MAX_BYTES: int = 64 * 1024 * 1024
+    REACTION_WINDOW: float = 0.05
+    DELETE_CHUNK_SIZE: int = 20
+    MESSAGE_DELETE_LIMIT: int = 500
+    ROOM_DELETION_BATCH_SIZE: int = 100
+    ROOM_DELETION_CHUNK_SIZE: int = 5
+    ROOM_DELETION_DUTY_CYCLE: float = 0.25
+    ROOM_DELETION_CONCURRENCY: int = 2
+    ROOM_DELETION_LEASE: int = 60
+    ROOM_DELETION_CONFIRM_DELAY: int = 5
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_TTL: int = 24 * 3600
+    DM_INDEX_SIZE: int = 100000
+    DM_INDEX_BACKFILL_BATCH_SIZE: int = 50
+    MEMBER_ROOMS_CACHE_SIZE: int = 10000
+    MEMBER_ROOMS_TTL: int = 300
+    ROOM_MEMBERS_SPILL_THRESHOLD: int = 1000
+    ROOM_MEMBERS_SPILL_RETRIES: int = 5
+    ROOM_MEMBERS_MIGRATION_BATCH_SIZE: int = 10
+    ROOM_MEMBERS_PAGE_SIZE: int = 100
+    ROOM_MEMBERS_PAGE_MAX: int = 1000
 
 
 settings = Settings()
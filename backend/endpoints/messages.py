@@ -1,19 +1,54 @@
+from typing import Any, Hashable, Optional
+
 from fastapi import (APIRouter, BackgroundTasks, Depends, File, Header,
                      HTTPException, UploadFile, status)
-from schema.message import Message, MessageFormData, MessageRequest
+from schema.message import (Message, MessageDeleteRequest, MessageFormData,
+                            MessageRequest, MessageUpdateRequest,
+                            ReactionRequest)
 from schema.response import ResponseModel
+from schema.room import Role
 from starlette.responses import JSONResponse
 from utils.centrifugo import Events, centrifugo_client
 from utils.chat_notification import Notification
 from utils.files_utils import upload_files
-from utils.message_utils import create_message, get_message, get_room_messages
+from utils.idempotency import idempotency_key, idempotency_store
+from utils.message_buffer import message_buffer
+from utils.message_utils import (create_message, delete_messages, get_message,
+                                 get_messages_by_ids, get_room_changes,
+                                 get_room_messages, get_room_messages_by_seq)
 from utils.message_utils import update_message as edit_message
 from utils.paginator import page_urls
+from utils.reactions import reaction_batcher
+from utils.room_utils import get_member_room, get_room_counters
 
 router = APIRouter()
 notification = Notification()
 
 
+async def get_message_room(
+    org_id: str,
+    room_id: str,
+    request: MessageRequest = Depends(MessageFormData.as_form),
+) -> dict[str, Any]:
+    """Loads the room a message is sent to and checks the sender belongs to it.
+
+    Runs once per request, before the message is built.
+
+    Args:
+        org_id (str): The organization id
+        room_id (str): The room id
+        request (MessageRequest): The message request.
+
+    Returns:
+        dict: The room document.
+
+    Raises:
+        HTTPException [404]: Room does not exist or
+        Sender not a member of this room.
+    """
+    return await get_member_room(org_id, room_id, request.sender_id)
+
+
 @router.post(
     "/org/{org_id}/rooms/{room_id}/messages",
     response_model=ResponseModel,
@@ -27,23 +62,32 @@ async def send_message(
     org_id: str,
     room_id: str,
     background_tasks: BackgroundTasks,
+    idempotency: Optional[Hashable] = Depends(idempotency_key),
     request: MessageRequest = Depends(MessageFormData.as_form),
     attachments: list[UploadFile] = File([]),
     token: str = Header(""),
+    room: dict[str, Any] = Depends(get_message_room),
 ):
     """
     Uploads files to the file storage service, then
     Creates and sends a message from a user inside a room with the file urls.
 
+    A request retried with the same `Idempotency-Key` header gets the response
+    of the original request, without the message being sent again.
+
     Args:
         org_id (str): The organization id
         room_id (str): The room id
         background_tasks (BackgroundTasks): Background tasks to run
+        idempotency (Hashable, optional): The idempotency key of the request.
+        Defaults to Depends(idempotency_key).
         request (MessageRequest, optional): The message request.
         Defaults to Depends(MessageFormData.as_form).
         attachments (list[UploadFile], optional): The files to upload.
         Defaults to File([]).
         token (str, optional): The user's token. Defaults to Header("").
+        room (dict): The room the message is sent to.
+        Defaults to Depends(get_message_room).
 
     Raises:
         HTTPException [401]: If token is not provided if uploading files.
@@ -96,7 +140,7 @@ async def send_message(
 ```
     """
 
-    # Validate the sender_id and room_id
+    # The sender_id and room_id were validated by get_message_room
     message = Message(
         **request.dict(), org_id=org_id,
         room_id=room_id)
@@ -121,6 +165,14 @@ async def send_message(
         )
 
     message.message_id = response["data"]["object_id"]
+    # the message is stored, a retry must not send it again even if a later
+    # step fails
+    content = ResponseModel.success(data=message.dict(), message="new message sent")
+    idempotency_store.complete(idempotency, status.HTTP_201_CREATED, content)
+
+    message_buffer.append(
+        org_id, room_id, {**message.dict(), "_id": message.message_id}
+    )
 
     # Publish to centrifugo in the background.
     background_tasks.add_task(
@@ -136,7 +188,7 @@ async def send_message(
         print("Novu message error", e)
 
     return JSONResponse(
-        content=ResponseModel.success(data=message.dict(), message="new message sent"),
+        content=content,
         status_code=status.HTTP_201_CREATED,
     )
 
@@ -148,6 +200,7 @@ async def send_message(
     responses={
         401: {"description": "You are not authorized to edit this message"},
         404: {"description": "Message not found"},
+        409: {"description": "Message was edited since it was read"},
         424: {"description": "Message not edited"},
     },
 )
@@ -155,13 +208,15 @@ async def update_message(
     org_id: str,
     room_id: str,
     message_id: str,
-    request: MessageRequest,
+    request: MessageUpdateRequest,
     background_tasks: BackgroundTasks,
 ):
     """Updates a message sent in a room.
 
     Edits an existing message document in the messages database collection while
     publishing to all members of the room in the background.
+    When the request carries the `version` of the message being edited, the edit
+    is rejected if the message was edited since.
 
     Args:
         org_id: A unique identifier of the organization.
@@ -172,11 +227,10 @@ async def update_message(
                           members of the room.
 
     Returns:
-        A dict containing data about the message that was edited.
+        A dict containing the fields of the message that were edited.
 
             {
                 "_id": "61c3aa9478fb01b18fac1465",
-                "created_at": "2021-12-22 22:38:33.075643",
                 "edited": true,
                 "emojis": [
                 {
@@ -207,30 +261,20 @@ async def update_message(
                 "room_id": "619e28c31a5f54782939d59a",
                 "saved_by": [],
                 "sender_id": "619ba4671a5f54782939d385",
-                "text": "string",
-                "threads": []
+                "updated_at": "2021-12-22 22:40:12.519327",
+                "version": 2
             }
 
     Raises:
         HTTPException [401]: You are not authorized to edit this message.
         HTTPException [404]: Message not found.
+        HTTPException [409]: Message was edited since it was read.
         HTTPException [424]: Message not edited.
     """
-    message = await get_message(org_id, room_id, message_id)
-
-    if not message:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Message not found"
-        )
-
     payload = request.dict(exclude_unset=True)
-    if message["sender_id"] != payload["sender_id"]:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="You are not authorized to edit this message",
-        )
+    version = payload.pop("version", None)
 
-    edited_message = await edit_message(org_id, message_id, payload)
+    edited_message = await edit_message(org_id, room_id, message_id, payload, version)
 
     if not edited_message or edited_message.get("status_code"):
         raise HTTPException(
@@ -238,8 +282,14 @@ async def update_message(
             detail={"message not edited": edited_message},
         )
 
-    payload["edited"] = True
-    message.update(payload)
+    if version is None:
+        # the new version is unknown, so the buffered copy cannot be patched
+        message_buffer.invalidate(org_id, room_id)
+    else:
+        payload = {**payload, "version": version + 1}
+        message_buffer.update(org_id, room_id, message_id, payload)
+
+    message = {"_id": message_id, "org_id": org_id, "room_id": room_id, **payload}
 
     # Publish to centrifugo in the background.
     background_tasks.add_task(
@@ -252,60 +302,401 @@ async def update_message(
     )
 
 
+async def remove_messages(
+    org_id: str,
+    room_id: str,
+    member_id: str,
+    message_ids: list[str],
+    background_tasks: BackgroundTasks,
+) -> dict[str, list[str]]:
+    """Deletes messages of a room on behalf of a member.
+
+    Members can delete their own messages, room admins can delete any message.
+    The deletion is published to the room as a single event.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The room id.
+        member_id (str): The id of the member deleting the messages.
+        message_ids (list[str]): The ids of the messages to be deleted.
+        background_tasks (BackgroundTasks): A background task for publishing to all
+                                            members of the room.
+
+    Returns:
+        dict: The ids of the messages that were `deleted`, `not_found` in the room
+        or that `failed` to be deleted.
+
+    Raises:
+        HTTPException [401]: You are not authorized to delete this message.
+        HTTPException [404]: Room does not exist or Member not in room.
+        HTTPException [424]: ZC Core failed.
+    """
+    room = await get_member_room(org_id, room_id, member_id)
+
+    messages = await get_messages_by_ids(org_id, room_id, message_ids)
+    if messages is None:
+        raise HTTPException(
+            status_code=status.HTTP_424_FAILED_DEPENDENCY, detail="ZC Core failed"
+        )
+
+    is_admin = room["room_members"][member_id].get("role") == Role.ADMIN
+    if not is_admin and any(
+        message.get("sender_id") != member_id for message in messages
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="You are not authorized to delete this message",
+        )
+
+    deleted = await delete_messages(org_id, room_id, messages)
+    if deleted:
+        background_tasks.add_task(
+            centrifugo_client.publish,
+            room_id,
+            Events.MESSAGE_DELETE,
+            {"room_id": room_id, "message_ids": deleted},
+        )
+
+    found = {message["_id"] for message in messages}
+    return {
+        "deleted": deleted,
+        "not_found": [
+            message_id for message_id in message_ids if message_id not in found
+        ],
+        "failed": [
+            message_id
+            for message_id in message_ids
+            if message_id in found and message_id not in deleted
+        ],
+    }
+
+
+@router.delete(
+    "/org/{org_id}/rooms/{room_id}/messages/{message_id}",
+    response_model=ResponseModel,
+    status_code=status.HTTP_200_OK,
+    responses={
+        401: {"description": "You are not authorized to delete this message"},
+        404: {"description": "Room, member or message not found"},
+        424: {"description": "Message not deleted"},
+    },
+)
+async def delete_message(
+    org_id: str,
+    room_id: str,
+    message_id: str,
+    member_id: str,
+    background_tasks: BackgroundTasks,
+):
+    """Deletes a message sent in a room.
+
+    Removes the message and its thread replies, leaves a tombstone for syncing
+    clients and publishes the deletion to all members of the room in the
+    background.
+
+    Args:
+        org_id: A unique identifier of the organization.
+        room_id: A unique identifier of the room.
+        message_id: A unique identifier of the message to be deleted.
+        member_id: A unique identifier of the member deleting the message.
+        background_tasks: A background task for publishing to all
+                          members of the room.
+
+    Returns:
+        A dict containing the id of the deleted message.
+
+            {
+                "status": "success",
+                "message": "Message deleted",
+                "data": {
+                    "message_id": "61c3aa9478fb01b18fac1465"
+                }
+            }
+
+    Raises:
+        HTTPException [401]: You are not authorized to delete this message.
+        HTTPException [404]: Room does not exist or Member not in room.
+        HTTPException [404]: Message not found.
+        HTTPException [424]: Message not deleted.
+    """
+    result = await remove_messages(
+        org_id, room_id, member_id, [message_id], background_tasks
+    )
+
+    if result["not_found"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Message not found"
+        )
+
+    if result["failed"]:
+        raise HTTPException(
+            status_code=status.HTTP_424_FAILED_DEPENDENCY, detail="Message not deleted"
+        )
+
+    return JSONResponse(
+        content=ResponseModel.success(
+            data={"message_id": message_id}, message="Message deleted"
+        ),
+        status_code=status.HTTP_200_OK,
+    )
+
+
+@router.post(
+    "/org/{org_id}/rooms/{room_id}/messages/delete",
+    response_model=ResponseModel,
+    status_code=status.HTTP_200_OK,
+    responses={
+        401: {"description": "You are not authorized to delete this message"},
+        404: {"description": "Room or member not found"},
+        424: {"description": "Messages not deleted"},
+    },
+)
+async def delete_messages_in_bulk(
+    org_id: str,
+    room_id: str,
+    request: MessageDeleteRequest,
+    background_tasks: BackgroundTasks,
+):
+    """Deletes several messages sent in a room.
+
+    Messages are deleted in concurrent chunks, each one leaving a tombstone for
+    syncing clients, and the deletions are published to all members of the room
+    as a single event.
+
+    Args:
+        org_id: A unique identifier of the organization.
+        room_id: A unique identifier of the room.
+        request: A pydantic schema that defines the delete request parameters.
+        background_tasks: A background task for publishing to all
+                          members of the room.
+
+    Returns:
+        A dict containing the ids of the messages that were deleted, not found in
+        the room, or that failed to be deleted.
+
+            {
+                "status": "success",
+                "message": "Messages deleted",
+                "data": {
+                    "deleted": ["61c3aa9478fb01b18fac1465"],
+                    "not_found": [],
+                    "failed": []
+                }
+            }
+
+    Raises:
+        HTTPException [401]: You are not authorized to delete this message.
+        HTTPException [404]: Room does not exist or Member not in room.
+        HTTPException [424]: Messages not deleted.
+    """
+    message_ids = list(dict.fromkeys(request.message_ids))
+    result = await remove_messages(
+        org_id, room_id, request.member_id, message_ids, background_tasks
+    )
+
+    if result["failed"] and not result["deleted"]:
+        raise HTTPException(
+            status_code=status.HTTP_424_FAILED_DEPENDENCY,
+            detail={"Messages not deleted": result},
+        )
+
+    return JSONResponse(
+        content=ResponseModel.success(data=result, message="Messages deleted"),
+        status_code=status.HTTP_200_OK,
+    )
+
+
+@router.post(
+    "/org/{org_id}/rooms/{room_id}/messages/{message_id}/reactions",
+    response_model=ResponseModel,
+    status_code=status.HTTP_200_OK,
+    responses={
+        404: {"description": "Room, sender or message not found"},
+        424: {"description": "Reaction not saved"},
+    },
+)
+async def add_reaction(
+    org_id: str, room_id: str, message_id: str, request: ReactionRequest
+):
+    """Reacts to a message with an emoji.
+
+    The reaction is added to the message with atomic updates instead of
+    rewriting the message, and reactions sent to the room within a short
+    window are written and published together.
+
+    Args:
+        org_id: A unique identifier of the organization.
+        room_id: A unique identifier of the room.
+        message_id: A unique identifier of the message reacted to.
+        request: A pydantic schema that defines the reaction request parameters.
+
+    Returns:
+        A dict containing the reaction.
+
+            {
+                "status": "success",
+                "message": "Reaction added",
+                "data": {
+                    "sender_id": "619ba4671a5f54782939d385",
+                    "name": "frown",
+                    "emoji": "👹"
+                }
+            }
+
+    Raises:
+        HTTPException [404]: Room does not exist or Sender not a member of this room.
+        HTTPException [404]: Message not found.
+        HTTPException [424]: Reaction not saved.
+    """
+    await get_member_room(org_id, room_id, request.sender_id)
+    await reaction_batcher.react(
+        org_id,
+        room_id,
+        message_id,
+        request.sender_id,
+        request.name,
+        request.emoji,
+        added=True,
+    )
+
+    return JSONResponse(
+        content=ResponseModel.success(data=request.dict(), message="Reaction added"),
+        status_code=status.HTTP_200_OK,
+    )
+
+
+@router.delete(
+    "/org/{org_id}/rooms/{room_id}/messages/{message_id}/reactions/{name}",
+    response_model=ResponseModel,
+    status_code=status.HTTP_200_OK,
+    responses={
+        404: {"description": "Room, sender or message not found"},
+        424: {"description": "Reaction not saved"},
+    },
+)
+async def remove_reaction(
+    org_id: str, room_id: str, message_id: str, name: str, sender_id: str
+):
+    """Removes a member's reaction with an emoji from a message.
+
+    Args:
+        org_id: A unique identifier of the organization.
+        room_id: A unique identifier of the room.
+        message_id: A unique identifier of the message reacted to.
+        name: The name of the emoji.
+        sender_id: A unique identifier of the member removing their reaction.
+
+    Returns:
+        A dict containing the removed reaction.
+
+            {
+                "status": "success",
+                "message": "Reaction removed",
+                "data": {
+                    "sender_id": "619ba4671a5f54782939d385",
+                    "name": "frown"
+                }
+            }
+
+    Raises:
+        HTTPException [404]: Room does not exist or Sender not a member of this room.
+        HTTPException [404]: Message not found.
+        HTTPException [424]: Reaction not saved.
+    """
+    await get_member_room(org_id, room_id, sender_id)
+    await reaction_batcher.react(
+        org_id, room_id, message_id, sender_id, name, emoji=None, added=False
+    )
+
+    return JSONResponse(
+        content=ResponseModel.success(
+            data={"sender_id": sender_id, "name": name}, message="Reaction removed"
+        ),
+        status_code=status.HTTP_200_OK,
+    )
+
+
 @router.get(
     "/org/{org_id}/rooms/{room_id}/messages",
     response_model=list[Message],
     status_code=status.HTTP_200_OK,
-    responses={424: {"detail": "ZC Core failed"}},
+    responses={
+        400: {"detail": "Invalid cursor"},
+        424: {"detail": "ZC Core failed"},
+    },
 )
 async def get_messages(
-    org_id: str, room_id: str, page: int = 1, size: int = 15, created_at: int = None
+    org_id: str,
+    room_id: str,
+    page: int = 1,
+    size: int = 15,
+    created_at: int = None,
+    before: str = None,
+    after: str = None,
+    include_total: bool = True,
+    include_threads: bool = True,
 ):
-    """Fetches all messages sent in a particular room.
+    """Fetches the messages sent in a particular room, newest first.
+
+    Pages can be requested by number or, preferably, with the opaque `before` and
+    `after` cursors returned with every page. Cursor pages are read with a keyset
+    query so their cost does not grow with the depth of the page.
 
     Args:
         org_id (str): A unique identifier of an organization.
         room_id (str): A unique identifier of the room where messages are fetched from.
+        page (int): The page number, ignored when a cursor is given. Defaults to 1.
+        size (int): The number of messages per page. Defaults to 15.
+        created_at (int): Only fetch messages sent in the last `created_at` days.
+        before (str): Cursor returned as `next_cursor`, fetches older messages.
+        after (str): Cursor returned as `previous_cursor`, fetches newer messages.
+        include_total (bool): Whether to return the number of messages in the room.
+        Defaults to True. The total is None when `created_at` narrows the listing.
+        include_threads (bool): Whether to return the replies of every message.
+        When False, each message carries a `thread_summary` with its reply count,
+        last reply time and up to three recent participants instead, and replies
+        are loaded from the thread endpoint. Defaults to True.
 
     Returns:
         A dict containing a list of message objects.
         {
             "status": "success",
             "message": "Messages retrieved",
-            "data": [
-                {
-                "_id": "61e75bc065934b58b8e5d223",
-                "created_at": "2022-02-02 17:57:02.630439",
-                "edited": true,
-                "emojis": [
+            "data": {
+                "data": [
                     {
-                    "count": 1,
-                    "emoji": "👹",
-                    "name": "frown",
-                    "reactedUsersId": [
-                        "619ba4671a5f54782939d385"
-                    ]
-                    }
+                    "_id": "61e75bc065934b58b8e5d223",
+                    "created_at": "2022-02-02 17:57:02.630439",
+                    "edited": true,
+                    ...
+                    },
+                    {...},
+                    ...
                 ],
-                ...
-                },
-                {...},
-                ...
-            ]
+                "page": 1,
+                "size": 15,
+                "total": 40,
+                "next": "/api/v1/org/.../messages?page=2&size=15",
+                "previous": null,
+                "next_cursor": "string",
+                "previous_cursor": null
+            }
         }
 
     Raises:
+        HTTPException [400]: Invalid cursor
         HTTPException [424]: Zc Core failed
     """
-
-    response = await get_room_messages(org_id, room_id, page, size, created_at)
-
-    paging, total_count = await page_urls(
-        page,
-        size,
+    cursor = before or after
+    response = await get_room_messages(
         org_id,
         room_id,
-        endpoint=f"/api/v1/org/{org_id}/rooms/{room_id}/messages",
+        page,
+        size,
+        created_at,
+        before=before,
+        after=after,
+        include_threads=include_threads,
     )
 
     if response is None:
@@ -314,14 +705,33 @@ async def get_messages(
             detail="Zc Core failed",
         )
 
+    messages, has_more = response
+    if after:
+        has_older, has_newer = True, has_more
+    else:
+        has_older, has_newer = has_more, bool(before) or page > 1
+
+    paging = page_urls(
+        f"/api/v1/org/{org_id}/rooms/{room_id}/messages",
+        size,
+        messages,
+        has_older=has_older,
+        has_newer=has_newer,
+        page=None if cursor else page,
+    )
+
+    total_count = None
+    if include_total and not created_at:
+        counters = await get_room_counters(org_id, room_id)
+        total_count = counters["message_count"] if counters else None
+
     result = {
-            "data": response,
+            "data": messages,
             "created_at": created_at,
-            "page": page,
+            "page": None if cursor else page,
             "size": size,
             "total": total_count,
-            "previous": paging.get('previous'),
-            "next": paging.get('next')
+            **paging,
     }
 
     return JSONResponse(
@@ -330,6 +740,147 @@ async def get_messages(
     )
 
 
+@router.get(
+    "/org/{org_id}/rooms/{room_id}/seq",
+    response_model=ResponseModel,
+    status_code=status.HTTP_200_OK,
+    responses={
+        400: {"detail": "Invalid sequence range"},
+        424: {"detail": "ZC Core failed"},
+    },
+)
+async def get_messages_by_seq(
+    org_id: str, room_id: str, from_seq: int, to_seq: int = None, size: int = 100
+):
+    """Fetches the messages of a room within a range of sequence numbers.
+
+    Every message carries the `seq` number assigned when it was sent, also
+    published with the MESSAGE_CREATE event. A client that notices a gap in the
+    numbers it received fetches the missing range here instead of whole pages.
+
+    Args:
+        org_id (str): A unique identifier of an organization.
+        room_id (str): A unique identifier of the room where messages are fetched from.
+        from_seq (int): The sequence number of the first message, inclusive.
+        to_seq (int): The sequence number of the last message, inclusive.
+        Defaults to the end of a range of `size` messages.
+        size (int): The maximum number of messages to return. Defaults to 100.
+
+    Returns:
+        A dict containing the messages ordered by sequence number.
+        {
+            "status": "success",
+            "message": "Messages retrieved",
+            "data": {
+                "data": [
+                    {
+                    "_id": "61e75bc065934b58b8e5d223",
+                    "seq": 41,
+                    ...
+                    },
+                    {...},
+                    ...
+                ],
+                "from_seq": 41,
+                "to_seq": 45
+            }
+        }
+
+    Raises:
+        HTTPException [400]: Invalid sequence range
+        HTTPException [424]: Zc Core failed
+    """
+    last_seq = from_seq + size - 1
+    to_seq = last_seq if to_seq is None else min(to_seq, last_seq)
+    if from_seq < 1 or to_seq < from_seq:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid sequence range",
+        )
+
+    messages = await get_room_messages_by_seq(org_id, room_id, from_seq, to_seq)
+
+    if messages is None:
+        raise HTTPException(
+            status_code=status.HTTP_424_FAILED_DEPENDENCY,
+            detail="Zc Core failed",
+        )
+
+    result = {"data": messages, "from_seq": from_seq, "to_seq": to_seq}
+    return JSONResponse(
+        content=ResponseModel.success(data=result, message="Messages retrieved"),
+        status_code=status.HTTP_200_OK,
+    )
+
+
+@router.get(
+    "/org/{org_id}/rooms/{room_id}/sync",
+    response_model=ResponseModel,
+    status_code=status.HTTP_200_OK,
+    responses={424: {"detail": "ZC Core failed"}},
+)
+async def sync_messages(org_id: str, room_id: str, since: str, size: int = 100):
+    """Fetches what changed in a room since a client last synced it.
+
+    Reconnecting clients send the watermark returned by their previous sync,
+    or the `created_at` of the newest message they hold, and only receive the
+    messages created or edited after it and the ids of the messages deleted
+    after it. The watermark is an opaque cursor on the time and message id of
+    the last change returned. When `has_more` is true the client should sync
+    again with the returned watermark.
+
+    Args:
+        org_id (str): A unique identifier of an organization.
+        room_id (str): A unique identifier of the room to sync.
+        since (str): The watermark of the last change the client saw.
+        size (int): The maximum number of changes to return.
+        Defaults to 100.
+
+    Returns:
+        A dict containing the changes and the new watermark.
+        {
+            "status": "success",
+            "message": "Changes retrieved",
+            "data": {
+                "messages": [
+                    {
+                    "_id": "61e75bc065934b58b8e5d223",
+                    "created_at": "2022-02-02 17:57:02.630439",
+                    "updated_at": "2022-02-02 17:58:11.104293",
+                    "edited": true,
+                    ...
+                    },
+                    {...},
+                    ...
+                ],
+                "deleted": [
+                    {
+                    "message_id": "61e75bc065934b58b8e5d224",
+                    "deleted_at": "2022-02-02 17:59:40.551830"
+                    }
+                ],
+                "watermark": "WyIyMDIyLTAyLTAyIDE3OjU5OjQwLjU1MTgzMCIsIjYxZTc1Yj...",
+                "has_more": false
+            }
+        }
+
+    Raises:
+        HTTPException [424]: Zc Core failed
+    """
+    changes = await get_room_changes(org_id, room_id, since, size)
+
+    if changes is None:
+        raise HTTPException(
+            status_code=status.HTTP_424_FAILED_DEPENDENCY,
+            detail="Zc Core failed",
+        )
+
+    return JSONResponse(
+        content=ResponseModel.success(data=changes, message="Changes retrieved"),
+        status_code=status.HTTP_200_OK,
+    )
+
+
 @router.get(
     "/org/{org_id}/rooms/{room_id}/messages/{message_id}",
     response_model=list[Message],
@@ -1,13 +1,21 @@
 from typing import Dict, Optional
 
 from config.settings import settings
-from fastapi import APIRouter, BackgroundTasks, Body, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Body, HTTPException, Request, status
 from fastapi.responses import JSONResponse
 from schema.response import ResponseModel
 from schema.room import Role, Room, RoomMember, RoomRequest, RoomType, UpdateRoomRequest
 from utils.centrifugo import Events, centrifugo_client
 from utils.db import DataStorage
-from utils.room_utils import get_room, remove_room_member,remove_room
+from utils.dm_index import dm_index, member_key
+from utils.member_rooms import MEMBER_FLAGS, member_rooms
+from utils.org_directory import org_directory
+from utils.paginator import decode_member_cursor, encode_member_cursor
+from utils.room_deletion import room_deletion_jobs
+from utils.large_channels import spill_members
+from utils.room_utils import (cache_room, get_room, get_room_members_page,
+                              invalidate_room, patch_cached_room, remove_room,
+                              remove_room_member, update_room_members)
 from utils.sidebar import sidebar
 
 router = APIRouter()
@@ -30,6 +38,8 @@ async def create_room(
     Registers a new document to the database collection.
     Returns the document id if the room is successfully created or already exist
     while publishing to the user sidebar in the background
+    A DM or group DM is only created if its members have no room yet, which is
+    looked up by the key of the member set
 
     Args:
         org_id (str): A unique identifier of an organisation
@@ -54,6 +64,15 @@ async def create_room(
             "closed": False,
         }
 
+    if room_obj.room_type in (RoomType.DM, RoomType.GROUP_DM):
+        room_obj.member_key = member_key(room_obj.room_members)
+        existing_room_id = await dm_index.find(org_id, room_obj.member_key)
+        if existing_room_id is not None:
+            raise HTTPException(
+                status_code=status.HTTP_200_OK,
+                detail={"message": "room already exists", "room_id": existing_room_id},
+            )
+
     response = await DB.write(settings.ROOM_COLLECTION, data=room_obj.dict())
     if response and response.get("status_code", None) is None:
         room_id = {"room_id": response.get("data").get("object_id")}
@@ -66,6 +85,16 @@ async def create_room(
         )  # publish to centrifugo in the background
 
         room_obj.id = room_id["room_id"]  # adding the room id to the data
+        if room_obj.member_key is not None:
+            dm_index.add(org_id, room_obj.member_key, room_obj.id)
+        room = {**room_obj.dict(exclude={"id"}), "_id": room_obj.id}
+        cache_room(org_id, room)
+        member_rooms.add_room(org_id, room)
+        if (
+            room_obj.room_type == RoomType.CHANNEL
+            and len(room_obj.room_members) >= settings.ROOM_MEMBERS_SPILL_THRESHOLD
+        ):
+            background_tasks.add_task(spill_members, org_id, room_obj.id)
         return JSONResponse(
             content=ResponseModel.success(data=room_obj.dict(), message="room created"),
             status_code=status.HTTP_201_CREATED,
@@ -109,7 +138,7 @@ async def remove_member(
         HTTP_403_FORBIDDEN: not authorized to remove room  member
         HTTP_424_FAILED_DEPENDENCY: member removal unsuccessful
     """
-    room_data = await get_room(org_id, room_id)
+    room_data = await get_room(org_id, room_id, [member_id, admin_id])
     if not room_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -223,13 +252,11 @@ async def join_room(
         HTTP_403_FORBIDDEN: room not found || DM room cannot be joined
         HTTP_424_FAILED_DEPENDENCY: failed to add new members to room
     """
-    DB = DataStorage(org_id)  # initializes the datastorage class with the org id
-
     members = {
         k: v.dict() for k, v in new_members.items()
     }  # converts RoomMember to dict
 
-    room = await get_room(org_id=org_id, room_id=room_id)
+    room = await get_room(org_id=org_id, room_id=room_id, member_ids=[member_id])
 
     if not room or room["room_type"].upper() == RoomType.DM:
         raise HTTPException(
@@ -260,10 +287,37 @@ async def join_room(
                 detail="the max number for a Group_DM is 9",
             )
 
-    update_members = {"room_members": room["room_members"]}
-    update_response = await DB.update(
-        settings.ROOM_COLLECTION, document_id=room_id, data=update_members
-    )  # updates the room data in the db collection
+    data = {}
+    if room["room_type"].upper() == RoomType.GROUP_DM:
+        data["member_key"] = member_key(room["room_members"])
+
+    try:
+        # only the new members are written, the others are left untouched
+        updated = await update_room_members(
+            org_id,
+            room_id,
+            members,
+            data=data,
+            spilled=bool(room.get("members_spilled")),
+        )
+    except ConnectionError:
+        updated = False
+
+    if updated:
+        member_rooms.add_room(
+            org_id,
+            {"_id": room_id, "room_type": room["room_type"], "room_members": members},
+        )
+        if "member_key" in data:
+            if room.get("member_key"):
+                dm_index.remove(org_id, room["member_key"])
+            dm_index.add(org_id, data["member_key"], room_id)
+        if (
+            room["room_type"].upper() == RoomType.CHANNEL
+            and not room.get("members_spilled")
+            and len(room["room_members"]) >= settings.ROOM_MEMBERS_SPILL_THRESHOLD
+        ):
+            background_tasks.add_task(spill_members, org_id, room_id)
 
     background_tasks.add_task(
         centrifugo_client.publish,
@@ -272,11 +326,12 @@ async def join_room(
         data=members,
     )  # publish to centrifugo in the background
 
-    if update_response and update_response.get("status_code", None) is None:
+    if updated:
         return JSONResponse(
             status_code=status.HTTP_200_OK,
             content=ResponseModel.success(
-                data=update_members, message="member(s) successfully added"
+                data={"room_members": room["room_members"]},
+                message="member(s) successfully added",
             ),
         )
     raise HTTPException(
@@ -327,7 +382,6 @@ async def close_conversation(
         HTTP_404_NOT_FOUND: room not found
         HTTP_424_FAILED_DEPENDENCY: unable to close conversation
     """
-    DB = DataStorage(org_id)
     room = await get_room(org_id=org_id, room_id=room_id)
 
     if not room:
@@ -347,11 +401,23 @@ async def close_conversation(
 
     member_room_data = room["room_members"].get(member_id)
     member_room_data["closed"] = member_room_data["closed"] is False
-    data = {"room_members": room["room_members"]}
 
-    update_response = await DB.update(
-        settings.ROOM_COLLECTION, document_id=room_id, data=data
-    )  # updates the room data in the db collection
+    try:
+        updated = await update_room_members(
+            org_id, room_id, {member_id: {"closed": member_room_data["closed"]}}
+        )
+    except ConnectionError:
+        updated = False
+
+    if updated:
+        member_rooms.add_room(
+            org_id,
+            {
+                "_id": room_id,
+                "room_type": room["room_type"],
+                "room_members": {member_id: member_room_data},
+            },
+        )
 
     background_tasks.add_task(
         sidebar.publish,
@@ -360,7 +426,7 @@ async def close_conversation(
         room["room_type"],
     )  # publish to centrifugo in the background
 
-    if update_response and update_response.get("status_code") is None:
+    if updated:
         return JSONResponse(
             status_code=status.HTTP_200_OK,
             content=ResponseModel.success(
@@ -382,19 +448,40 @@ async def close_conversation(
     response_model=ResponseModel,
     status_code=status.HTTP_200_OK,
     responses={
+        400: {"detail": "Invalid cursor"},
         404: {"detail": "Room not found"},
         424: {"detail": "Failure to retrieve room members"},
     },
 )
-async def get_members(org_id: str, room_id: str):
+async def get_members(
+    request: Request,
+    org_id: str,
+    room_id: str,
+    limit: int = None,
+    cursor: str = None,
+    role: Role = None,
+    fields: str = None,
+    include_profile: bool = False,
+):
 
     """Get room members.
-    Returns all members in a room if the room is found in the database
+    Returns the members in a room if the room is found in the database
+    Members are paged by member id when a `limit` or a `cursor` is given,
+    otherwise every member is returned
     Raises HTTP_404_NOT_FOUND if the room is not found
     Raises HTTP_424_FAILED_DEPENDENCY if there is an error retrieving the room members
     Args:
+        request (Request): The request, whose query parameters are kept in
+            the link to the next page
         org_id (str): A unique identifier of an organisation
         room_id (str): A unique identifier of the room
+        limit (int): The number of members per page, at most ROOM_MEMBERS_PAGE_MAX
+        cursor (str): The `next_cursor` returned with the previous page of members
+        role (Role): Only return the members with this role
+        fields (str): Comma separated member fields to return, among `role`,
+            `starred` and `closed`. Defaults to all of them
+        include_profile (bool): Whether to add the `user_name` and `image_url`
+            of every member. Defaults to False
     Returns:
         HTTP_200_OK (Room members retrieved successfully):
 
@@ -415,26 +502,97 @@ async def get_members(org_id: str, room_id: str):
             }
         }
 
+        When paged, the members come with the room's member count and the
+        cursor of the next page:
+
+        {
+            "status": "success",
+            "message": "Room members retrieved",
+            "data": {
+                "members": {
+                    "61696f5ac4133ddaa309dcfe": {
+                        "role": "admin",
+                        "user_name": "mark",
+                        "image_url": "https://..."
+                    },
+                    ...
+                },
+                "member_count": 20000,
+                "next_cursor": "string",
+                "next": "http://.../members?limit=100&role=admin&cursor=string"
+            }
+        }
+
     Raises:
+        HTTPException [400]: Invalid cursor
+        HTTPException [400]: Invalid fields
         HTTPException [404]: Room not found
         HTTPException [424]: Failure to retrieve room members
     """
+    paged = limit is not None or cursor is not None
+    if paged:
+        limit = min(
+            max(limit or settings.ROOM_MEMBERS_PAGE_SIZE, 1),
+            settings.ROOM_MEMBERS_PAGE_MAX,
+        )
+    after = decode_member_cursor(cursor) if cursor else None
+
+    projection = None
+    if fields:
+        projection = [field.strip() for field in fields.split(",") if field.strip()]
+        if not projection or not set(projection) <= set(MEMBER_FLAGS):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid fields"
+            )
+
     room = await get_room(org_id, room_id)
     if not room:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Room not found"
         )
 
-    members = room.get("room_members", {})
-    if not members:
+    page = await get_room_members_page(
+        org_id, room, limit=limit, after=after, role=role.value if role else None
+    )
+    # a room always has members, an empty first page means they could not be read
+    if page is None or (not page[0] and after is None and role is None):
         raise HTTPException(
             status_code=status.HTTP_424_FAILED_DEPENDENCY,
             detail="Failure to retrieve room members",
         )
+
+    members, has_more = page
+    profiles = {}
+    if include_profile:
+        profiles = await org_directory.get_members_by_id(org_id, list(members))
+    for member_id, member in members.items():
+        member = dict(member)
+        if projection is not None:
+            member = {field: member.get(field) for field in projection}
+        if include_profile:
+            profile = profiles.get(member_id, {})
+            member["user_name"] = profile.get("user_name")
+            member["image_url"] = profile.get("image_url")
+        members[member_id] = member
+
+    data = members
+    if paged:
+        next_cursor = encode_member_cursor(list(members)[-1]) if has_more else None
+        data = {
+            "members": members,
+            "member_count": room.get("member_count", len(room["room_members"])),
+            "next_cursor": next_cursor,
+            "next": None,
+        }
+        if next_cursor:
+            data["next"] = str(
+                request.url.include_query_params(limit=limit, cursor=next_cursor)
+            )
+
     return JSONResponse(
         status_code=status.HTTP_200_OK,
         content=ResponseModel.success(
-            data=members,
+            data=data,
             message="Room members retrieved successfully",
         ),
     )
@@ -471,7 +629,7 @@ async def update_room(
     DB = DataStorage(org_id)
 
     # Get room from database
-    room = await get_room(org_id=org_id, room_id=room_id)
+    room = await get_room(org_id=org_id, room_id=room_id, member_ids=[member_id])
     data = request.dict()
 
     # Get the members of the room, if None assign to empty dictionary
@@ -498,12 +656,15 @@ async def update_room(
         settings.ROOM_COLLECTION, document_id=room_id, data=data
     )
 
-    if update_response is None:
+    if not update_response or update_response.get("status_code"):
+        invalidate_room(org_id, room_id)
         raise HTTPException(
         status_code=status.HTTP_424_FAILED_DEPENDENCY,
         detail="unable to update room",
     )
 
+    patch_cached_room(org_id, room_id, data)
+
     return JSONResponse(
             content=ResponseModel.success(data=room, message="room updated"),
             status_code=status.HTTP_200_OK,
@@ -574,14 +735,18 @@ async def get_room_details(org_id: str, room_id: str):
     response_model=ResponseModel,
     status_code=status.HTTP_200_OK,
     responses={
-        404: {"detail": "Room not found"}
+        404: {"detail": "Room not found"},
+        424: {"detail": "Room deletion not saved"},
     },
 )
 async def delete_room(org_id: str, room_id: str):
 
     """Deletes room.
-    Deletes a room if the room is found in the database
+    Deletes a room if the room is found in the database, then deletes its messages
+    in a background job whose progress is read from the deletion endpoint
+    The job is saved before the room is deleted
     Raises HTTP_404_NOT_FOUND if the room is not found
+    Raises HTTP_424_FAILED_DEPENDENCY if the job is not saved or the room not deleted
     Args:
         org_id (str): A unique identifier of an organisation
         room_id (str): A unique identifier of the room
@@ -596,24 +761,116 @@ async def delete_room(org_id: str, room_id: str):
         "message": "success",
         "data": {
             "deleted_count": 1
+        },
+        "job": {
+            "_id": "61e6878165934b58b8e5d1e7",
+            "room_id": "61e59de865934b58b8e5d1c8",
+            "status": "pending",
+            "total_messages": 5400,
+            "deleted_messages": 0,
+            ...
         }
     }
 }
     Raises:
         HTTPException [404]: Room not found
+        HTTPException [424]: Room deletion not saved
+        HTTPException [424]: Room not deleted
     """
+    existing = await get_room(org_id, room_id)
+    if not existing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Room not found"
+        )
+
+    # the job is saved first so that the messages are never left without one
+    job = await room_deletion_jobs.create(
+        org_id, room_id, existing.get("message_count")
+    )
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_424_FAILED_DEPENDENCY,
+            detail="Room deletion not saved",
+        )
 
     room = await remove_room(org_id, room_id)
-    if room["data"]["deleted_count"] == 0:
+    if not room:
+        await room_deletion_jobs.discard(org_id, job)
+        raise HTTPException(
+            status_code=status.HTTP_424_FAILED_DEPENDENCY,
+            detail="Room not deleted",
+        )
+    if not room.get("data", {}).get("deleted_count"):
+        await room_deletion_jobs.discard(org_id, job)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Room not found"
         )
 
-   
+    room_deletion_jobs.start(org_id, room_id)
     return JSONResponse(
         status_code=status.HTTP_200_OK,
         content=ResponseModel.success(
-            data=room,
+            data={**room, "job": job},
             message="Room Deleted successfully",
         ),
+    )
+
+
+@router.get(
+    "/org/{org_id}/rooms/{room_id}/deletion",
+    response_model=ResponseModel,
+    status_code=status.HTTP_200_OK,
+    responses={
+        404: {"detail": "Room deletion not found"},
+        424: {"detail": "Failure to retrieve room deletion"},
+    },
+)
+async def get_room_deletion_progress(org_id: str, room_id: str):
+    """Gets the progress of the deletion of a room's messages.
+
+    A deletion interrupted by a restart or a failure is resumed when its
+    progress is read.
+
+    Args:
+        org_id (str): A unique identifier of an organisation
+        room_id (str): A unique identifier of the deleted room
+
+    Returns:
+        HTTP_200_OK (Room deletion retrieved successfully):
+        {
+            "status": "success",
+            "message": "Room deletion retrieved successfully",
+            "data": {
+                "room_id": "61e59de865934b58b8e5d1c8",
+                "status": "running",
+                "total_messages": 5400,
+                "deleted_messages": 1200,
+                "created_at": "2022-01-18 09:05:32.479911",
+                "updated_at": "2022-01-18 09:05:41.031154",
+                "lease_until": "2022-01-18 09:06:41.031154",
+                "error": null
+            }
+        }
+
+    Raises:
+        HTTPException [404]: Room deletion not found
+        HTTPException [424]: Failure to retrieve room deletion
+    """
+    job = await room_deletion_jobs.progress(org_id, room_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_424_FAILED_DEPENDENCY,
+            detail="Failure to retrieve room deletion",
+        )
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Room deletion not found"
+        )
+
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=ResponseModel.success(
+            data=job,
+            message="Room deletion retrieved successfully",
+        ),
     )    
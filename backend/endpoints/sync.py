@@ -6,6 +6,8 @@ from fastapi.responses import JSONResponse
 from schema.response import ResponseModel
 from schema.room import Role, RoomType
 from utils.db import DataStorage
+from utils.dm_index import member_key
+from utils.member_rooms import member_rooms
 from utils.sidebar import sidebar
 from config.settings import settings
 
@@ -79,6 +81,7 @@ async def dm_install(organisation_id: str = Body(...), user_id: str = Body(...))
         "is_archived": False,
         "org_id": organisation_id,
         "created_by": user_id,
+        "member_key": member_key([user_id]),
     }
 
     channel_res = await DB.write(settings.ROOM_COLLECTION, data=channel)
@@ -97,6 +100,7 @@ async def dm_install(organisation_id: str = Body(...), user_id: str = Body(...))
             detail="Unable to create default DM",
         )
 
+    member_rooms.invalidate(organisation_id, user_id)
     return JSONResponse(
         content="installation successful", status_code=status.HTTP_200_OK
     )
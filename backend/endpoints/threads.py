@@ -1,15 +1,39 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException, status
+from typing import Any
+
+from config.settings import settings
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from fastapi.responses import JSONResponse
 from schema.message import MessageRequest
 from schema.response import ResponseModel
 from schema.thread_response import ThreadResponse
 from utils.centrifugo import Events, centrifugo_client
+from utils.room_utils import get_member_room
 from utils.threads_utils import (add_message_to_thread_list,
                                  get_message_threads, update_message_thread)
 
 router = APIRouter()
 
 
+async def get_thread_room(
+    org_id: str, room_id: str, request: MessageRequest
+) -> dict[str, Any]:
+    """Loads the room a thread message is sent to and checks the sender belongs to it.
+
+    Args:
+        org_id (str): The organization id
+        room_id (str): The room id
+        request (MessageRequest): The thread message request.
+
+    Returns:
+        dict: The room document.
+
+    Raises:
+        HTTPException [404]: Room does not exist or
+        Sender not a member of this room.
+    """
+    return await get_member_room(org_id, room_id, request.sender_id)
+
+
 @router.post(
     "/org/{org_id}/rooms/{room_id}/messages/{message_id}/threads",
     response_model=ThreadResponse,
@@ -20,7 +44,11 @@ router = APIRouter()
     },
 )
 async def send_thread_message(
-    org_id: str, room_id: str, message_id: str, request: MessageRequest
+    org_id: str,
+    room_id: str,
+    message_id: str,
+    request: MessageRequest,
+    room: dict[str, Any] = Depends(get_thread_room),
 ):
     """Adds a thread to a parent message.
 
@@ -32,6 +60,7 @@ async def send_thread_message(
         room_id: A unique identifier of the room.
         message_id: A unique identifier of the message that is being edited.
         request: A pydantic schema that defines the message request parameters.
+        room: The room the thread message is sent to.
 
     Returns:
         A dict containing data about the message that was edited.
@@ -51,7 +80,7 @@ async def send_thread_message(
 
     Raises:
         HTTPException [401]: You are not authorized to edit this message.
-        HTTPException [404]: Message not found.
+        HTTPException [404]: Room, sender or message not found.
         HTTPException [424]: Message not edited.
     """
 
@@ -59,7 +88,7 @@ async def send_thread_message(
         org_id, room_id, message_id, request
     )
 
-    if response is None:
+    if not response or response.get("status_code"):
         raise HTTPException(
             status_code=status.HTTP_424_FAILED_DEPENDENCY,
             detail="Thread message not sent",
@@ -83,57 +112,59 @@ async def send_thread_message(
     "/org/{org_id}/rooms/{room_id}/messages/{message_id}/threads",
     response_model=ResponseModel,
     status_code=status.HTTP_200_OK,
-    responses={424: {"detail": "ZC Core failed"}},
+    responses={
+        400: {"detail": "Invalid cursor"},
+        404: {"detail": "Message not found"},
+        424: {"detail": "ZC Core failed"},
+    },
 )
-async def get_thread_messages(org_id: str, room_id: str, message_id: str):
+async def get_thread_messages(
+    org_id: str,
+    room_id: str,
+    message_id: str,
+    limit: int = None,
+    cursor: str = None,
+):
     """
-    Fetches all the thread_messages under a parent message
+    Fetches the thread_messages under a parent message, newest first
 
     Args:
         org_id (str): A unique identifier of an organization.
         room_id (str): A unique identifier of the room where messages are fetched from.
+        message_id (str): A unique identifier of the parent message.
+        limit (int): The maximum number of replies to return. Defaults to all of them.
+        cursor (str): The `next_cursor` returned with the previous page of replies.
 
     Returns:
-        A dict containing a list of message objects.
+        A dict containing a page of thread messages and their total count.
         {
             "status": "success",
             "message": "Messages retrieved",
-            "data": [
-                {
-                "_id": "61e75bc065934b58b8e5d223",
-                "created_at": "2022-02-02 17:57:02.630439",
-                "edited": true,
-                "emojis": [
+            "data": {
+                "data": [
                     {
-                    "count": 1,
-                    "emoji": "👹",
-                    "name": "frown",
-                    "reactedUsersId": [
-                        "619ba4671a5f54782939d385"
-                    ]
-                    }
+                        "created_at": "2021-09-30T11:23:55.065000Z",
+                        "richUiData": {...},
+                        "thread_id": "b39cfddc-a0a7-11ed-b15b-b8819887ed7a",
+                        "sender_id": "string"
+                    },
+                    ...
                 ],
-                ...
-                },
-                {...},
-                "threads": [
-                {
-                    "created_at": "2021-09-30T11:23:55.065000Z",
-                    "media": [],
-                    "message": "string",
-                    "message_id": "string",
-                    "sender_id": "string"
-                }
-            ],
-                ...
-            ]
+                "reply_count": 42,
+                "next_cursor": "string",
+                "next": "/api/v1/org/.../threads?limit=20&cursor=string"
+            }
         }
 
     Raises:
+        HTTPException [400]: Invalid cursor
+        HTTPException [404]: Message not found
         HTTPException [424]: Zc Core failed
     """
 
-    response = await get_message_threads(org_id, room_id, message_id)
+    response = await get_message_threads(
+        org_id, room_id, message_id, limit=limit, cursor=cursor
+    )
 
     if response is None:
         raise HTTPException(
@@ -141,6 +172,14 @@ async def get_thread_messages(org_id: str, room_id: str, message_id: str):
             detail="Zc Core failed",
         )
 
+    response["next"] = None
+    if response["next_cursor"]:
+        response["next"] = (
+            f"/api/v1/org/{org_id}/rooms/{room_id}/messages/{message_id}/threads"
+            f"?limit={limit or settings.THREAD_PAGE_SIZE}"
+            f"&cursor={response['next_cursor']}"
+        )
+
     return JSONResponse(
         content=ResponseModel.success(data=response, message="Messages retrieved"),
         status_code=status.HTTP_200_OK,
@@ -152,9 +191,9 @@ async def get_thread_messages(org_id: str, room_id: str, message_id: str):
     response_model=ResponseModel,
     status_code=status.HTTP_200_OK,
     responses={
-        401: {"description": "You are not authorized to edit this message"},
-        404: {"description": "Message not found"},
-        424: {"description": "Message not edited"},
+        401: {"description": "You are not authorized to edit this thread message"},
+        404: {"description": "Parent message or thread message not found"},
+        424: {"description": "thread not updated"},
     },
 )
 async def update_thread_message(
@@ -211,7 +250,8 @@ async def update_thread_message(
             }
     Raises:
         HTTPException [401]: You are not authorized to edit this thread message.
-        HTTPException [404]: Message not found.
+        HTTPException [404]: Parent message not found.
+        HTTPException [404]: Thread message not found.
         HTTPException [424]: thread not updated.
     """
 
@@ -221,7 +261,7 @@ async def update_thread_message(
         org_id, room_id, message_id, thread_id, payload
     )
 
-    if not updated_thread_message:
+    if not updated_thread_message or updated_thread_message.get("status_code"):
         raise HTTPException(
             status_code=status.HTTP_424_FAILED_DEPENDENCY, detail="thread not updated"
         )
@@ -1,9 +1,13 @@
 from config.settings import settings
 from endpoints import (detail_file, files, members, messages, rooms, sync,
                        threads)
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.cors import CORSMiddleware
+from utils.http_client import http_client
+from utils.idempotency import IdempotentReplay
+from utils.plugin_resolver import plugin_resolver
 
 app = FastAPI(
     title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json"
@@ -19,6 +23,33 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def startup():
+    """Opens the zc_core connection pool and resolves the plugin id."""
+    await http_client.startup()
+    try:
+        await plugin_resolver.refresh()
+    except Exception as exception:  # pylint: disable=broad-except
+        # DataStorage falls back to resolving the id on first use
+        print("plugin id resolution failed", exception)
+
+
+@app.exception_handler(IdempotentReplay)
+async def replay_response(request: Request, exception: IdempotentReplay):
+    """Answers a retried request with the response of the original request."""
+    return JSONResponse(
+        status_code=exception.status_code,
+        content=exception.content,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Closes the zc_core connection pool."""
+    await http_client.shutdown()
+
+
 app.include_router(
     messages.router, prefix=settings.API_V1_STR, tags=["messages"]
 )  # include urls from message.py
@@ -1,12 +1,10 @@
-import asyncio
-import concurrent.futures
 import inspect
 from datetime import datetime
-from typing import Any, List, Type
+from typing import Any, List, Optional, Type
 
-from fastapi import Form, HTTPException, status
-from pydantic import AnyHttpUrl, BaseModel, Field, Json, root_validator
-from utils.room_utils import get_room
+from config.settings import settings
+from fastapi import Form
+from pydantic import AnyHttpUrl, BaseModel, Field, Json
 
 
 class Emoji(BaseModel):
@@ -20,6 +18,27 @@ class Emoji(BaseModel):
     reactedUsersId: List[str] = []
 
 
+class ReactionRequest(BaseModel):
+    """
+    Provides the request body to react to a message
+    """
+
+    sender_id: str
+    name: str
+    emoji: str
+
+
+class MessageDeleteRequest(BaseModel):
+    """
+    Provides the request body to delete several messages of a room
+    """
+
+    member_id: str
+    message_ids: List[str] = Field(
+        ..., min_items=1, max_items=settings.MESSAGE_DELETE_LIMIT
+    )
+
+
 class MessageRequest(BaseModel):
     """
     Provides a base model for all threads
@@ -89,60 +108,48 @@ class MessageRequest(BaseModel):
     timestamp: int = 0
     created_at: str = str(datetime.utcnow())
 
+
+class MessageUpdateRequest(MessageRequest):
+    """Provides a base model for message edits
+
+    Class inherits from MessageRequest and adds the version
+    of the message being edited, omitted to edit the stored version
+    """
+
+    version: Optional[int] = None
+
+
 class Thread(MessageRequest):
     """Provide structure for the thread schema
 
     Class inherits from MessageRequest to hold
-    data for the thread schema
+    data for the thread schema.
+    The room and sender are validated once per request by the endpoints'
+    dependencies, so building it from stored data never touches zc_core.
     """
 
     room_id: str
     org_id: str
     message_id: str = Field(None, alias="_id")
     edited: bool = False
-
-    @root_validator(pre=True)
-    @classmethod
-    def validates_message(cls, values):
-        """Checks if the room_id and sender_id are valid
-
-        Args:
-            values [dict]: key value pair of sender and room id
-
-        Returns:
-            [dict]: key value pair of all object
-
-        Raises:
-            HTTPException [404]: if room_id or sender_id is invalid
-        """
-
-        sender_id = values.get("sender_id")
-        org_id = values.get("org_id")
-        room_id = values.get("room_id")
-        with concurrent.futures.ThreadPoolExecutor(1) as executor:
-            future = executor.submit(asyncio.run, get_room(org_id, room_id))
-            room = future.result()
-        if not room:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Room does not exist"
-            )
-
-        if sender_id not in set(room["room_members"]):
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Sender not a member of this room",
-            )
-        return values
+    updated_at: Optional[str] = None
 
 
 class Message(Thread):
     """Provides a base model for messages
 
     Message inherits from Thread
-    and adds a field for list of threads
+    and adds a field for list of threads, a summary of them,
+    the message's sequence number in its room
+    and its version, incremented on every edit
     """
 
     threads: List[Thread] = []
+    thread_count: int = 0
+    last_reply_at: Optional[str] = None
+    thread_participants: List[str] = []
+    seq: Optional[int] = None
+    version: int = 0
 
 
 # NOTE: The reason for this is because fastapi does not support
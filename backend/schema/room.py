@@ -77,6 +77,9 @@ class RoomRequest(BaseModel):
     @classmethod
     def validate_dm(cls, values):
         """validates data required for a DM room
+
+        Whether the members already have a DM is checked when the room is created.
+
         Args:
             values [dict]: key value pair of all object data
 
@@ -93,21 +96,6 @@ class RoomRequest(BaseModel):
             room_members = values.get("room_members", {})
             topic = values.get("topic")
             description = values.get("description")
-            org_id = values.get("org_id")
-
-            # runs the asynchronous get_org_rooms in a synchronous thread because
-            # it is used in a synchronous function
-            with concurrent.futures.ThreadPoolExecutor(1) as executor:
-                future = executor.submit(
-                    asyncio.run, get_org_rooms(org_id=org_id, room_type=room_type)
-                )
-                rooms = future.result()
-
-            if rooms is None:  # check if connection is avaliable
-                raise HTTPException(
-                    status_code=status.HTTP_424_FAILED_DEPENDENCY,
-                    detail="unable to read database",
-                )
 
             if room_type == RoomType.GROUP_DM and (
                 len(set(room_members.keys())) > 9 or len(set(room_members.keys())) < 3
@@ -123,17 +111,6 @@ class RoomRequest(BaseModel):
                     detail="DM can only have 2 unique members",
                 )
 
-            if room_type in (RoomType.GROUP_DM, RoomType.DM):
-                for room in rooms:
-                    if set(room["room_members"].keys()) == set(room_members.keys()):
-                        raise HTTPException(
-                            status_code=status.HTTP_200_OK,
-                            detail={
-                                "message": "room already exists",
-                                "room_id": room["_id"],
-                            },
-                        )
-
             if topic is not None:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -205,6 +182,11 @@ class Room(RoomRequest):
     id: str = Field(None, alias="_id")
     org_id: str
     created_by: str
+    message_count: int = 0
+    thread_reply_count: int = 0
+    attachment_count: int = 0
+    last_seq: int = 0
+    member_key: Optional[str] = None
 
     @root_validator(pre=True)
     @classmethod
@@ -0,0 +1,28 @@
+import pytest
+from utils.dm_index import dm_index
+from utils.member_rooms import member_rooms
+from utils.idempotency import idempotency_store
+from utils.message_buffer import message_buffer
+from utils.org_directory import org_directory
+from utils.plugin_resolver import plugin_resolver
+from utils.room_utils import room_cache
+
+
+@pytest.fixture(autouse=True)
+def fixture_reset_process_caches():
+    """Clears the process-wide caches so that every test starts cold."""
+    plugin_resolver.clear()
+    dm_index.clear()
+    member_rooms.clear()
+    idempotency_store.clear()
+    org_directory.clear()
+    room_cache.clear()
+    message_buffer.clear()
+    yield
+    plugin_resolver.clear()
+    dm_index.clear()
+    member_rooms.clear()
+    idempotency_store.clear()
+    org_directory.clear()
+    room_cache.clear()
+    message_buffer.clear()
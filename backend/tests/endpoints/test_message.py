@@ -1,3 +1,4 @@
+import json
 from unittest import mock
 from unittest.mock import AsyncMock
 
@@ -5,6 +6,7 @@ import pytest
 from fastapi.testclient import TestClient
 from main import app
 from utils.db import DataStorage
+from utils.paginator import encode_sync_cursor
 
 client = TestClient(app)
 send_message_test_url = "api/v1/org/619ba4/rooms/123456/messages"
@@ -239,6 +241,121 @@ class TestSendMessage:
         assert response.json() == {"detail": {"Message not sent": write_response}}
 
 
+class TestSendMessageIdempotency:
+    """Groups together unit tests related to retries of the `send_message` endpoint."""
+
+    form = {
+        "sender_id": "61696f",
+        "richUiData": json.dumps(send_message_test_payload["richUiData"]),
+    }
+    headers = {"Idempotency-Key": "3f1c9e0a"}
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_retry_replays_without_calling_any_service(
+        self,
+        mock_data_storage_read,
+        mock_data_storage_write,
+        mock_data_storage_update,
+        mock_centrifugo,
+        mocker,
+    ):
+        """A retried message is answered from the first response.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_write (AsyncMock): Asynchronous external api call
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
+            mock_centrifugo (AsyncMock): Asynchronous external api call
+            mocker (Mock): An object for patching the upload and notifications
+        """
+        upload_files = mocker.patch(
+            "endpoints.messages.upload_files", AsyncMock(return_value=[])
+        )
+        messages_trigger = mocker.patch(
+            "endpoints.messages.notification.messages_trigger", AsyncMock()
+        )
+        mock_data_storage_read.return_value = fake_core_room_data
+        mock_data_storage_write.return_value = {
+            "status": 200,
+            "data": {"insert_count": 1, "object_id": "a1a1a1"},
+        }
+        mock_data_storage_update.return_value = {
+            "status": 200,
+            "data": {"matched_documents": 1},
+        }
+        files = [("attachments", ("notes.txt", b"notes", "text/plain"))]
+
+        first = client.post(
+            send_message_test_url, data=self.form, files=files, headers=self.headers
+        )
+        assert first.status_code == 201
+
+        for mocked in (
+            mock_data_storage_read,
+            mock_data_storage_write,
+            mock_data_storage_update,
+            upload_files,
+            messages_trigger,
+        ):
+            mocked.reset_mock()
+
+        retry = client.post(
+            send_message_test_url, data=self.form, files=files, headers=self.headers
+        )
+        assert retry.status_code == 201
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert retry.json() == first.json()
+        mock_data_storage_read.assert_not_awaited()
+        mock_data_storage_write.assert_not_awaited()
+        mock_data_storage_update.assert_not_awaited()
+        upload_files.assert_not_awaited()
+        messages_trigger.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_stored_message_is_not_sent_again_after_a_failure(
+        self,
+        mock_data_storage_read,
+        mock_data_storage_write,
+        mock_data_storage_update,
+        mocker,
+    ):
+        """A message stored before the request failed is replayed, not rewritten.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_write (AsyncMock): Asynchronous external api call
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
+            mocker (Mock): An object for patching the message buffer
+        """
+        mocker.patch(
+            "endpoints.messages.message_buffer.append", side_effect=RuntimeError
+        )
+        mock_data_storage_read.return_value = fake_core_room_data
+        mock_data_storage_write.return_value = {
+            "status": 200,
+            "data": {"insert_count": 1, "object_id": "a1a1a1"},
+        }
+        mock_data_storage_update.return_value = {
+            "status": 200,
+            "data": {"matched_documents": 1},
+        }
+        failing_client = TestClient(app, raise_server_exceptions=False)
+
+        first = failing_client.post(
+            send_message_test_url, data=self.form, headers=self.headers
+        )
+        assert first.status_code == 500
+
+        retry = failing_client.post(
+            send_message_test_url, data=self.form, headers=self.headers
+        )
+        assert retry.status_code == 201
+        assert retry.json()["data"]["message_id"] == "a1a1a1"
+        mock_data_storage_write.assert_awaited_once()
+
+
 class TestUpdateMessage:
     """Groups together unit tests related to the `update_message` endpoint."""
 
@@ -256,57 +373,61 @@ class TestUpdateMessage:
         """
         db = DataStorage("619ba4")
         db.plugin_id = "34453"
-        mock_data_storage_read.return_value = fake_zc_core_message_data
         mock_data_storage_update.return_value = {
             "status": 200,
             "message": "success",
             "data": {"matched_documents": 1, "modified_documents": 1},
         }
         mock_centrifugo.return_value = {"status_code": 200}
-        response = client.put(update_message_test_url, json=update_message_test_payload)
+        response = client.put(
+            update_message_test_url, json={**update_message_test_payload, "version": 2}
+        )
         assert response.status_code == 200
-        assert response.json() == {
+        mock_data_storage_read.assert_not_called()
+        edited_message = response.json()
+        assert edited_message["data"].pop("updated_at") is not None
+        assert edited_message == {
             "status": "success",
             "message": "Message edited",
             "data": {
                 "_id": "346556",
-                "created_at": "2021-12-28 19:27:13.620083",
                 "edited": True,
-                "emojis": [],
-                "files": [],
                 "org_id": "1234",
-                "richUiData": {
-                    "blocks": [
-                        {
-                            "data": {},
-                            "depth": 0,
-                            "entityRanges": [],
-                            "inlineStyleRanges": [],
-                            "key": "eljik",
-                            "text": "HI,  mark",
-                            "type": "unstyled",
-                        }
-                    ],
-                    "entityMap": {},
-                },
+                "richUiData": update_message_test_payload["richUiData"],
                 "room_id": "343235",
-                "saved_by": [],
                 "sender_id": "619ba4",
-                "threads": [],
                 "timestamp": 0,
+                "version": 3,
             },
         }
 
+        update = mock_data_storage_update.call_args.kwargs
+        assert update["query"] == {
+            "_id": "346556",
+            "room_id": "343235",
+            "sender_id": "619ba4",
+            "version": 2,
+        }
+        assert update["raw_query"]["$inc"] == {"version": 1}
+        assert "version" not in update["raw_query"]["$set"]
+
     @pytest.mark.asyncio
     @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
-    async def test_update_message_empty_message(self, mock_data_storage_read):
+    async def test_update_message_empty_message(
+        self, mock_data_storage_read, mock_data_storage_update
+    ):
         """Update message unsuccessful with an invalid message_id.
 
         Args:
             mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
         """
         db = DataStorage("619ba4")
         db.plugin_id = "34453"
+        mock_data_storage_update.return_value = {
+            "status": 200,
+            "data": {"matched_documents": 0, "modified_documents": 0},
+        }
         mock_data_storage_read.return_value = {}
         response = client.put(update_message_test_url, json=update_message_test_payload)
         assert response.status_code == 404
@@ -314,16 +435,22 @@ class TestUpdateMessage:
 
     @pytest.mark.asyncio
     @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
-    async def test_update_message_wrong_sender_id(self, mock_data_storage_read):
+    async def test_update_message_wrong_sender_id(
+        self, mock_data_storage_read, mock_data_storage_update
+    ):
         """Update message unsuccessful with a wrong sender_id provided.
 
         Args:
             mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
         """
         db = DataStorage("619ba4")
         db.plugin_id = "34453"
-        fake_zc_core_message_data["sender_id"] = "6er34"
-        mock_data_storage_read.return_value = fake_zc_core_message_data
+        mock_data_storage_update.return_value = {
+            "status": 200,
+            "data": {"matched_documents": 0, "modified_documents": 0},
+        }
+        mock_data_storage_read.return_value = {"_id": "346556", "sender_id": "6er34"}
         response = client.put(update_message_test_url, json=update_message_test_payload)
         assert response.status_code == 401
         assert response.json() == {
@@ -332,19 +459,42 @@ class TestUpdateMessage:
 
     @pytest.mark.asyncio
     @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
-    async def test_update_message_check_status_code(
+    async def test_update_message_version_conflict(
         self, mock_data_storage_read, mock_data_storage_update
     ):
-        """Update message unsuccessful when updating to zc core fails.
+        """Update message unsuccessful when the message was edited since it was read.
 
         Args:
             mock_data_storage_read (AsyncMock): Asynchronous external api call
             mock_data_storage_update (AsyncMock): Asynchronous external api call
         """
+        mock_data_storage_update.return_value = {
+            "status": 200,
+            "data": {"matched_documents": 0, "modified_documents": 0},
+        }
+        mock_data_storage_read.return_value = {
+            "_id": "346556",
+            "sender_id": "619ba4",
+            "version": 4,
+        }
+        response = client.put(
+            update_message_test_url, json={**update_message_test_payload, "version": 2}
+        )
+        assert response.status_code == 409
+        assert response.json() == {
+            "detail": {"message": "Message was edited since it was read", "version": 4}
+        }
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_update_message_check_status_code(self, mock_data_storage_update):
+        """Update message unsuccessful when updating to zc core fails.
+
+        Args:
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
+        """
         db = DataStorage("619ba4")
         db.plugin_id = "34453"
-        fake_zc_core_message_data["sender_id"] = "619ba4"
-        mock_data_storage_read.return_value = fake_zc_core_message_data
         mock_data_storage_update.return_value = {
             "status_code": 422,
             "message": "unprocessible error",
@@ -354,3 +504,415 @@ class TestUpdateMessage:
         assert response.json() == {
             "detail": {"message not edited": mock_data_storage_update.return_value}
         }
+
+
+delete_message_test_url = "api/v1/org/619ba4/rooms/123456/messages"
+fake_member_room_data = {
+    **fake_core_room_data,
+    "room_members": {
+        "61696f": {"closed": False, "role": "admin", "starred": False},
+        "e21e10": {"closed": False, "role": "member", "starred": False},
+    },
+}
+delete_success = {"status": 200, "message": "success", "data": {"deleted_count": 1}}
+
+
+class TestDeleteMessages:
+    """Groups together unit tests related to the message delete endpoints."""
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_delete_message_successful(
+        self,
+        mock_data_storage_read,
+        mock_data_storage_delete,
+        mock_data_storage_write,
+        mock_data_storage_update,
+        mock_centrifugo,
+    ):
+        """Delete message successful, leaving a tombstone and updating counters.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_delete (AsyncMock): Asynchronous external api call
+            mock_data_storage_write (AsyncMock): Asynchronous external api call
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
+            mock_centrifugo (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.side_effect = [
+            fake_member_room_data,
+            [{"_id": "346556", "sender_id": "e21e10", "files": [], "thread_count": 2}],
+        ]
+        mock_data_storage_delete.return_value = delete_success
+        mock_data_storage_write.return_value = {"status": 201}
+        mock_data_storage_update.return_value = {"status": 200, "data": {}}
+        response = client.delete(
+            f"{delete_message_test_url}/346556", params={"member_id": "e21e10"}
+        )
+        assert response.status_code == 200
+        assert response.json()["data"] == {"message_id": "346556"}
+
+        tombstones = mock_data_storage_write.call_args.args[1]
+        assert [tombstone["message_id"] for tombstone in tombstones] == ["346556"]
+        counters = mock_data_storage_update.call_args.kwargs["raw_query"]["$inc"]
+        assert counters == {"message_count": -1, "thread_reply_count": -2}
+        mock_centrifugo.assert_awaited_once()
+        assert mock_centrifugo.call_args.args[2] == {
+            "room_id": "123456",
+            "message_ids": ["346556"],
+        }
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_delete_message_not_sender(
+        self, mock_data_storage_read, mock_data_storage_delete
+    ):
+        """Delete message unsuccessful for a member who is neither sender nor admin.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_delete (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.side_effect = [
+            fake_member_room_data,
+            [{"_id": "346556", "sender_id": "61696f"}],
+        ]
+        response = client.delete(
+            f"{delete_message_test_url}/346556", params={"member_id": "e21e10"}
+        )
+        assert response.status_code == 401
+        assert response.json() == {
+            "detail": "You are not authorized to delete this message"
+        }
+        mock_data_storage_delete.assert_not_called()
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_bulk_delete_by_admin_publishes_one_event(
+        self,
+        mock_data_storage_read,
+        mock_data_storage_delete,
+        mock_data_storage_write,
+        mock_data_storage_update,
+        mock_centrifugo,
+    ):
+        """An admin deletes other members' messages, reported per message.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_delete (AsyncMock): Asynchronous external api call
+            mock_data_storage_write (AsyncMock): Asynchronous external api call
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
+            mock_centrifugo (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.side_effect = [
+            fake_member_room_data,
+            [
+                {"_id": "1", "sender_id": "e21e10"},
+                {"_id": "2", "sender_id": "e21e10"},
+                {"_id": "3", "sender_id": "e21e10"},
+            ],
+        ]
+        mock_data_storage_delete.side_effect = [delete_success, None, delete_success]
+        mock_data_storage_write.return_value = {"status": 201}
+        mock_data_storage_update.return_value = {"status": 200, "data": {}}
+        response = client.post(
+            f"{delete_message_test_url}/delete",
+            json={"member_id": "61696f", "message_ids": ["1", "2", "3", "4", "1"]},
+        )
+        assert response.status_code == 200
+        assert response.json()["data"] == {
+            "deleted": ["1", "3"],
+            "not_found": ["4"],
+            "failed": ["2"],
+        }
+        assert mock_data_storage_delete.call_count == 3
+        mock_centrifugo.assert_awaited_once()
+        assert mock_centrifugo.call_args.args[2]["message_ids"] == ["1", "3"]
+
+
+reaction_test_url = f"{update_message_test_url}/reactions"
+reaction_test_payload = {"sender_id": "e21e10", "name": "frown", "emoji": "👹"}
+
+
+class TestReactions:
+    """Groups together unit tests related to the reaction endpoints."""
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_add_reaction_successful(
+        self, mock_data_storage_read, mock_data_storage_update, mock_centrifugo
+    ):
+        """Add reaction successful without rewriting the message.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
+            mock_centrifugo (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.return_value = fake_core_room_data
+        mock_data_storage_update.return_value = {
+            "status": 200,
+            "data": {"matched_documents": 1, "modified_documents": 1},
+        }
+        response = client.post(reaction_test_url, json=reaction_test_payload)
+        assert response.status_code == 200
+        assert response.json()["data"] == reaction_test_payload
+
+        update = mock_data_storage_update.call_args.kwargs
+        assert "payload" not in update and "data" not in update
+        assert update["raw_query"]["$addToSet"] == {
+            "emojis.$.reactedUsersId": {"$each": ["e21e10"]}
+        }
+        mock_centrifugo.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_remove_reaction_message_not_found(
+        self, mock_data_storage_read, mock_data_storage_update, mock_centrifugo
+    ):
+        """Remove reaction unsuccessful when the message does not exist.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
+            mock_centrifugo (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.side_effect = [fake_core_room_data, None]
+        mock_data_storage_update.return_value = {
+            "status": 200,
+            "data": {"matched_documents": 0, "modified_documents": 0},
+        }
+        response = client.delete(
+            f"{reaction_test_url}/frown", params={"sender_id": "e21e10"}
+        )
+        assert response.status_code == 404
+        assert response.json() == {"detail": "Message not found"}
+        mock_centrifugo.assert_not_awaited()
+
+
+get_messages_test_url = "api/v1/org/619ba4/rooms/123456/messages"
+fake_room_messages = [
+    {"_id": f"61e75bc06593{index:04d}", "created_at": f"2022-02-02 17:57:{index:02d}"}
+    for index in range(3, 0, -1)
+]
+
+
+class TestGetMessages:
+    """Groups together unit tests related to the `get_messages` endpoint."""
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_get_messages_cursor_page(self, mock_data_storage_read):
+        """Cursor pages are read with a keyset query and one extra message.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.return_value = fake_room_messages
+        params = {"size": 2, "include_total": False}
+        response = client.get(get_messages_test_url, params=params)
+        data = response.json()["data"]
+        assert response.status_code == 200
+        assert data["data"] == fake_room_messages[:2]
+        assert data["next_cursor"] is not None
+
+        mock_data_storage_read.reset_mock()
+        mock_data_storage_read.return_value = fake_room_messages[2:]
+        params["before"] = data["next_cursor"]
+        response = client.get(get_messages_test_url, params=params)
+        data = response.json()["data"]
+        kwargs = mock_data_storage_read.call_args.kwargs
+        assert mock_data_storage_read.call_count == 1
+        assert kwargs["options"]["limit"] == 3
+        assert "skip" not in kwargs["options"]
+        assert kwargs["raw_query"]["$and"][1]["$or"][1] == {
+            "created_at": fake_room_messages[1]["created_at"],
+            "_id": {"$lt": fake_room_messages[1]["_id"]},
+        }
+        assert data["data"] == fake_room_messages[2:]
+        assert data["total"] is None
+        assert data["next"] is None
+        assert data["previous_cursor"] is not None
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_get_messages_total_from_room_counters(self, mock_data_storage_read):
+        """The total is read from the room's counters, not by counting messages.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+        """
+        room = {
+            **fake_core_room_data,
+            "message_count": 42,
+            "thread_reply_count": 7,
+            "attachment_count": 3,
+        }
+        mock_data_storage_read.side_effect = [fake_room_messages, room]
+        response = client.get(get_messages_test_url, params={"size": 5})
+        assert response.json()["data"]["total"] == 42
+        assert mock_data_storage_read.call_count == 2
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_get_messages_no_total_with_created_at(self, mock_data_storage_read):
+        """The room's total is not returned for a listing narrowed by created_at.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.return_value = fake_room_messages
+        response = client.get(
+            get_messages_test_url, params={"size": 5, "created_at": 3}
+        )
+        assert response.json()["data"]["total"] is None
+        assert mock_data_storage_read.call_count == 1
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_get_messages_first_page_from_buffer(self, mock_data_storage_read):
+        """The first page of a room is only read from zc_core once.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.return_value = fake_room_messages
+        params = {"size": 2, "include_total": False}
+        first = client.get(get_messages_test_url, params=params)
+        second = client.get(get_messages_test_url, params=params)
+        assert mock_data_storage_read.call_count == 1
+        assert second.json() == first.json()
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_get_messages_thread_summaries(self, mock_data_storage_read):
+        """List mode projects out replies and summarizes every thread.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+        """
+        summarized, legacy = fake_room_messages[:2]
+        summarized = {
+            **summarized,
+            "thread_count": 4,
+            "last_reply_at": "2022-02-02 18:00:00",
+            "thread_participants": ["a", "b", "a", "c", "d"],
+        }
+        legacy_replies = [
+            {"sender_id": "e", "created_at": "2022-02-02 18:01:00"},
+            {"sender_id": "f", "created_at": "2022-02-02 17:59:00"},
+        ]
+        mock_data_storage_read.side_effect = [
+            [summarized, legacy],
+            [{"_id": legacy["_id"], "threads": legacy_replies}],
+        ]
+        response = client.get(
+            get_messages_test_url,
+            params={"size": 2, "include_total": False, "include_threads": False},
+        )
+        first_read = mock_data_storage_read.call_args_list[0].kwargs
+        assert first_read["options"]["projection"] == {"threads": 0}
+        assert [
+            message["thread_summary"] for message in response.json()["data"]["data"]
+        ] == [
+            {
+                "reply_count": 4,
+                "last_reply_at": "2022-02-02 18:00:00",
+                "participants": ["a", "b", "c"],
+            },
+            {
+                "reply_count": 2,
+                "last_reply_at": "2022-02-02 18:01:00",
+                "participants": ["e", "f"],
+            },
+        ]
+
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    def test_get_messages_invalid_cursor(self):
+        """Get messages unsuccessful when the cursor cannot be decoded."""
+        response = client.get(get_messages_test_url, params={"before": "not-a-cursor"})
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Invalid cursor"}
+
+
+class TestSyncMessages:
+    """Groups together unit tests related to the `sync_messages` endpoint."""
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_sync_messages_returns_changes_and_tombstones(
+        self, mock_data_storage_read
+    ):
+        """Changed messages and tombstones after the watermark are returned.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+        """
+        edited = {**fake_room_messages[2], "updated_at": "2022-02-02 17:58:00"}
+        tombstone = {"message_id": "61e75bc065930009", "deleted_at": "2022-02-02 17:59"}
+        mock_data_storage_read.side_effect = [[edited], None, [tombstone]]
+        response = client.get(
+            "api/v1/org/619ba4/rooms/123456/sync", params={"since": "2022-02-02 17:57"}
+        )
+        assert response.status_code == 200
+        assert response.json()["data"] == {
+            "messages": [edited],
+            "deleted": [tombstone],
+            "watermark": encode_sync_cursor("2022-02-02 17:59", "61e75bc065930009"),
+            "has_more": False,
+        }
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_sync_messages_truncated_watermark(self, mock_data_storage_read):
+        """A truncated sync stops the watermark at the last change returned.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.side_effect = [[], fake_room_messages[::-1], []]
+        response = client.get(
+            "api/v1/org/619ba4/rooms/123456/sync",
+            params={"since": "2022-02-02 17:57", "size": 2},
+        )
+        data = response.json()["data"]
+        assert data["messages"] == fake_room_messages[::-1][:2]
+        assert data["watermark"] == encode_sync_cursor(
+            fake_room_messages[1]["created_at"], fake_room_messages[1]["_id"]
+        )
+        assert data["has_more"] is True
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_sync_messages_resumes_within_a_timestamp(
+        self, mock_data_storage_read
+    ):
+        """Changes sharing the watermark's time are read past its message id.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+        """
+        changed_at = "2022-02-02 17:58:00"
+        mock_data_storage_read.side_effect = [[], [], []]
+        response = client.get(
+            "api/v1/org/619ba4/rooms/123456/sync",
+            params={"since": encode_sync_cursor(changed_at, "61e75bc065930001")},
+        )
+        assert response.status_code == 200
+        updated, legacy, tombstones = [
+            call.kwargs["raw_query"]["$or"]
+            for call in mock_data_storage_read.call_args_list
+        ]
+        assert updated == [
+            {"updated_at": {"$gt": changed_at}},
+            {"updated_at": changed_at, "_id": {"$gt": "61e75bc065930001"}},
+        ]
+        assert legacy[1] == {
+            "created_at": changed_at,
+            "_id": {"$gt": "61e75bc065930001"},
+        }
+        assert tombstones[1] == {
+            "deleted_at": changed_at,
+            "message_id": {"$gt": "61e75bc065930001"},
+        }
@@ -1,9 +1,11 @@
 from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
 import pytest
 from fastapi.testclient import TestClient
 from main import app
 from utils.db import DataStorage
+from utils.dm_index import member_key
 
 client = TestClient(app)
 
@@ -320,6 +322,80 @@ class TestGetRoomMembers:
         assert response.status_code == 200
         assert response.json() == success_response
 
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_get_room_members_paged(self, mock_data_storage_read):
+        """Tests paging through the admins of a room with a projection.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.return_value = fake_room_data
+
+        response = client.get(
+            url=get_room_members_url,
+            params={"limit": 1, "role": "admin", "fields": "role"},
+        )
+        assert response.status_code == 200
+        page = response.json()["data"]
+        assert page["members"] == {"61696f5ac4133ddaa309dcfe": {"role": "admin"}}
+        assert page["member_count"] == len(fake_room_data["room_members"])
+        next_params = parse_qs(urlsplit(page["next"]).query)
+        assert next_params == {
+            "limit": ["1"],
+            "role": ["admin"],
+            "fields": ["role"],
+            "cursor": [page["next_cursor"]],
+        }
+
+        response = client.get(url=page["next"])
+        assert response.status_code == 200
+        page = response.json()["data"]
+        assert page["members"] == {"6169704bc4133ddaa309dd07": {"role": "admin"}}
+        assert page["next_cursor"] is None
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_get_room_members_with_profiles(self, mock_data_storage_read):
+        """Tests attaching the name and avatar of members from the org directory.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.return_value = fake_room_data
+        org_members = [
+            {
+                "_id": "61696f5ac4133ddaa309dcfe",
+                "user_name": "mark",
+                "image_url": "https://api.zuri.chat/files/profile_image/mark.png",
+            }
+        ]
+
+        with mock.patch.object(
+            DataStorage, "get_all_members", mock.AsyncMock(return_value=org_members)
+        ):
+            response = client.get(
+                url=get_room_members_url,
+                params={"fields": "role", "include_profile": True},
+            )
+
+        assert response.status_code == 200
+        members = response.json()["data"]
+        assert members["61696f5ac4133ddaa309dcfe"] == {
+            "role": "admin",
+            "user_name": "mark",
+            "image_url": "https://api.zuri.chat/files/profile_image/mark.png",
+        }
+        assert members["619baa5c1a5f54782939d386"]["user_name"] is None
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_get_room_members_invalid_fields(self):
+        """Tests when an unknown member field is requested."""
+        response = client.get(url=get_room_members_url, params={"fields": "email"})
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Invalid fields"}
+
     @pytest.mark.asyncio
     @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
     async def test_get_members_room_not_found(self, mock_data_storage_read):
@@ -435,7 +511,9 @@ class TestRemoveRoomMember:
     )
     @pytest.mark.asyncio
     @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
-    async def test_remove_room_member(self, init_mocks, url, status_code, json_response):
+    async def test_remove_room_member(
+        self, init_mocks, url, status_code, json_response
+    ):
         """
         Test 1: Leave room successfully.
         Test 2: Remove member successfully.
@@ -498,7 +576,9 @@ class TestRemoveRoomMember:
 
     @pytest.mark.asyncio
     @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
-    async def test_remove_room_member_from_dm(self, init_fake_room, mock_data_storage_read):
+    async def test_remove_room_member_from_dm(
+        self, init_fake_room, mock_data_storage_read
+    ):
         """
         Member cannot leave a DM room
 
@@ -520,3 +600,207 @@ class TestRemoveRoomMember:
 
         assert response.status_code == 403
         assert response.json() == {"detail": "cannot remove member from DM rooms"}
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_remove_room_member_only_unsets_the_member(self, init_mocks):
+        """
+        Removing a member unsets that member without rewriting the others
+
+        Args:
+            init_mocks (Tuple): Tuple containing Fake room data and Asynchronous external api calls
+        """
+        init_fake_room, mock_data_storage_read, mock_data_storage_update = init_mocks
+        mock_data_storage_read.return_value = init_fake_room
+        mock_data_storage_update.return_value = {
+            "status": 200,
+            "data": {"matched_documents": 1, "modified_documents": 1},
+        }
+
+        response = client.patch(
+            url=f"{remove_room_member_url_base_url}619baa5c1a5f54782939d386"
+        )
+
+        assert response.status_code == 200
+        update = mock_data_storage_update.call_args.kwargs
+        assert update["raw_query"] == {
+            "$inc": {"members_version": 1},
+            "$unset": {"room_members.619baa5c1a5f54782939d386": ""},
+        }
+        assert update["query"] == {
+            "_id": "23dg67l0eba8adb50ca13a24",
+            "members_spilled": {"$ne": True},
+            "room_members.619baa5c1a5f54782939d386": {"$exists": True},
+        }
+
+
+class TestCreateRoom:
+    """Groups together unit tests related to the `create_room` endpoint."""
+
+    create_room_url = (
+        "api/v1/org/619ba4671a5f54782939d384/members/61696f5ac4133ddaa309dcfe/rooms"
+    )
+    dm_payload = {
+        "room_type": "DM",
+        "room_members": {
+            "61696f5ac4133ddaa309dcfe": {"role": "admin"},
+            "6169704bc4133ddaa309dd07": {"role": "member"},
+        },
+    }
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_existing_dm_is_found_by_member_key(
+        self, mock_data_storage_read, mock_data_storage_write
+    ):
+        """A DM between members who already have one is looked up, not created
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_write (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.return_value = [{"_id": "61e59de865934b58b8e5d1c8"}]
+
+        for _ in range(2):
+            response = client.post(self.create_room_url, json=self.dm_payload)
+            assert response.status_code == 200
+            assert response.json() == {
+                "detail": {
+                    "message": "room already exists",
+                    "room_id": "61e59de865934b58b8e5d1c8",
+                }
+            }
+
+        mock_data_storage_read.assert_awaited_once()
+        assert set(mock_data_storage_read.call_args.kwargs["query"]) == {"member_key"}
+        mock_data_storage_write.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_new_dm_is_saved_with_its_member_key(
+        self, mock_data_storage_read, mock_data_storage_write, mocker
+    ):
+        """A new DM stores the key of its members whatever their order
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_write (AsyncMock): Asynchronous external api call
+            mocker (Mock): An object for patching the sidebar publish
+        """
+        mocker.patch("utils.sidebar.sidebar.publish")
+        mock_data_storage_read.return_value = None
+        mock_data_storage_write.return_value = {
+            "status": 200,
+            "data": {"object_id": "61e59de865934b58b8e5d1c8"},
+        }
+
+        response = client.post(self.create_room_url, json=self.dm_payload)
+
+        assert response.status_code == 201
+        saved = mock_data_storage_write.call_args.kwargs["data"]
+        assert saved["member_key"] == member_key(
+            ["6169704bc4133ddaa309dd07", "61696f5ac4133ddaa309dcfe"]
+        )
+
+
+class TestUpdateRoom:
+    """Groups together unit tests related to the `update_room` endpoint."""
+
+    update_room_url = (
+        "api/v1/org/3467sd4671a5f5478df56u911/members/61696f5ac4133ddaa309dcfe/"
+        "rooms/23dg67l0eba8adb50ca13a24"
+    )
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_failed_update_is_not_cached(
+        self, mock_data_storage_read, mock_data_storage_update
+    ):
+        """A zc_core error fails the update and drops the cached room
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.return_value = fake_room_data
+        mock_data_storage_update.return_value = {
+            "status_code": 500,
+            "message": {"status": 500, "message": "error occurred"},
+        }
+
+        response = client.put(self.update_room_url, json={"room_name": "Random"})
+
+        assert response.status_code == 424
+        assert response.json() == {"detail": "unable to update room"}
+
+        client.get(get_room_members_url)
+        # the room is read again instead of served from the cache
+        assert mock_data_storage_read.await_count == 2
+
+
+class TestDeleteRoom:
+    """Groups together unit tests related to the `delete_room` endpoint."""
+
+    delete_room_url = (
+        "api/v1/org/3467sd4671a5f5478df56u911/rooms/23dg67l0eba8adb50ca13a24"
+    )
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_room_is_kept_when_its_job_is_not_saved(
+        self, mock_data_storage_read, mock_data_storage_write, mock_data_storage_delete
+    ):
+        """A room whose deletion job cannot be saved is not deleted
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_write (AsyncMock): Asynchronous external api call
+            mock_data_storage_delete (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.return_value = fake_room_data
+        mock_data_storage_write.return_value = None
+
+        response = client.delete(self.delete_room_url)
+
+        assert response.status_code == 424
+        assert response.json() == {"detail": "Room deletion not saved"}
+        mock_data_storage_delete.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_job_starts_once_the_room_is_deleted(
+        self,
+        mock_data_storage_read,
+        mock_data_storage_write,
+        mock_data_storage_delete,
+        mocker,
+    ):
+        """The job saved before the room is deleted is then started
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_write (AsyncMock): Asynchronous external api call
+            mock_data_storage_delete (AsyncMock): Asynchronous external api call
+            mocker (Mock): An object for patching the job runner
+        """
+        start = mocker.patch("endpoints.rooms.room_deletion_jobs.start")
+        mock_data_storage_read.return_value = {
+            **fake_room_data,
+            "_id": "23dg67l0eba8adb50ca13a24",
+        }
+        mock_data_storage_write.return_value = {
+            "status": 200,
+            "data": {"object_id": "61e6878165934b58b8e5d1e7"},
+        }
+        mock_data_storage_delete.return_value = {
+            "status": 200,
+            "data": {"deleted_count": 1},
+        }
+
+        response = client.delete(self.delete_room_url)
+
+        assert response.status_code == 200
+        assert response.json()["data"]["job"]["_id"] == "61e6878165934b58b8e5d1e7"
+        start.assert_called_once_with(
+            "3467sd4671a5f5478df56u911", "23dg67l0eba8adb50ca13a24"
+        )
@@ -0,0 +1,308 @@
+from unittest import mock
+
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from utils.db import DataStorage
+
+client = TestClient(app)
+send_thread_test_url = "api/v1/org/619ba4/rooms/123456/messages/346556/threads"
+send_thread_test_payload = {
+    "sender_id": "e21e10",
+    "richUiData": {
+        "blocks": [
+            {
+                "key": "eljik",
+                "text": "replying to mark",
+                "type": "unstyled",
+                "depth": 0,
+                "inlineStyleRanges": [],
+                "entityRanges": [],
+                "data": {},
+            }
+        ],
+        "entityMap": {},
+    },
+    "timestamp": 0,
+}
+
+fake_core_room_data = {
+    "_id": "123456",
+    "created_at": "2021-11-24 11:23:11.361210",
+    "created_by": "61696f",
+    "org_id": "619ba4",
+    "room_members": {
+        "61696f": {"closed": False, "role": "admin", "starred": False},
+        "e21e10": {"closed": False, "role": "admin", "starred": False},
+    },
+    "room_name": "random",
+    "room_type": "CHANNEL",
+}
+
+
+class TestSendThreadMessage:
+    """Groups together unit tests related to the `send_thread_message` endpoint."""
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_send_thread_sender_not_in_room(self, mock_data_storage_read):
+        """Send thread message unsuccessful when sender is not part of the room.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.return_value = fake_core_room_data
+        payload = {**send_thread_test_payload, "sender_id": "yur859"}
+        response = client.post(send_thread_test_url, json=payload)
+        assert response.status_code == 404
+        assert response.json() == {"detail": "Sender not a member of this room"}
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_send_thread_room_not_found(self, mock_data_storage_read):
+        """Send thread message unsuccessful when the room does not exist.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.return_value = {}
+        response = client.post(send_thread_test_url, json=send_thread_test_payload)
+        assert response.status_code == 404
+        assert response.json() == {"detail": "Room does not exist"}
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_send_thread_pushes_reply(
+        self, mock_data_storage_read, mock_data_storage_update
+    ):
+        """The reply is pushed in one update, without reading the parent message.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.return_value = fake_core_room_data
+        mock_data_storage_update.return_value = {
+            "status": 200,
+            "data": {"matched_documents": 1, "modified_documents": 1},
+        }
+        response = client.post(send_thread_test_url, json=send_thread_test_payload)
+        assert response.status_code == 201
+        reply = response.json()["data"]
+        assert reply["sender_id"] == "e21e10"
+        assert mock_data_storage_read.call_count == 1
+
+        push = mock_data_storage_update.call_args_list[0].kwargs
+        assert push["query"] == {
+            "_id": "346556",
+            "room_id": "123456",
+            "threads_spilled": {"$ne": True},
+            "thread_count": {"$exists": True, "$lt": 200},
+        }
+        assert push["raw_query"]["$push"]["threads"] == {
+            "$each": [reply],
+            "$position": 0,
+        }
+        assert push["raw_query"]["$push"]["thread_participants"]["$each"] == ["e21e10"]
+        assert push["raw_query"]["$set"]["last_reply_at"] == reply["created_at"]
+        assert push["raw_query"]["$inc"] == {"thread_count": 1}
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_send_thread_parent_not_found(
+        self,
+        mock_data_storage_read,
+        mock_data_storage_update,
+        mock_data_storage_write,
+    ):
+        """Send thread message unsuccessful when the parent message does not exist.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
+            mock_data_storage_write (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.side_effect = [fake_core_room_data, None]
+        mock_data_storage_update.return_value = {
+            "status": 200,
+            "data": {"matched_documents": 0, "modified_documents": 0},
+        }
+        response = client.post(send_thread_test_url, json=send_thread_test_payload)
+        assert response.status_code == 404
+        assert response.json() == {"detail": "Message not found"}
+        mock_data_storage_write.assert_not_called()
+
+
+class TestGetThreadMessages:
+    """Groups together unit tests related to the `get_thread_messages` endpoint."""
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_get_thread_messages_pages_with_slice(self, mock_data_storage_read):
+        """Replies are paged with $slice, counting later pages from the end.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+        """
+        replies = [{"thread_id": str(index)} for index in range(5, 0, -1)]
+        mock_data_storage_read.return_value = {
+            "threads": replies[:2],
+            "thread_count": 5,
+        }
+        response = client.get(send_thread_test_url, params={"limit": 2})
+        data = response.json()["data"]
+        options = mock_data_storage_read.call_args.kwargs["options"]
+        assert options["projection"]["threads"] == {"$slice": [0, 2]}
+        assert data["data"] == replies[:2]
+        assert data["reply_count"] == 5
+
+        mock_data_storage_read.return_value = {
+            "threads": replies[2:4],
+            "thread_count": 6,
+        }
+        response = client.get(
+            send_thread_test_url, params={"limit": 2, "cursor": data["next_cursor"]}
+        )
+        data = response.json()["data"]
+        options = mock_data_storage_read.call_args.kwargs["options"]
+        assert options["projection"]["threads"] == {"$slice": [-3, 2]}
+        assert data["reply_count"] == 6
+        assert data["next_cursor"] is not None
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_get_thread_messages_not_found(self, mock_data_storage_read):
+        """Get thread messages unsuccessful when the parent message does not exist.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_read.return_value = None
+        response = client.get(send_thread_test_url)
+        assert response.status_code == 404
+        assert response.json() == {"detail": "Message not found"}
+
+
+class TestUpdateThreadMessage:
+    """Groups together unit tests related to the `update_thread_message` endpoint."""
+
+    update_thread_test_url = f"{send_thread_test_url}/b39cfd"
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_update_thread_single_write(
+        self, mock_data_storage_read, mock_data_storage_update
+    ):
+        """The reply is edited by one update conditioned on its id and sender.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_update.return_value = {
+            "status": 200,
+            "data": {"matched_documents": 1, "modified_documents": 1},
+        }
+        response = client.put(
+            self.update_thread_test_url, json=send_thread_test_payload
+        )
+        assert response.status_code == 200
+        mock_data_storage_read.assert_not_called()
+
+        update = mock_data_storage_update.call_args.kwargs
+        assert update["query"]["threads"] == {
+            "$elemMatch": {"thread_id": "b39cfd", "sender_id": "e21e10"}
+        }
+        fields = update["raw_query"]["$set"]
+        assert fields["threads.$.edited"] is True
+        assert fields["threads.$.sender_id"] == "e21e10"
+        assert "threads.$.created_at" not in fields
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_update_thread_not_sender(
+        self, mock_data_storage_read, mock_data_storage_update
+    ):
+        """Update thread message unsuccessful when the reply has another sender.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_update.return_value = {
+            "status": 200,
+            "data": {"matched_documents": 0, "modified_documents": 0},
+        }
+        mock_data_storage_read.return_value = {
+            "_id": "346556",
+            "threads": [{"thread_id": "b39cfd", "sender_id": "61696f"}],
+        }
+        response = client.put(
+            self.update_thread_test_url, json=send_thread_test_payload
+        )
+        assert response.status_code == 401
+        assert response.json() == {
+            "detail": "You are not authorized to edit this thread message"
+        }
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_update_thread_reply_not_found(
+        self, mock_data_storage_read, mock_data_storage_update
+    ):
+        """Update thread message unsuccessful when the reply does not exist.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_update.return_value = {
+            "status": 200,
+            "data": {"matched_documents": 0, "modified_documents": 0},
+        }
+        mock_data_storage_read.return_value = {"_id": "346556"}
+        response = client.put(
+            self.update_thread_test_url, json=send_thread_test_payload
+        )
+        assert response.status_code == 404
+        assert response.json() == {"detail": "Thread message not found"}
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_update_thread_zc_core_error(self, mock_data_storage_update):
+        """Update thread message unsuccessful when zc_core answers with an error.
+
+        Args:
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_update.return_value = {
+            "status_code": 500,
+            "message": {"status": 500, "message": "error occurred"},
+        }
+        response = client.put(
+            self.update_thread_test_url, json=send_thread_test_payload
+        )
+        assert response.status_code == 424
+        assert response.json() == {"detail": "thread not updated"}
+
+    @pytest.mark.asyncio
+    @mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+    async def test_update_thread_parent_read_fails(
+        self, mock_data_storage_read, mock_data_storage_update
+    ):
+        """A failed read of the parent is not reported as a missing parent.
+
+        Args:
+            mock_data_storage_read (AsyncMock): Asynchronous external api call
+            mock_data_storage_update (AsyncMock): Asynchronous external api call
+        """
+        mock_data_storage_update.return_value = {
+            "status": 200,
+            "data": {"matched_documents": 0, "modified_documents": 0},
+        }
+        mock_data_storage_read.return_value = {"status_code": 500, "message": "error"}
+        response = client.put(
+            self.update_thread_test_url, json=send_thread_test_payload
+        )
+        assert response.status_code == 424
+        assert response.json() == {"detail": "thread not updated"}
@@ -0,0 +1,60 @@
+from unittest import mock
+from unittest.mock import AsyncMock
+
+import pytest
+from utils.cache import LRUCache
+from utils.db import DataStorage
+from utils.room_utils import get_room, patch_cached_room, room_cache
+
+
+def test_least_recently_used_entry_is_evicted():
+    """The oldest untouched entry is dropped once the cache is full"""
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 1, "misses": 0}
+
+
+def test_expired_entry_is_a_miss():
+    """Entries older than the ttl are not returned"""
+    cache = LRUCache(maxsize=2, ttl=0)
+    cache.set("a", 1)
+
+    assert cache.get("a") is None
+    assert cache.misses == 1
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_get_room_reads_through_the_cache():
+    """A room is read from zc_core once and patched in place by writes"""
+    fake_room = {
+        "_id": "23dg67l0eba8adb50ca13a24",
+        "room_type": "CHANNEL",
+        "room_members": {
+            "61696f5ac4133ddaa309dcfe": {"closed": False, "role": "admin"},
+            "619baa5c1a5f54782939d386": {"closed": False, "role": "member"},
+        },
+        "topic": "General Information",
+    }
+    with mock.patch.object(
+        DataStorage, "read", AsyncMock(return_value=fake_room)
+    ) as mock_read:
+        room = await get_room("3467sd4671a5f5478df56u911", "23dg67l0eba8adb50ca13a24")
+        room["room_members"].clear()  # callers get their own copy
+
+        patch_cached_room(
+            "3467sd4671a5f5478df56u911", "23dg67l0eba8adb50ca13a24", {"topic": "new"}
+        )
+        cached = await get_room("3467sd4671a5f5478df56u911", "23dg67l0eba8adb50ca13a24")
+
+    mock_read.assert_awaited_once()
+    assert cached["topic"] == "new"
+    assert len(cached["room_members"]) == 2
+    assert room_cache.hits == 1
+    assert room_cache.misses == 1
@@ -0,0 +1,76 @@
+import asyncio
+from unittest import mock
+
+import httpx
+import pytest
+from utils.db import DataStorage
+from utils.http_client import HTTPClient, http_client
+
+
+@pytest.mark.asyncio
+async def test_requests_per_host_are_limited():
+    """No more than `max_connections_per_host` requests run at once"""
+    in_flight = 0
+    peak = 0
+
+    async def handler(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json={})
+
+    client = HTTPClient(max_connections_per_host=2)
+    with mock.patch.object(
+        HTTPClient,
+        "_build_client",
+        return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    ):
+        await asyncio.gather(
+            *(client.get("https://zc-core.test/data") for _ in range(6))
+        )
+        await client.shutdown()
+
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_data_storage_read_uses_shared_client():
+    """DataStorage reads go through the shared pooled client"""
+
+    def handler(request):
+        return httpx.Response(200, json={"data": [{"_id": "1234"}]})
+
+    db = DataStorage("619ba4")
+    db.plugin_id = "34453"
+    db.organization_id = "619ba4"
+    db.read_api = "https://zc-core.test/data/read"
+
+    with mock.patch.object(
+        HTTPClient,
+        "_build_client",
+        return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    ):
+        response = await db.read("messages", query={"room_id": "1234"})
+        await http_client.shutdown()
+
+    assert response == [{"_id": "1234"}]
+
+
+@pytest.mark.asyncio
+async def test_client_of_a_previous_loop_is_closed():
+    """A client replaced because the event loop changed is closed"""
+    previous_loop = asyncio.new_event_loop()
+    previous_loop.close()
+    previous = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200))
+    )
+    client = HTTPClient()
+    client._client, client._loop = previous, previous_loop
+
+    assert client.client is not previous
+    await asyncio.sleep(0)
+    assert previous.is_closed
+    await client.shutdown()
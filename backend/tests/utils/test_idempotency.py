@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+from utils.idempotency import IdempotencyStore
+
+key = ("POST", "/api/v1/org/619ba4/rooms/123456/messages", "3f1c9a")
+content = {"status": "success", "message": "new message sent", "data": {}}
+
+
+@pytest.mark.asyncio
+async def test_retry_gets_the_recorded_response():
+    """A completed request is replayed to its retries"""
+    store = IdempotencyStore(maxsize=10, ttl=60)
+    assert await store.begin(key) is None
+    store.complete(key, 201, content)
+
+    assert await store.begin(key) == {"status_code": 201, "content": content}
+
+
+@pytest.mark.asyncio
+async def test_retry_waits_for_the_request_in_flight():
+    """A retry sent before the original request ends gets its response"""
+    store = IdempotencyStore(maxsize=10, ttl=60)
+    assert await store.begin(key) is None
+
+    retry = asyncio.create_task(store.begin(key))
+    await asyncio.sleep(0)
+    assert not retry.done()
+
+    store.complete(key, 201, content)
+    assert await retry == {"status_code": 201, "content": content}
+
+
+@pytest.mark.asyncio
+async def test_failed_request_can_be_retried():
+    """A request released without a response is handled again"""
+    store = IdempotencyStore(maxsize=10, ttl=60)
+    assert await store.begin(key) is None
+
+    retry = asyncio.create_task(store.begin(key))
+    await asyncio.sleep(0)
+    store.release(key)
+
+    assert await retry is None
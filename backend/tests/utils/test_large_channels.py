@@ -0,0 +1,119 @@
+from unittest import mock
+from unittest.mock import AsyncMock
+
+import pytest
+from config.settings import settings
+from utils.db import DataStorage
+from utils.large_channels import spill_members
+from utils.room_utils import get_room, get_room_members_page, update_room_members
+
+org_id = "619ba4671a5f54782939d384"
+room_id = "61e59de865934b58b8e5d1c8"
+admin = {"role": "admin", "starred": False, "closed": False}
+member = {"role": "member", "starred": False, "closed": False}
+update_success = {"status": 200, "data": {"matched_documents": 1}}
+update_missed = {"status": 200, "data": {"matched_documents": 0}}
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_spill_copies_members_before_flipping_the_room():
+    """Members are bulk written, then removed from the room in a guarded update"""
+    room = {"room_members": {"e21e10": admin, "61696f": member}, "members_version": 7}
+    read = AsyncMock(side_effect=[room, None])
+    write = AsyncMock(return_value={"status": 201})
+    update = AsyncMock(return_value=update_success)
+    with mock.patch.object(DataStorage, "read", read), mock.patch.object(
+        DataStorage, "write", write
+    ), mock.patch.object(DataStorage, "update", update):
+        assert await spill_members(org_id, room_id)
+
+    copies = write.call_args.args[1]
+    assert [copy["member_id"] for copy in copies] == ["e21e10", "61696f"]
+    assert write.call_args.kwargs == {"bulk_write": True}
+
+    flip = update.call_args.kwargs
+    assert flip["raw_query"] == {
+        "$set": {"members_spilled": True, "member_count": 2},
+        "$unset": {"room_members": ""},
+    }
+    assert flip["query"]["members_version"] == 7
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_spilled_room_only_holds_the_requested_memberships():
+    """Reading a spilled room returns the member count and the caller's record"""
+    room = {"_id": room_id, "members_spilled": True, "member_count": 20000}
+    read = AsyncMock(side_effect=[room, [{"member_id": "e21e10", **admin}]])
+    with mock.patch.object(DataStorage, "read", read):
+        found = await get_room(org_id, room_id, ["e21e10"])
+
+    assert found["member_count"] == 20000
+    assert found["room_members"] == {"e21e10": admin}
+    assert read.call_args.kwargs["raw_query"] == {
+        "room_id": room_id,
+        "member_id": {"$in": ["e21e10"]},
+    }
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_joining_a_spilled_room_writes_one_membership():
+    """A new member of a spilled room is written and counted"""
+    write = AsyncMock(return_value={"status": 201})
+    update = AsyncMock(side_effect=[update_missed, update_success])
+    with mock.patch.object(DataStorage, "write", write), mock.patch.object(
+        DataStorage, "update", update
+    ):
+        assert await update_room_members(
+            org_id, room_id, {"61696f": member}, spilled=True
+        )
+
+    assert write.call_args.args == (
+        settings.ROOM_MEMBERS_COLLECTION,
+        {"room_id": room_id, "member_id": "61696f", **member},
+    )
+    count = update.call_args.kwargs
+    assert count["raw_query"] == {"$inc": {"member_count": 1}}
+    assert count["query"] == {"_id": room_id}
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_members_of_a_spilled_room_are_read_a_page_at_a_time():
+    """A page reads one membership more than its size to find the next page"""
+    room = {"_id": room_id, "members_spilled": True, "member_count": 20000}
+    memberships = [
+        {"member_id": "61696f", **member},
+        {"member_id": "e21e10", **admin},
+    ]
+    read = AsyncMock(return_value=memberships)
+    with mock.patch.object(DataStorage, "read", read):
+        page = await get_room_members_page(org_id, room, limit=1, after="5f")
+
+    assert page == ({"61696f": member}, True)
+    assert read.call_args.kwargs["raw_query"] == {
+        "room_id": room_id,
+        "member_id": {"$gt": "5f"},
+    }
+    assert read.call_args.kwargs["options"]["limit"] == 2
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_concurrent_join_of_a_spilled_room_is_counted_once():
+    """A membership written by a concurrent join is updated, not counted again"""
+    write = AsyncMock(return_value={"status_code": 409, "message": "duplicate key"})
+    update = AsyncMock(side_effect=[update_missed, update_success])
+    with mock.patch.object(DataStorage, "write", write), mock.patch.object(
+        DataStorage, "update", update
+    ):
+        assert await update_room_members(
+            org_id, room_id, {"61696f": member}, spilled=True
+        )
+
+    write.assert_awaited_once()
+    # no member_count update follows the retried $set
+    assert update.await_count == 2
+    assert update.call_args.kwargs["raw_query"] == {"$set": member}
@@ -0,0 +1,96 @@
+from unittest import mock
+from unittest.mock import AsyncMock
+
+import pytest
+from config.settings import settings
+from utils.db import DataStorage
+from utils.member_rooms import member_rooms
+from utils.room_utils import cache_room, get_member_rooms
+
+org_id = "619ba4671a5f54782939d384"
+member_id = "61696f5ac4133ddaa309dcfe"
+channel = {
+    "_id": "61e59de865934b58b8e5d1c8",
+    "room_type": "CHANNEL",
+    "created_at": "2022-01-18 09:05",
+    "room_members": {member_id: {"role": "admin", "starred": True, "closed": False}},
+}
+dm = {
+    "_id": "61f483d965934b58b8e5d283",
+    "room_type": "DM",
+    "created_at": "2022-01-19 10:15",
+    "room_members": {member_id: {"role": "admin", "starred": False, "closed": False}},
+}
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_member_rooms_are_read_once_then_served_from_the_index():
+    """Listing a member's rooms only reads the rooms that are not cached"""
+    cache_room(org_id, channel)
+    read = AsyncMock(side_effect=[[channel, dm], None, [dm]])
+    with mock.patch.object(DataStorage, "read", read):
+        assert await get_member_rooms(org_id, member_id) == [dm, channel]
+        assert await get_member_rooms(org_id, member_id, starred=True) == [channel]
+        assert await get_member_rooms(org_id, member_id, ("DM", "GROUP_DM")) == [dm]
+
+    scan, _, rooms = [call.kwargs for call in read.call_args_list]
+    assert scan["query"] == {f"room_members.{member_id}": {"$exists": True}}
+    assert rooms["raw_query"] == {"_id": {"$in": [dm["_id"]]}}
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_index_follows_joined_and_left_rooms():
+    """Rooms joined or left after the member was indexed are kept in sync"""
+    with mock.patch.object(
+        DataStorage, "read", AsyncMock(side_effect=[[channel], None])
+    ):
+        await member_rooms.rooms(org_id, member_id)
+
+    member_rooms.add_room(org_id, dm)
+    member_rooms.remove_member(org_id, member_id, channel["_id"])
+
+    assert await member_rooms.rooms(org_id, member_id) == {
+        dm["_id"]: {
+            "room_type": "DM",
+            "role": "admin",
+            "starred": False,
+            "closed": False,
+        }
+    }
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_rooms_read_while_a_room_is_joined_are_not_kept():
+    """A read racing with a joined room is returned but read again next time"""
+
+    async def read_rooms(collection, **kwargs):
+        if collection == "rooms":
+            member_rooms.add_room(org_id, dm)
+            return [channel]
+        return None
+
+    read = AsyncMock(side_effect=read_rooms)
+    with mock.patch.object(DataStorage, "read", read):
+        assert list(await member_rooms.rooms(org_id, member_id)) == [channel["_id"]]
+        assert read.call_count == 2
+        await member_rooms.rooms(org_id, member_id)
+
+    assert read.call_count == 4
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_member_rooms_expire():
+    """The rooms of a member are read again after MEMBER_ROOMS_TTL seconds"""
+    read = AsyncMock(side_effect=[[channel], None, [channel, dm], None])
+    with mock.patch.object(DataStorage, "read", read), mock.patch(
+        "utils.cache.time.monotonic", return_value=0
+    ) as monotonic:
+        assert list(await member_rooms.rooms(org_id, member_id)) == [channel["_id"]]
+        monotonic.return_value = settings.MEMBER_ROOMS_TTL - 1
+        assert list(await member_rooms.rooms(org_id, member_id)) == [channel["_id"]]
+        monotonic.return_value = settings.MEMBER_ROOMS_TTL
+        assert len(await member_rooms.rooms(org_id, member_id)) == 2
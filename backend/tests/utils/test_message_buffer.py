@@ -0,0 +1,81 @@
+from utils.message_buffer import MessageBuffer
+
+
+def fake_message(index: int) -> dict:
+    """Builds a message sent `index` seconds after the first one"""
+    return {
+        "_id": f"61e75bc06593{index:04d}",
+        "created_at": f"2022-02-02 17:57:{index:02d}",
+    }
+
+
+def test_first_page_needs_a_full_or_complete_buffer():
+    """A partial buffer cannot tell if older messages exist"""
+    buffer = MessageBuffer(size=5, max_bytes=10_000)
+    buffer.append("org", "room", fake_message(1))
+    assert buffer.latest("org", "room", 2) is None
+
+    buffer.prime("org", "room", [fake_message(0)], complete=True)
+    assert buffer.latest("org", "room", 2) == (
+        [fake_message(1), fake_message(0)],
+        False,
+    )
+
+    buffer.append("org", "room", fake_message(2))
+    assert buffer.latest("org", "room", 2) == ([fake_message(2), fake_message(1)], True)
+
+
+def test_ring_buffer_keeps_the_latest_messages():
+    """Old messages fall out of a full buffer, which is then no longer complete"""
+    buffer = MessageBuffer(size=3, max_bytes=10_000)
+    buffer.prime("org", "room", [], complete=True)
+    for index in range(5):
+        buffer.append("org", "room", fake_message(index))
+
+    assert buffer.latest("org", "room", 3) is None
+    assert buffer.latest("org", "room", 2) == ([fake_message(4), fake_message(3)], True)
+
+
+def test_edits_and_replies_patch_buffered_messages():
+    """Edits and thread replies are applied to the buffered copy"""
+    buffer = MessageBuffer(size=3, max_bytes=10_000)
+    buffer.prime("org", "room", [{**fake_message(0), "threads": []}], complete=True)
+    buffer.update("org", "room", fake_message(0)["_id"], {"edited": True})
+    buffer.add_thread("org", "room", fake_message(0)["_id"], {"thread_id": "1"})
+    buffer.update_thread(
+        "org", "room", fake_message(0)["_id"], {"thread_id": "1", "edited": True}
+    )
+
+    (message,), _ = buffer.latest("org", "room", 1)
+    assert message["edited"] is True
+    assert message["threads"] == [{"thread_id": "1", "edited": True}]
+
+
+def test_least_recently_active_rooms_are_evicted():
+    """Rooms are dropped oldest activity first once the memory budget is spent"""
+    message_size = len(MessageBuffer._dumps(fake_message(0)))
+    buffer = MessageBuffer(size=3, max_bytes=2 * message_size)
+    buffer.prime("org", "quiet", [fake_message(0)], complete=True)
+    buffer.prime("org", "busy", [fake_message(0)], complete=True)
+    buffer.append("org", "quiet", fake_message(1))
+
+    assert buffer.latest("org", "busy", 1) is None
+    assert buffer.latest("org", "quiet", 1) == ([fake_message(1)], True)
+    assert buffer.nbytes == 2 * message_size
+
+
+def test_reactions_patch_buffered_messages():
+    """Reactions are applied to the buffered copy and empty emojis dropped"""
+    buffer = MessageBuffer(size=5, max_bytes=10_000)
+    buffer.prime("org", "room", [fake_message(1)], complete=True)
+    reaction = {"name": "frown", "emoji": "👹", "added": ["a", "b"], "removed": []}
+    buffer.update_reactions("org", "room", fake_message(1)["_id"], reaction)
+    [message], _ = buffer.latest("org", "room", 5)
+    assert message["emojis"] == [
+        {"name": "frown", "count": 2, "emoji": "👹", "reactedUsersId": ["a", "b"]}
+    ]
+
+    reaction = {"name": "frown", "emoji": None, "added": [], "removed": ["a", "b"]}
+    buffer.update_reactions("org", "room", fake_message(1)["_id"], reaction)
+    [message], _ = buffer.latest("org", "room", 5)
+    assert message["emojis"] == []
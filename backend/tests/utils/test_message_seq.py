@@ -0,0 +1,59 @@
+import asyncio
+from unittest import mock
+from unittest.mock import AsyncMock
+
+import pytest
+from utils.db import DataStorage
+from utils.room_utils import allocate_message_seq
+
+org_id = "3467sd4671a5f5478df56u911"
+room_id = "23dg67l0eba8adb50ca13a24"
+
+
+def compare_and_set(stored_room: dict):
+    """Fakes zc_core conditional updates of the room's last_seq"""
+
+    async def update(*args, raw_query=None, query=None, **kwargs):
+        await asyncio.sleep(0)
+        expected = query["last_seq"]
+        current = stored_room.get("last_seq")
+        if expected != current and not (
+            isinstance(expected, dict) and current in expected["$in"]
+        ):
+            return {"status": 200, "data": {"matched_documents": 0}}
+        stored_room.update(raw_query["$set"])
+        return {"status": 200, "data": {"matched_documents": 1}}
+
+    return update
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_concurrent_sends_get_dense_sequence_numbers():
+    """Concurrent allocations in one process never share or skip a number"""
+    stored_room = {"_id": room_id}
+    read = AsyncMock(return_value={"_id": room_id})
+    with mock.patch.object(DataStorage, "read", read), mock.patch.object(
+        DataStorage, "update", side_effect=compare_and_set(stored_room)
+    ):
+        seqs = await asyncio.gather(
+            *(allocate_message_seq(org_id, room_id) for _ in range(5))
+        )
+
+    assert sorted(seqs) == [1, 2, 3, 4, 5]
+    assert stored_room["last_seq"] == 5
+    assert read.call_count == 1
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_sequence_rereads_room_after_a_conflict():
+    """A number taken by another process is detected and skipped"""
+    stored_room = {"_id": room_id, "last_seq": 7}
+    read = AsyncMock(side_effect=[{"_id": room_id, "last_seq": 3}, dict(stored_room)])
+    with mock.patch.object(DataStorage, "read", read), mock.patch.object(
+        DataStorage, "update", side_effect=compare_and_set(stored_room)
+    ):
+        assert await allocate_message_seq(org_id, room_id) == 8
+
+    assert read.call_count == 2
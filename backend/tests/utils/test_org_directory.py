@@ -0,0 +1,63 @@
+import asyncio
+from unittest import mock
+from unittest.mock import AsyncMock
+
+import pytest
+from utils.db import DataStorage
+from utils.org_directory import OrgDirectory
+
+fake_org_members = [
+    {
+        "_id": "619ba4671a5f54782939d385",
+        "email": "Member@gmail.com",
+        "user_name": "member",
+        "image_url": "",
+    },
+    {
+        "_id": "61696f5ac4133ddaa309dcfe",
+        "email": "admin@gmail.com",
+        "user_name": "admin",
+        "image_url": "",
+    },
+]
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_lookups_share_one_download():
+    """Members are indexed by id, email and username from a single download"""
+    directory = OrgDirectory()
+    with mock.patch.object(
+        DataStorage, "get_all_members", AsyncMock(return_value=fake_org_members)
+    ) as mock_get_all_members:
+        member = await directory.get_member("619ba4", "61696f5ac4133ddaa309dcfe")
+        by_email = await directory.get_member_by_email("619ba4", "member@gmail.com")
+        by_username = await directory.get_member_by_username("619ba4", "admin")
+        missing = await directory.get_member("619ba4", "6169704bc4133ddaa309dd07")
+
+    assert member["user_name"] == "admin"
+    assert by_email["_id"] == "619ba4671a5f54782939d385"
+    assert by_username["_id"] == "61696f5ac4133ddaa309dcfe"
+    assert missing == {}
+    mock_get_all_members.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_stale_directory_is_served_while_revalidating():
+    """A stale directory is returned immediately and refreshed in the background"""
+    directory = OrgDirectory(ttl=0, stale_ttl=60)
+    with mock.patch.object(
+        DataStorage, "get_all_members", AsyncMock(return_value=fake_org_members)
+    ) as mock_get_all_members:
+        await directory.get_members("619ba4")
+        mock_get_all_members.return_value = fake_org_members[:1]
+
+        members = await directory.get_members("619ba4")
+        assert len(members) == 2
+
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert len(await directory.get_members("619ba4")) == 1
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
@@ -0,0 +1,62 @@
+import asyncio
+from unittest import mock
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from config.settings import settings
+from utils.plugin_resolver import PluginResolver
+
+marketplace_response = {
+    "data": {
+        "plugins": [
+            {"template_url": "https://other.zuri.chat", "id": "other"},
+            {"template_url": settings.PLUGIN_KEY, "id": "test"},
+        ]
+    }
+}
+
+
+def test_get_plugin_id_is_cached():
+    """The marketplace is only queried once for repeated lookups"""
+    resolver = PluginResolver()
+    with mock.patch("requests.get") as mock_get:
+        mock_get.return_value.raise_for_status = Mock()
+        mock_get.return_value.json.return_value = marketplace_response
+
+        assert resolver.get_plugin_id() == "test"
+        assert resolver.get_plugin_id() == "test"
+        mock_get.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_stale_plugin_id_is_served_while_refreshing():
+    """A stale id is returned immediately and refreshed in the background"""
+    resolver = PluginResolver(ttl=0)
+    resolver._store("old")  # pylint: disable=protected-access
+
+    with mock.patch.object(
+        PluginResolver, "_fetch", AsyncMock(return_value="new")
+    ) as mock_fetch:
+        assert resolver.get_plugin_id() == "old"
+        assert resolver.get_plugin_id() == "old"
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        mock_fetch.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_refreshes_share_one_request():
+    """Only one refresh runs at a time under concurrent callers"""
+    resolver = PluginResolver()
+
+    async def slow_fetch():
+        await asyncio.sleep(0.01)
+        return resolver._store("test")  # pylint: disable=protected-access
+
+    with mock.patch.object(
+        resolver, "_fetch", Mock(side_effect=slow_fetch)
+    ) as mock_fetch:
+        results = await asyncio.gather(*(resolver.refresh() for _ in range(5)))
+
+    assert results == ["test"] * 5
+    mock_fetch.assert_called_once()
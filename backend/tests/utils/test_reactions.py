@@ -0,0 +1,113 @@
+import asyncio
+from unittest import mock
+from unittest.mock import AsyncMock
+
+import pytest
+from utils.centrifugo import Events, centrifugo_client
+from utils.db import DataStorage
+from utils.message_utils import get_room_changes
+from utils.paginator import encode_sync_cursor
+from utils.reactions import ReactionBatcher, add_reactions
+
+org_id = "3467sd4671a5f5478df56u911"
+room_id = "23dg67l0eba8adb50ca13a24"
+message_id = "61e6878165934b58b8e5d1e0"
+update_success = {"status": 200, "data": {"matched_documents": 1}}
+update_missed = {"status": 200, "data": {"matched_documents": 0}}
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_reactions_within_the_window_are_written_once():
+    """Two members reacting with the same emoji are added in one update"""
+    batcher = ReactionBatcher(window=0)
+    update = AsyncMock(return_value=update_success)
+    publish = AsyncMock()
+    with mock.patch.object(DataStorage, "update", update), mock.patch.object(
+        centrifugo_client, "publish", publish
+    ):
+        await asyncio.gather(
+            batcher.react(org_id, room_id, message_id, "e21e10", "frown", "👹", True),
+            batcher.react(org_id, room_id, message_id, "61696f", "frown", "👹", True),
+        )
+
+    update.assert_awaited_once()
+    raw_query = update.call_args.kwargs["raw_query"]
+    assert raw_query == {
+        "$addToSet": {"emojis.$.reactedUsersId": {"$each": ["e21e10", "61696f"]}},
+        "$inc": {"emojis.$.count": 2},
+        "$set": {"updated_at": mock.ANY},
+    }
+    publish.assert_awaited_once()
+    assert publish.call_args.args[:2] == (room_id, Events.MESSAGE_REACTION)
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_toggled_reaction_only_writes_the_last_choice():
+    """A reaction added then removed within the window is only removed"""
+    batcher = ReactionBatcher(window=0)
+    update = AsyncMock(return_value=update_success)
+    with mock.patch.object(DataStorage, "update", update), mock.patch.object(
+        centrifugo_client, "publish", AsyncMock()
+    ):
+        await asyncio.gather(
+            batcher.react(org_id, room_id, message_id, "e21e10", "frown", "👹", True),
+            batcher.react(org_id, room_id, message_id, "e21e10", "frown", None, False),
+        )
+
+    pull, cleanup = [call.kwargs["raw_query"] for call in update.call_args_list]
+    assert pull["$pull"] == {"emojis.$.reactedUsersId": {"$in": ["e21e10"]}}
+    assert cleanup == {
+        "$pull": {"emojis": {"name": "frown", "count": {"$lte": 0}}},
+        "$set": {"updated_at": mock.ANY},
+    }
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_members_who_already_reacted_are_not_counted_twice():
+    """A batch including a member who already reacted falls back to one update each"""
+    batcher = ReactionBatcher(window=0)
+    update = AsyncMock(
+        side_effect=[update_missed, update_missed, update_success, update_missed]
+    )
+    with mock.patch.object(DataStorage, "update", update), mock.patch.object(
+        centrifugo_client, "publish", AsyncMock()
+    ):
+        await asyncio.gather(
+            batcher.react(org_id, room_id, message_id, "e21e10", "frown", "👹", True),
+            batcher.react(org_id, room_id, message_id, "61696f", "frown", "👹", True),
+        )
+
+    single_adds = [call.kwargs for call in update.call_args_list[2:]]
+    assert [add["raw_query"]["$inc"] for add in single_adds] == [
+        {"emojis.$.count": 1},
+        {"emojis.$.count": 1},
+    ]
+    assert single_adds[0]["query"]["emojis"] == {
+        "$elemMatch": {"name": "frown", "reactedUsersId": {"$ne": "e21e10"}}
+    }
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_reacted_message_is_returned_by_sync():
+    """Reacting to a message moves its updated_at past the client's watermark"""
+    since = "2022-01-18 09:05:32.479911"
+    update = AsyncMock(return_value=update_success)
+    with mock.patch.object(DataStorage, "update", update):
+        await add_reactions(
+            DataStorage(org_id), room_id, message_id, "frown", "👹", ["e21e10"]
+        )
+
+    updated_at = update.call_args.kwargs["raw_query"]["$set"]["updated_at"]
+    assert updated_at > since
+
+    reacted = {"_id": message_id, "created_at": since, "updated_at": updated_at}
+    read = AsyncMock(side_effect=[[reacted], None, None])
+    with mock.patch.object(DataStorage, "read", read):
+        changes = await get_room_changes(org_id, room_id, since, 10)
+
+    assert changes["messages"] == [reacted]
+    assert changes["watermark"] == encode_sync_cursor(updated_at, message_id)
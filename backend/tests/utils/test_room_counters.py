@@ -0,0 +1,84 @@
+from unittest import mock
+from unittest.mock import AsyncMock
+
+import pytest
+from utils.db import DataStorage
+from utils.room_utils import get_room_counters, room_cache, update_room_counters
+
+fake_room = {
+    "_id": "23dg67l0eba8adb50ca13a24",
+    "room_type": "CHANNEL",
+    "room_members": {"61696f5ac4133ddaa309dcfe": {"closed": False, "role": "admin"}},
+}
+org_id = "3467sd4671a5f5478df56u911"
+update_success = {"status": 200, "data": {"matched_documents": 1}}
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_legacy_room_counters_are_backfilled_once():
+    """A room without counters is counted once, then served from the cache"""
+    messages = [
+        {"_id": "1", "files": ["https://a.b/c"], "threads": []},
+        {"_id": "2", "files": [], "threads": [{"files": ["https://a.b/d"]}, {}]},
+    ]
+    replies = [{"files": ["https://a.b/e"]}]
+    read = AsyncMock(side_effect=[dict(fake_room), messages, replies])
+    update = AsyncMock(return_value=update_success)
+    with mock.patch.object(DataStorage, "read", read), mock.patch.object(
+        DataStorage, "update", update
+    ):
+        expected = {"message_count": 2, "thread_reply_count": 3, "attachment_count": 3}
+        assert await get_room_counters(org_id, fake_room["_id"]) == expected
+        assert await get_room_counters(org_id, fake_room["_id"]) == expected
+
+    assert read.call_count == 3
+    zero, add = update.call_args_list
+    assert zero.kwargs["raw_query"] == {"$set": dict.fromkeys(expected, 0)}
+    assert add.kwargs["raw_query"] == {"$inc": expected}
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_backfill_keeps_increments_made_while_counting():
+    """Messages sent while a room is counted are added to the backfilled counts"""
+
+    async def read_messages(collection, **kwargs):
+        if collection == "messages":
+            await update_room_counters(org_id, fake_room["_id"], message_count=1)
+            return [{"_id": "1", "created_at": "2021-12-22 22:38:33.075643"}]
+        return None
+
+    room_cache.set((org_id, fake_room["_id"]), dict(fake_room))
+    read = AsyncMock(side_effect=read_messages)
+    update = AsyncMock(return_value=update_success)
+    with mock.patch.object(DataStorage, "read", read), mock.patch.object(
+        DataStorage, "update", update
+    ):
+        counters = await get_room_counters(org_id, fake_room["_id"])
+
+    assert counters["message_count"] == 2
+    increment = update.call_args_list[1]
+    assert increment.kwargs["raw_query"] == {"$inc": {"message_count": 1}}
+    assert increment.kwargs["query"]["message_count"] == {"$exists": True}
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_counter_increments_patch_the_cached_room():
+    """Increments are sent as $inc and applied to the cached room"""
+    room = {
+        **fake_room,
+        "message_count": 5,
+        "thread_reply_count": 1,
+        "attachment_count": 0,
+    }
+    room_cache.set((org_id, room["_id"]), room)
+    update = AsyncMock(return_value=update_success)
+    with mock.patch.object(DataStorage, "update", update):
+        await update_room_counters(
+            org_id, room["_id"], message_count=1, attachment_count=0
+        )
+
+    assert update.call_args.kwargs["raw_query"] == {"$inc": {"message_count": 1}}
+    assert room_cache.peek((org_id, room["_id"]))["message_count"] == 6
@@ -0,0 +1,124 @@
+from unittest import mock
+from unittest.mock import AsyncMock
+
+import pytest
+from config.settings import settings
+from utils.db import DataStorage
+from utils.room_deletion import COMPLETED, FAILED, RoomDeletionJobs
+
+org_id = "3467sd4671a5f5478df56u911"
+room_id = "23dg67l0eba8adb50ca13a24"
+update_success = {"status": 200, "data": {"matched_documents": 1}}
+update_missed = {"status": 200, "data": {"matched_documents": 0}}
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_job_checkpoints_every_batch_until_no_message_is_left():
+    """Messages are deleted batch by batch, with spilled replies deleted first"""
+    read = AsyncMock(
+        side_effect=[
+            [{"_id": "1", "threads_spilled": True}, {"_id": "2"}],
+            [{"_id": "r1"}],
+            {"_id": "3"},
+            None,
+            None,
+            None,
+            None,
+        ]
+    )
+    update = AsyncMock(return_value=update_success)
+    delete_many = AsyncMock(side_effect=lambda collection, ids, **kwargs: ids)
+    with mock.patch.object(DataStorage, "read", read), mock.patch.object(
+        DataStorage, "update", update
+    ), mock.patch.object(DataStorage, "delete_many", delete_many), mock.patch(
+        "utils.room_deletion.asyncio.sleep", AsyncMock()
+    ):
+        await RoomDeletionJobs()._run(org_id, room_id)
+
+    assert [call.args[:2] for call in delete_many.call_args_list] == [
+        (settings.THREAD_REPLIES_COLLECTION, ["r1"]),
+        (settings.MESSAGE_COLLECTION, ["1", "2"]),
+        (settings.MESSAGE_COLLECTION, ["3"]),
+    ]
+    claim, *checkpoints = [call.kwargs for call in update.call_args_list]
+    assert claim["query"]["status"] == {"$ne": COMPLETED}
+    assert [
+        checkpoint["raw_query"]["$inc"]["deleted_messages"]
+        for checkpoint in checkpoints
+    ] == [2, 1, 0, 0]
+    assert checkpoints[-1]["raw_query"]["$set"]["status"] == COMPLETED
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_job_records_the_messages_deleted_before_a_failure():
+    """A partly deleted batch is counted and the job is marked failed"""
+    read = AsyncMock(return_value=[{"_id": "1"}, {"_id": "2"}])
+    update = AsyncMock(return_value=update_success)
+    with mock.patch.object(DataStorage, "read", read), mock.patch.object(
+        DataStorage, "update", update
+    ), mock.patch.object(DataStorage, "delete_many", AsyncMock(return_value=["1"])):
+        await RoomDeletionJobs()._run(org_id, room_id)
+
+    checkpoint = update.call_args.kwargs["raw_query"]
+    assert checkpoint["$inc"] == {"deleted_messages": 1}
+    assert checkpoint["$set"]["status"] == FAILED
+    assert checkpoint["$set"]["lease_until"] is None
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_job_leased_by_another_process_is_not_run():
+    """Nothing is deleted when the job cannot be claimed"""
+    read = AsyncMock()
+    with mock.patch.object(DataStorage, "read", read), mock.patch.object(
+        DataStorage, "update", AsyncMock(return_value=update_missed)
+    ):
+        await RoomDeletionJobs()._run(org_id, room_id)
+
+    read.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_job_never_idles_past_its_lease():
+    """The pause after a slow batch is capped well below the lease"""
+    read = AsyncMock(side_effect=[{"_id": "1"}, None, None, None, None])
+    sleep = AsyncMock()
+    with mock.patch.object(DataStorage, "read", read), mock.patch.object(
+        DataStorage, "update", AsyncMock(return_value=update_success)
+    ), mock.patch.object(
+        DataStorage, "delete_many", AsyncMock(return_value=["1"])
+    ), mock.patch(
+        "utils.room_deletion.time.monotonic", side_effect=[0, 30, 30, 30]
+    ), mock.patch(
+        "utils.room_deletion.asyncio.sleep", sleep
+    ):
+        await RoomDeletionJobs()._run(org_id, room_id)
+
+    assert all(
+        call.args[0] <= settings.ROOM_DELETION_LEASE / 4
+        for call in sleep.call_args_list
+    )
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_failed_read_does_not_complete_the_job():
+    """A read returning None while messages remain is confirmed before completing"""
+    read = AsyncMock(side_effect=[None, None, [{"_id": "1"}], None, None, None, None])
+    update = AsyncMock(return_value=update_success)
+    delete_many = AsyncMock(side_effect=lambda collection, ids, **kwargs: ids)
+    with mock.patch.object(DataStorage, "read", read), mock.patch.object(
+        DataStorage, "update", update
+    ), mock.patch.object(DataStorage, "delete_many", delete_many), mock.patch(
+        "utils.room_deletion.asyncio.sleep", AsyncMock()
+    ):
+        await RoomDeletionJobs()._run(org_id, room_id)
+
+    delete_many.assert_awaited_once()
+    assert delete_many.call_args.args[1] == ["1"]
+    _, *checkpoints = [call.kwargs["raw_query"] for call in update.call_args_list]
+    statuses = [checkpoint["$set"].get("status") for checkpoint in checkpoints]
+    assert statuses == [None, None, None, COMPLETED]
@@ -0,0 +1,165 @@
+from unittest import mock
+from unittest.mock import AsyncMock
+
+import pytest
+from schema.message import Thread
+from utils.db import DataStorage
+from utils.thread_replies import (
+    get_replies,
+    migrate_oversized_threads,
+    spill_thread,
+    update_reply,
+)
+from utils.threads_utils import add_message_to_thread_list
+
+org_id = "3467sd4671a5f5478df56u911"
+room_id = "23dg67l0eba8adb50ca13a24"
+message_id = "61e6878165934b58b8e5d1e0"
+replies = [
+    {"thread_id": "2", "sender_id": "e21e10", "created_at": "2022-01-18 09:06"},
+    {"thread_id": "1", "sender_id": "61696f", "created_at": "2022-01-18 09:05"},
+]
+update_success = {"status": 200, "data": {"matched_documents": 1}}
+update_missed = {"status": 200, "data": {"matched_documents": 0}}
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_spill_thread_copies_replies_before_flagging_the_parent():
+    """Replies are copied, then moved out of the parent in a guarded update"""
+    parent = {"threads": replies, "thread_count": 2, "updated_at": "2022-01-18 09:06"}
+    read = AsyncMock(side_effect=[parent, None])
+    write = AsyncMock(return_value={"status": 201})
+    update = AsyncMock(return_value=update_success)
+    with mock.patch.object(DataStorage, "read", read), mock.patch.object(
+        DataStorage, "write", write
+    ), mock.patch.object(DataStorage, "update", update):
+        assert await spill_thread(org_id, room_id, message_id)
+
+    copies = write.call_args.args[1]
+    assert [copy["thread_id"] for copy in copies] == ["2", "1"]
+    assert all(copy["parent_id"] == message_id for copy in copies)
+    assert write.call_args.kwargs == {"bulk_write": True}
+
+    flip = update.call_args.kwargs
+    assert flip["raw_query"] == {
+        "$set": {"threads_spilled": True},
+        "$unset": {"threads": ""},
+    }
+    assert flip["query"]["thread_count"] == 2
+    assert flip["query"]["updated_at"] == "2022-01-18 09:06"
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_spill_thread_retries_when_a_reply_lands_meanwhile():
+    """Replies already copied are not written twice when the spill is retried"""
+    newer = {"thread_id": "3", "sender_id": "e21e10", "created_at": "2022-01-18 09:07"}
+    read = AsyncMock(
+        side_effect=[
+            {"threads": replies, "thread_count": 2, "updated_at": "09:06"},
+            None,
+            {"threads": [newer] + replies, "thread_count": 3, "updated_at": "09:07"},
+            [{"thread_id": "2"}, {"thread_id": "1"}],
+        ]
+    )
+    write = AsyncMock(return_value={"status": 201})
+    update = AsyncMock(side_effect=[update_missed, update_success, update_success])
+    with mock.patch.object(DataStorage, "read", read), mock.patch.object(
+        DataStorage, "write", write
+    ), mock.patch.object(DataStorage, "update", update):
+        assert await spill_thread(org_id, room_id, message_id)
+
+    assert [copy["thread_id"] for copy in write.call_args.args[1]] == ["3"]
+    assert update.call_args.kwargs["query"]["thread_count"] == 3
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_later_pages_of_spilled_replies_are_counted_from_the_oldest():
+    """A page with 3 older replies left skips the oldest one and reads two"""
+    read = AsyncMock(return_value=[replies[1], replies[0]])
+    with mock.patch.object(DataStorage, "read", read):
+        assert await get_replies(org_id, room_id, message_id, 2, 3) == replies
+
+    options = read.call_args.kwargs["options"]
+    assert options["skip"] == 1
+    assert options["limit"] == 2
+    assert options["sort"] == {"created_at": 1, "thread_id": 1}
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_migration_stops_when_no_oversized_thread_is_left():
+    """Oversized threads are spilled batch by batch until none is found"""
+    parents = [{"_id": message_id, "room_id": room_id}]
+    read = AsyncMock(side_effect=[parents, None])
+    spill = AsyncMock(return_value=True)
+    with mock.patch.object(DataStorage, "read", read), mock.patch(
+        "utils.thread_replies.spill_thread", spill
+    ):
+        assert await migrate_oversized_threads(org_id) == 1
+
+    spill.assert_awaited_once_with(org_id, room_id, message_id)
+    assert "threads.200" in read.call_args.kwargs["raw_query"]
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_spilled_parent_is_not_counted_when_the_reply_is_not_saved():
+    """A reply that could not be stored leaves the spilled parent untouched"""
+    read = AsyncMock(return_value={"_id": message_id, "threads_spilled": True})
+    update = AsyncMock(return_value=update_missed)
+    write = AsyncMock(return_value={"status_code": 500, "message": "error"})
+    request = Thread(sender_id="e21e10", room_id=room_id, org_id=org_id)
+    with mock.patch.object(DataStorage, "read", read), mock.patch.object(
+        DataStorage, "update", update
+    ), mock.patch.object(DataStorage, "write", write):
+        response, _ = await add_message_to_thread_list(
+            org_id, room_id, message_id, request
+        )
+
+    assert response["status_code"] == 500
+    update.assert_awaited_once()
+    assert update.call_args.kwargs["query"]["threads_spilled"] == {"$ne": True}
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_reply_to_a_spilled_parent_is_stored_once():
+    """The reply is only stored once the parent is known to be spilled"""
+    read = AsyncMock(return_value={"_id": message_id, "threads_spilled": True})
+    update = AsyncMock(side_effect=[update_missed, update_success, update_success])
+    write = AsyncMock(return_value={"status": 200, "data": {"object_id": "3"}})
+    request = Thread(sender_id="e21e10", room_id=room_id, org_id=org_id)
+    with mock.patch.object(DataStorage, "read", read), mock.patch.object(
+        DataStorage, "update", update
+    ), mock.patch.object(DataStorage, "write", write):
+        response, _ = await add_message_to_thread_list(
+            org_id, room_id, message_id, request
+        )
+
+    assert response == update_success
+    write.assert_awaited_once()
+    assert update.call_args_list[1].kwargs["query"]["threads_spilled"] is True
+
+
+@pytest.mark.asyncio
+@mock.patch.object(DataStorage, "__init__", lambda x, y: None)
+async def test_edited_reply_bumps_its_parent():
+    """Editing a spilled reply marks its parent as updated for room syncs"""
+    update = AsyncMock(return_value=update_success)
+    with mock.patch.object(DataStorage, "update", update):
+        await update_reply(
+            org_id,
+            room_id,
+            message_id,
+            "2",
+            "e21e10",
+            {"message": "edited", "updated_at": "2022-01-18 09:07"},
+        )
+
+    parent = update.call_args_list[1].kwargs
+    assert parent["collection_name"] == "messages"
+    assert parent["query"] == {"_id": message_id, "room_id": room_id}
+    assert parent["raw_query"] == {"$set": {"updated_at": "2022-01-18 09:07"}}
@@ -0,0 +1,97 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """A size bounded, least recently used in-process cache.
+
+    Entries can optionally expire `ttl` seconds after they were stored. The cache
+    keeps hit and miss counters so its effectiveness can be reported.
+
+    Attributes:
+        maxsize (int): Maximum number of entries kept before evicting the oldest.
+        ttl (float): Number of seconds an entry stays valid, None to never expire.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that found nothing.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    def _expired(self, expires_at: Optional[float]) -> bool:
+        return expires_at is not None and expires_at <= time.monotonic()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Gets the value stored under `key` and marks it as recently used.
+
+        Args:
+            key (Hashable): The cache key.
+            default (Any): Value returned when the key is missing or expired.
+
+        Returns:
+            Any: The cached value or `default`.
+        """
+        entry = self._entries.get(key)
+        if entry is None or self._expired(entry[0]):
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Gets the value stored under `key` without touching the counters or order."""
+        entry = self._entries.get(key)
+        if entry is None or self._expired(entry[0]):
+            return default
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Stores `value` under `key`, evicting the least recently used entries.
+
+        Args:
+            key (Hashable): The cache key.
+            value (Any): The value to store.
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Removes `key` from the cache and returns its value."""
+        entry = self._entries.pop(key, None)
+        if entry is None or self._expired(entry[0]):
+            return default
+        return entry[1]
+
+    def clear(self) -> None:
+        """Removes every entry and resets the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        """Reports the cache size and its hit and miss counters."""
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and not self._expired(entry[0])
+
+    def __len__(self) -> int:
+        return len(self._entries)
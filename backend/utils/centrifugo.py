@@ -15,6 +15,7 @@ class Events(Enum):
     MESSAGE_CREATE = "message_create"
     MESSAGE_UPDATE = "message_update"
     MESSAGE_DELETE = "message_delete"
+    MESSAGE_REACTION = "message_reaction"
     ROOM_CREATE = "room_create"
     ROOM_UPDATE = "room_update"
     ROOM_DELETE = "room_delete"
@@ -1,8 +1,7 @@
-from config.settings import settings
 from fastapi import HTTPException
 from NovuPy.events import Events
 from NovuPy.subscribers import Subscribers
-from utils.db import DataStorage
+from utils.org_directory import org_directory
 from utils.room_utils import get_room, get_room_members
 
 subscriber = Subscribers()
@@ -32,7 +31,6 @@ class Notification:
         get_tagged_users = message_data.get("richUiData", " ")
         org_id = message_data.get("org_id", "")
         if get_tagged_users:
-            DB = DataStorage(organization_id=org_id)
             # get the text from the message object
             text_message = get_tagged_users["blocks"][0]["text"]
             # from the text in the message text, get the characters without '@'
@@ -46,29 +44,20 @@ class Notification:
                     tagged_user_email = user_msg_tag[str(message)]["data"]["mention"][
                         "link"
                     ]
-                    # get user details from DB
-                    get_room_users = await DB.get_all_members()
-                    if not get_room_users:
-                        raise HTTPException(
-                            status_code=404, detail="Organization doesn't have a member"
-                        )
-                    tagged_user = [
-                        user
-                        for user in get_room_users
-                        if user["email"] == tagged_user_email
-                    ]
-                    tagged_users_list.append(tagged_user[0]["_id"])
-                # use sender ID to fetch sender's data from the DB
+                    # get user details from the org directory
+                    tagged_user = await org_directory.get_member_by_email(
+                        org_id, tagged_user_email
+                    )
+                    if tagged_user:
+                        tagged_users_list.append(tagged_user["_id"])
+                # use sender ID to fetch sender's data from the org directory
                 sender_id = message_data["sender_id"]
-                get_sender_details = await DB.get_all_members()
-                if not get_sender_details:
+                sender_info = await org_directory.get_member(org_id, sender_id)
+                if not sender_info:
                     raise HTTPException(
                         status_code=404, detail="Sender ID doesn't exist"
                     )
-                sender_info = [
-                    user for user in get_sender_details if user["_id"] == sender_id
-                ]
-                sender_name = sender_info[0]["user_name"]
+                sender_name = sender_info["user_name"]
                 payload["senderName"] = sender_name
                 payload["channelName"] = room_name
                 payload["messageBody"] = new_message
@@ -103,18 +92,11 @@ class Notification:
             return HTTPException(
                 status_code=404, detail="Room with supplied ID not found"
             )
-        DB = DataStorage(organization_id=org_id)
-        get_all_members = await DB.get_all_members()
-        if not get_all_members:
-            raise HTTPException(
-                status_code=404, detail="Organization doesn't have a member"
-            )
-        sender_info = [
-            user for user in get_all_members if user["_id"] == sender_id]
+        sender_info = await org_directory.get_member(org_id, sender_id)
         if not sender_info:
             raise HTTPException(
                 status_code=404, detail="User with sender ID not found")
-        sender = sender_info[0]["user_name"]
+        sender = sender_info["user_name"]
         if not sender:
             raise HTTPException(
                 status_code=404, detail="Sender name field is empty")
@@ -153,10 +135,8 @@ class Notification:
         message_data = dict(message_obj)
         org_id = message_data.get("org_id", "")
         room_id = message_data.get("room_id", "")
-        DB = DataStorage(organization_id=org_id)
-        query = {"_id": room_id}
         # get room data
-        get_room_data = await DB.read(settings.ROOM_COLLECTION, query=query)
+        get_room_data = await get_room(org_id, room_id)
         if not get_room_data:
             raise HTTPException(
                 status_code=404, detail="Room with supplied ID not found"
@@ -172,11 +152,7 @@ class Notification:
         get_text_msg = message.split(" ")
         message_text = [text for text in get_text_msg if text.isalnum()]
         text_message = " ".join(message_text)
-        try:
-            room = await get_room(org_id, room_id)
-        except:
-            raise HTTPException(
-                status_code=404, detail="room with ID not found")
+        room = get_room_data
         # create a notfication for the DM user
         if room["room_type"] == "DM":
             dm_notification = await self.dm_message_trigger(
@@ -196,16 +172,12 @@ class Notification:
                     status_code=422, detail="failed to create a DM Novu instance"
                 )
             return "dm notification trigger successful"
-        # fetch sender data from DB
-        room_members = await DB.get_all_members()
-        if not room_members:
+        # fetch sender data from the org directory
+        sender_info = await org_directory.get_member(org_id, sender_id)
+        if not sender_info:
             raise HTTPException(
-                status_code=404, detail="Organization doesn't have a member"
-            )
-
-        get_sender_details = [
-            user for user in room_members if user["_id"] == sender_id]
-        payload["senderName"] = get_sender_details[0]["user_name"]
+                status_code=404, detail="User with sender ID not found")
+        payload["senderName"] = sender_info["user_name"]
         payload["channelName"] = room_name
         payload["messageBody"] = text_message
         get_members = await get_room_members(org_id, room_id)
@@ -1,9 +1,10 @@
-from typing import Any, Optional
+import asyncio
+from typing import Any, Optional, Union
 
-import requests
+import httpx
 from config.settings import settings
-from fastapi import status
-from fastapi.exceptions import HTTPException
+from utils.http_client import http_client
+from utils.plugin_resolver import plugin_resolver
 
 
 class DataStorage:
@@ -11,7 +12,8 @@ class DataStorage:
     data and the database on zc_core.
 
     It uses API endpoints from zc_core to perform CRUD operations on zc_messaging
-    collection data.
+    collection data. Requests are sent through the shared pooled `http_client`
+    so they never block the event loop.
 
     Attributes:
         write_api (str): Zc_core API endpoint for writing (POST) and updating (PUT) data.
@@ -27,8 +29,8 @@ class DataStorage:
     def __init__(self, organization_id: str) -> None:
         """Initializes the data storage instance with zc_messaging plugin id.
 
-        A request is sent to the plugins marketplace API endpoint on zc_core to get
-        the plugin id.
+        The plugin id is taken from the process-wide plugin resolver, so no request
+        is sent to zc_core once the id has been resolved at startup.
 
         Args:
             organization_id: The organization id where the operations are to be performed.
@@ -43,44 +45,23 @@ class DataStorage:
             f"{settings.BASE_URL}/organizations/{organization_id}/members/"
         )
         self.organization_id = organization_id
+        self.plugin_id = plugin_resolver.get_plugin_id()
 
-        try:
-            response = requests.get(url=f"{settings.BASE_URL}/marketplace/plugins")
-            response.raise_for_status()
-        except requests.Timeout as timed_out_error:
-            raise HTTPException(
-                status_code=status.HTTP_408_REQUEST_TIMEOUT,
-                detail=timed_out_error.response,
-            ) from timed_out_error
-        except requests.HTTPError as http_error:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail=http_error.response
-            ) from http_error
-        except requests.ConnectionError as connection_error:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=connection_error.response,
-            ) from connection_error
-        except requests.RequestException as exception:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=exception.response,
-            ) from exception
-        else:
-            plugins = response.json().get("data").get("plugins")
-            plugin = next(
-                item for item in plugins if settings.PLUGIN_KEY in item["template_url"]
-            )
-            self.plugin_id = plugin.get("id")
-
-    async def write(self, collection_name: str, data: dict[str, Any]) -> Any:
+    async def write(
+        self,
+        collection_name: str,
+        data: Union[dict[str, Any], list[dict[str, Any]]],
+        bulk_write: bool = False,
+    ) -> Any:
         """Writes data to zc_messaging collections.
 
         Calls the zc_core write endpoint (POST) and writes `data` to `collection_name`.
 
         Args:
             collection_name (str): The name of the collection where to write `data`.
-            data (dict): The actual data the plugin wants to store.
+            data (dict): The actual data the plugin wants to store, or a list of
+            documents when `bulk_write` is set.
+            bulk_write (bool): Whether `data` is a list of documents to insert at once.
 
         Returns:
             On success, a dict containing the success status and
@@ -107,7 +88,7 @@ class DataStorage:
             }
 
         Raises:
-            RequestException: Unable to connect to zc_core
+            RequestError: Unable to connect to zc_core
         """
 
         body = {
@@ -116,10 +97,12 @@ class DataStorage:
             "collection_name": collection_name,
             "payload": data,
         }
+        if bulk_write:
+            body["bulk_write"] = True
 
         try:
-            response = requests.post(url=self.write_api, json=body)
-        except requests.exceptions.RequestException:
+            response = await http_client.post(url=self.write_api, json=body)
+        except httpx.RequestError:
             return None
         if response.status_code == 201:
             return response.json()
@@ -168,7 +151,7 @@ class DataStorage:
             }
 
         Raises:
-            RequestException: Unable to connect to zc_core
+            RequestError: Unable to connect to zc_core
         """
 
         # to ensure either one of raw_query or data is sent
@@ -186,8 +169,8 @@ class DataStorage:
         }
 
         try:
-            response = requests.put(url=self.write_api, json=body)
-        except requests.exceptions.RequestException:
+            response = await http_client.put(url=self.write_api, json=body)
+        except httpx.RequestError:
             return None
         if response.status_code == 200:
             return response.json()
@@ -239,7 +222,7 @@ class DataStorage:
             }
 
         Raises:
-            RequestException: Unable to connect to zc_core
+            RequestError: Unable to connect to zc_core
         """
 
         body = {
@@ -253,12 +236,12 @@ class DataStorage:
         }
 
         try:
-            response = requests.post(url=self.read_api, json=body)
-        except requests.exceptions.RequestException:
+            response = await http_client.post(url=self.read_api, json=body)
+        except httpx.RequestError:
             return None
         if response.status_code == 200:
             return response.json().get("data")
-        return {"status_code": response.status_code, "message": response.reason}
+        return {"status_code": response.status_code, "message": response.reason_phrase}
 
     async def delete(self, collection_name: str, document_id: str) -> Any:
         """Delete data from zc_messaging collections.
@@ -292,7 +275,7 @@ class DataStorage:
             }
 
         Raises:
-            RequestException: Unable to connect to zc_core
+            RequestError: Unable to connect to zc_core
         """
 
         body = {
@@ -303,12 +286,47 @@ class DataStorage:
         }
 
         try:
-            response = requests.post(url=self.delete_api, json=body)
-        except requests.exceptions.RequestException:
+            response = await http_client.post(url=self.delete_api, json=body)
+        except httpx.RequestError:
             return None
         if response.status_code == 200:
             return response.json()
-        return {"status_code": response.status_code, "message": response.reason}
+        return {"status_code": response.status_code, "message": response.reason_phrase}
+
+    async def delete_many(
+        self,
+        collection_name: str,
+        document_ids: list[str],
+        chunk_size: int = settings.DELETE_CHUNK_SIZE,
+    ) -> list[str]:
+        """Deletes several documents from zc_messaging collections.
+
+        zc_core deletes one document per call, so the documents are deleted
+        `chunk_size` at a time, concurrently within a chunk.
+
+        Args:
+            collection_name (str): The name of the collection where to delete the documents.
+            document_ids (list[str]): The ids of the documents to be deleted.
+            chunk_size (int): The number of concurrent delete calls.
+
+        Returns:
+            list[str]: The ids of the documents that were deleted.
+        """
+
+        deleted = []
+        for start in range(0, len(document_ids), chunk_size):
+            chunk = document_ids[start : start + chunk_size]
+            responses = await asyncio.gather(
+                *(self.delete(collection_name, document_id) for document_id in chunk)
+            )
+            deleted += [
+                document_id
+                for document_id, response in zip(chunk, responses)
+                if response
+                and "status_code" not in response
+                and response.get("data", {}).get("deleted_count")
+            ]
+        return deleted
 
     async def get_all_members(self) -> Optional[list[dict[str, Any]]]:
         """Gets a list of all members registered in an organisation.
@@ -348,13 +366,13 @@ class DataStorage:
             }
 
         Raises:
-            RequestException: Unable to connect to zc_core
+            RequestError: Unable to connect to zc_core
         """
 
         url = self.get_members_api.format(org_id=self.organization_id)
         try:
-            response = requests.get(url=url)
-        except requests.exceptions.RequestException:
+            response = await http_client.get(url=url)
+        except httpx.RequestError:
             return []
         if response.status_code == 200:
             return response.json().get("data")
@@ -386,5 +404,7 @@ class DataStorage:
         """
 
         if members:
-            for member in members:
-                return member if member["_id"] == member_id else {}
+            return next(
+                (member for member in members if member["_id"] == member_id), {}
+            )
+        return {}
@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import sys
+from typing import Iterable, Optional
+
+from config.settings import settings
+from fastapi import HTTPException, status
+from utils.cache import LRUCache
+from utils.db import DataStorage
+from utils.http_client import http_client
+
+# DM and group DM rooms carry a `member_key`, a hash of their sorted member ids,
+# so the room of a set of members is found with one lookup instead of comparing
+# the members of every DM of the organization. The room collection needs an
+# index on `member_key`. Rooms created before the key existed are keyed with
+# `python -m utils.dm_index <org_id> [<org_id> ...]`.
+
+DM_TYPES = ("DM", "GROUP_DM")
+
+
+def member_key(member_ids: Iterable[str]) -> str:
+    """Gets the key of a set of members, whatever their order.
+
+    Args:
+        member_ids (Iterable[str]): The ids of the members.
+
+    Returns:
+        str: The hex digest of the sorted, deduplicated member ids.
+    """
+    members = ",".join(sorted(set(map(str, member_ids))))
+    return hashlib.sha256(members.encode()).hexdigest()
+
+
+class DMIndex:
+    """Maps the member keys of DM rooms to the ids of the rooms.
+
+    Lookups are answered from memory, and a missed lookup reads the one room
+    holding the key from zc_core.
+
+    Attributes:
+        maxsize (int): Maximum number of member keys kept.
+    """
+
+    def __init__(self, maxsize: int = settings.DM_INDEX_SIZE) -> None:
+        self._rooms = LRUCache(maxsize=maxsize)
+
+    async def find(self, org_id: str, key: str) -> Optional[str]:
+        """Gets the id of the DM room of a set of members.
+
+        Args:
+            org_id (str): The organization id.
+            key (str): The member key of the room.
+
+        Returns:
+            str: The room id, None if the members have no room.
+
+        Raises:
+            HTTPException [424]: unable to read database
+        """
+        room_id = self._rooms.get((org_id, key))
+        if room_id is not None:
+            return room_id
+
+        response = await DataStorage(org_id).read(
+            settings.ROOM_COLLECTION,
+            query={"member_key": key},
+            options={"limit": 1, "projection": {"_id": 1}},
+        )
+        if response is not None and "status_code" in response:
+            raise HTTPException(
+                status_code=status.HTTP_424_FAILED_DEPENDENCY,
+                detail="unable to read database",
+            )
+        if isinstance(response, list):
+            response = response[0] if response else None
+        if not response:
+            return None
+
+        self.add(org_id, key, response["_id"])
+        return response["_id"]
+
+    def add(self, org_id: str, key: str, room_id: str) -> None:
+        """Records the DM room of a set of members."""
+        self._rooms.set((org_id, key), room_id)
+
+    def remove(self, org_id: str, key: str) -> None:
+        """Forgets the DM room of a set of members."""
+        self._rooms.pop((org_id, key))
+
+    def clear(self) -> None:
+        """Forgets every DM room."""
+        self._rooms.clear()
+
+
+# An instance of DMIndex
+# This will be used when importing the class
+dm_index = DMIndex()
+
+
+async def backfill_member_keys(
+    org_id: str, batch_size: int = settings.DM_INDEX_BACKFILL_BATCH_SIZE
+) -> int:
+    """Stores the member key of every DM room of an organization missing it.
+
+    Keyed rooms no longer match the scan, so the job can be interrupted and
+    run again. It stops once a whole batch of rooms failed to update.
+
+    Args:
+        org_id (str): The organization id.
+        batch_size (int): Number of rooms updated concurrently.
+
+    Returns:
+        int: The number of rooms keyed.
+    """
+    DB = DataStorage(org_id)
+    keyed = 0
+    while True:
+        rooms = await DB.read(
+            settings.ROOM_COLLECTION,
+            raw_query={
+                "room_type": {"$in": list(DM_TYPES)},
+                "member_key": {"$exists": False},
+            },
+            options={"limit": batch_size, "projection": {"_id": 1, "room_members": 1}},
+        )
+        if not rooms or "status_code" in rooms:
+            return keyed
+        if isinstance(rooms, dict):
+            rooms = [rooms]
+
+        responses = await asyncio.gather(
+            *(
+                DB.update(
+                    settings.ROOM_COLLECTION,
+                    document_id=room["_id"],
+                    data={"member_key": member_key(room.get("room_members", {}))},
+                )
+                for room in rooms
+            )
+        )
+        updated = sum(
+            1 for response in responses if response and not response.get("status_code")
+        )
+        if not updated:
+            return keyed
+        keyed += updated
+
+
+async def main(org_ids: list[str]) -> None:
+    """Runs the member key backfill for the given organizations."""
+    try:
+        for org_id in org_ids:
+            keyed = await backfill_member_keys(org_id)
+            print(f"{org_id}: {keyed} rooms keyed")
+    finally:
+        await http_client.shutdown()
+
+
+if __name__ == "__main__":
+    # python -m utils.dm_index <org_id> [<org_id> ...]
+    asyncio.run(main(sys.argv[1:]))
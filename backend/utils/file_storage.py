@@ -1,7 +1,8 @@
 
 import requests
 from config.settings import settings
-from fastapi import UploadFile
+from fastapi import HTTPException, UploadFile
+from utils.plugin_resolver import plugin_resolver
 
 
 class FileStorage:
@@ -13,14 +14,7 @@ class FileStorage:
 
     def __init__(self, organization_id: str) -> None:
         try:
-            response = requests.get(
-                url=f"{settings.BASE_URL}/marketplace/plugins")
-            plugins = response.json().get("data").get("plugins")
-            plugin = next(
-                item for item in plugins if settings.PLUGIN_KEY
-                in item["template_url"]
-            )
-            self.plugin_id = plugin["id"] if plugin else None
+            self.plugin_id = plugin_resolver.get_plugin_id()
             self.upload_api = f"{settings.BASE_URL}/upload/file/" + \
                 self.plugin_id
             self.upload_multiple_api = (
@@ -31,7 +25,7 @@ class FileStorage:
             )
             self.organization_id = organization_id
 
-        except requests.exceptions.RequestException as exception:
+        except HTTPException as exception:
             print(exception)
 
     async def files_upload(
@@ -0,0 +1,130 @@
+import asyncio
+from typing import Any, Optional
+
+import httpx
+from config.settings import settings
+
+
+class HTTPClient:
+    """Shared asynchronous HTTP client used to talk to zc_core.
+
+    Wraps a single pooled `httpx.AsyncClient` whose lifetime follows the
+    application's lifespan. Connections are kept alive between requests and the
+    number of concurrent connections to any one host is capped.
+
+    Attributes:
+        max_connections_per_host (int): Maximum number of in-flight requests per host.
+    """
+
+    def __init__(
+        self, max_connections_per_host: int = settings.HTTP_MAX_CONNECTIONS_PER_HOST
+    ) -> None:
+        self.max_connections_per_host = max_connections_per_host
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._host_limits: dict[str, asyncio.Semaphore] = {}
+        self._closing: set[asyncio.Future] = set()
+
+    @staticmethod
+    def _build_client() -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                settings.HTTP_READ_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The pooled client bound to the running event loop.
+
+        The client is created lazily when the application did not start it,
+        e.g. in scripts or tests running on their own event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            if self._client is not None and not self._client.is_closed:
+                self._close_later(self._client, self._loop)
+            self._client = self._build_client()
+            self._loop = loop
+            self._host_limits = {}
+        return self._client
+
+    def _close_later(
+        self, client: httpx.AsyncClient, loop: Optional[asyncio.AbstractEventLoop]
+    ) -> None:
+        """Closes a client left behind by another event loop, without waiting.
+
+        The client is closed on its own loop while that loop still runs, and on
+        the running loop otherwise.
+        """
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            return
+
+        async def close() -> None:
+            try:
+                await client.aclose()
+            except Exception:  # pylint: disable=broad-except
+                # its connections may belong to a loop that is already closed
+                pass
+
+        task = asyncio.get_running_loop().create_task(close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = httpx.URL(url).host
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return self._host_limits[host]
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Sends a request through the shared connection pool.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The absolute url of the request.
+            **kwargs: Extra arguments forwarded to `httpx.AsyncClient.request`.
+
+        Returns:
+            httpx.Response: The response returned by the server.
+
+        Raises:
+            httpx.RequestError: Unable to connect to the server
+        """
+        client = self.client
+        async with self._host_limit(url):
+            return await client.request(method, url, **kwargs)
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        """Sends a GET request through the shared connection pool."""
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        """Sends a POST request through the shared connection pool."""
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs: Any) -> httpx.Response:
+        """Sends a PUT request through the shared connection pool."""
+        return await self.request("PUT", url, **kwargs)
+
+    async def startup(self) -> None:
+        """Opens the connection pool on application startup."""
+        _ = self.client
+
+    async def shutdown(self) -> None:
+        """Closes the connection pool on application shutdown."""
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+        self._host_limits = {}
+
+
+# An instance of HTTPClient
+# This will be used when importing the class
+http_client = HTTPClient()
@@ -0,0 +1,131 @@
+import asyncio
+from typing import Any, AsyncIterator, Hashable, Optional
+
+from config.settings import settings
+from fastapi import Header, Request
+from utils.cache import LRUCache
+
+
+class IdempotentReplay(Exception):
+    """Raised to answer a retried request with the response of the original one.
+
+    Attributes:
+        status_code (int): The status code of the original response.
+        content (dict): The body of the original response.
+    """
+
+    def __init__(self, status_code: int, content: dict[str, Any]) -> None:
+        super().__init__(status_code)
+        self.status_code = status_code
+        self.content = content
+
+
+class IdempotencyStore:
+    """Remembers the responses of requests sent with an `Idempotency-Key` header.
+
+    A request is recorded as in flight when it starts, and its response is kept
+    for `ttl` seconds once it succeeds. A retry of a completed request gets the
+    recorded response, and a retry sent while the original request is still in
+    flight waits for it. Failed requests are forgotten so they can be retried.
+
+    Attributes:
+        maxsize (int): Maximum number of requests remembered.
+        ttl (float): Seconds a response is remembered for.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = settings.IDEMPOTENCY_CACHE_SIZE,
+        ttl: float = settings.IDEMPOTENCY_TTL,
+    ) -> None:
+        self._responses = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    async def begin(self, key: Hashable) -> Optional[dict[str, Any]]:
+        """Gets the response of a request already sent with the same key.
+
+        When the key is new, the request is recorded as in flight.
+
+        Args:
+            key (Hashable): The idempotency key, scoped to the request's route.
+
+        Returns:
+            dict: The `status_code` and `content` of the original response, None
+            if the request must be handled.
+        """
+        entry = self._responses.get(key)
+        while isinstance(entry, asyncio.Future):
+            await asyncio.shield(entry)
+            entry = self._responses.get(key)
+        if entry is not None:
+            return entry
+
+        self._responses.set(key, asyncio.get_running_loop().create_future())
+        return None
+
+    def complete(
+        self, key: Optional[Hashable], status_code: int, content: dict[str, Any]
+    ) -> None:
+        """Records the response of a request, nothing happens without a key.
+
+        Args:
+            key (Hashable, optional): The idempotency key of the request.
+            status_code (int): The status code of the response.
+            content (dict): The body of the response.
+        """
+        if key is None:
+            return
+        pending = self._responses.peek(key)
+        self._responses.set(key, {"status_code": status_code, "content": content})
+        if isinstance(pending, asyncio.Future) and not pending.done():
+            pending.set_result(None)
+
+    def release(self, key: Hashable) -> None:
+        """Forgets a request that ended without a recorded response."""
+        pending = self._responses.peek(key)
+        if isinstance(pending, asyncio.Future):
+            self._responses.pop(key)
+            if not pending.done():
+                pending.set_result(None)
+
+    def clear(self) -> None:
+        """Forgets every request."""
+        self._responses.clear()
+
+
+# An instance of IdempotencyStore
+# This will be used when importing the class
+idempotency_store = IdempotencyStore()
+
+
+async def idempotency_key(
+    request: Request, idempotency_key: Optional[str] = Header(None)
+) -> AsyncIterator[Optional[Hashable]]:
+    """Replays the response of a request retried with the same `Idempotency-Key`.
+
+    Declare it before the endpoint's other dependencies, so a replayed request
+    does not call any other service.
+
+    Args:
+        request (Request): The incoming request.
+        idempotency_key (str, optional): The key sent by the client.
+
+    Yields:
+        Hashable: The key to record the response under with
+        `idempotency_store.complete`, None when the client sent no key.
+
+    Raises:
+        IdempotentReplay: The request was already handled.
+    """
+    if not idempotency_key:
+        yield None
+        return
+
+    key = (request.method, request.url.path, idempotency_key)
+    response = await idempotency_store.begin(key)
+    if response is not None:
+        raise IdempotentReplay(**response)
+
+    try:
+        yield key
+    finally:
+        idempotency_store.release(key)
@@ -0,0 +1,169 @@
+import asyncio
+import sys
+from typing import Any
+
+from config.settings import settings
+from utils.db import DataStorage
+from utils.http_client import http_client
+from utils.room_members import MEMBER_FIELDS, get_all_memberships, save_memberships
+from utils.room_utils import invalidate_room
+
+
+async def copy_members(
+    org_id: str, room_id: str, members: dict[str, dict[str, Any]]
+) -> bool:
+    """Copies the embedded members of a room to the room members collection.
+
+    Members are written in one bulk write. Members copied by an earlier attempt
+    are only written again if their flags changed since, and members who left
+    the room since are deleted.
+
+    Returns:
+        bool: False if zc_core failed.
+    """
+    copied = await get_all_memberships(org_id, room_id)
+    if copied is None:
+        return False
+
+    flags = {
+        member_id: {field: member.get(field) for field in MEMBER_FIELDS}
+        for member_id, member in members.items()
+    }
+    missing = [
+        {"room_id": room_id, "member_id": member_id, **member}
+        for member_id, member in flags.items()
+        if member_id not in copied
+    ]
+    if missing:
+        response = await DataStorage(org_id).write(
+            settings.ROOM_MEMBERS_COLLECTION, missing, bulk_write=True
+        )
+        if not response or response.get("status_code"):
+            return False
+
+    changes = {
+        member_id: member
+        for member_id, member in flags.items()
+        if member_id in copied and copied[member_id] != member
+    }
+    changes.update({member_id: None for member_id in copied if member_id not in flags})
+    if not changes:
+        return True
+    return await save_memberships(org_id, room_id, changes) is not None
+
+
+async def spill_members(org_id: str, room_id: str) -> bool:
+    """Moves the members of a channel to the room members collection.
+
+    The members are copied first, then removed from the room in an update
+    guarded by the room's `members_version`, so the room is only flipped if no
+    member changed while they were copied. The spill is retried otherwise.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The id of the channel.
+
+    Returns:
+        bool: Whether the members are spilled.
+    """
+    DB = DataStorage(org_id)
+    for _ in range(settings.ROOM_MEMBERS_SPILL_RETRIES):
+        room = await DB.read(
+            settings.ROOM_COLLECTION,
+            query={"_id": room_id},
+            options={
+                "projection": {
+                    "room_members": 1,
+                    "members_spilled": 1,
+                    "members_version": 1,
+                }
+            },
+        )
+        if not room or "status_code" in room:
+            return False
+        if room.get("members_spilled"):
+            return True
+
+        members = room.get("room_members") or {}
+        if not await copy_members(org_id, room_id, members):
+            return False
+
+        response = await DB.update(
+            collection_name=settings.ROOM_COLLECTION,
+            raw_query={
+                "$set": {"members_spilled": True, "member_count": len(members)},
+                "$unset": {"room_members": ""},
+            },
+            query={
+                "_id": room_id,
+                "members_spilled": {"$ne": True},
+                "members_version": room.get("members_version"),
+            },
+        )
+        if not response or response.get("status_code"):
+            return False
+        if response.get("data", {}).get("matched_documents"):
+            invalidate_room(org_id, room_id)
+            return True
+        # a member joined, left or changed after the room was read
+
+    return False
+
+
+async def migrate_large_channels(
+    org_id: str, batch_size: int = settings.ROOM_MEMBERS_MIGRATION_BATCH_SIZE
+) -> int:
+    """Spills the members of every channel of an organization above the threshold.
+
+    Spilled channels no longer match the scan, so the job can be interrupted
+    and run again. It stops once a whole batch of channels failed to spill.
+
+    Args:
+        org_id (str): The organization id.
+        batch_size (int): Number of channels spilled concurrently.
+
+    Returns:
+        int: The number of channels spilled.
+    """
+    spilled = 0
+    while True:
+        rooms = await DataStorage(org_id).read(
+            settings.ROOM_COLLECTION,
+            raw_query={
+                "room_type": "CHANNEL",
+                "members_spilled": {"$ne": True},
+                "$expr": {
+                    "$gte": [
+                        {"$size": {"$objectToArray": "$room_members"}},
+                        settings.ROOM_MEMBERS_SPILL_THRESHOLD,
+                    ]
+                },
+            },
+            options={"limit": batch_size, "projection": {"_id": 1}},
+        )
+        if not rooms or "status_code" in rooms:
+            return spilled
+        if isinstance(rooms, dict):
+            rooms = [rooms]
+
+        results = await asyncio.gather(
+            *(spill_members(org_id, room["_id"]) for room in rooms)
+        )
+        if not any(results):
+            return spilled
+        spilled += sum(results)
+
+
+async def main(org_ids: list[str]) -> None:
+    """Runs the large channel migration for the given organizations."""
+    try:
+        for org_id in org_ids:
+            spilled = await migrate_large_channels(org_id)
+            print(f"{org_id}: {spilled} channels spilled")
+    finally:
+        await http_client.shutdown()
+
+
+if __name__ == "__main__":
+    # python -m utils.large_channels <org_id> [<org_id> ...]
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,165 @@
+import copy
+from typing import Any, Optional
+
+from config.settings import settings
+from utils.cache import LRUCache
+from utils.db import DataStorage
+from utils.room_members import get_member_memberships
+
+MEMBER_FLAGS = ("role", "starred", "closed")
+
+
+class MemberRoomIndex:
+    """Maps the members of an organization to the rooms they belong to.
+
+    The rooms of a member are read from zc_core the first time they are needed,
+    then kept up to date by the endpoints creating rooms and changing their
+    members, so that listing the rooms of a member does not scan the rooms of
+    the organization. Every room is stored with its type and the member's flags.
+    Entries expire after `ttl` seconds, to pick up changes made by other
+    processes, and a read that raced with a change of the member's rooms is
+    returned but not stored.
+
+    Attributes:
+        maxsize (int): Maximum number of members indexed.
+        ttl (float): Number of seconds the rooms of a member are kept.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = settings.MEMBER_ROOMS_CACHE_SIZE,
+        ttl: float = settings.MEMBER_ROOMS_TTL,
+    ) -> None:
+        self._members = LRUCache(maxsize=maxsize, ttl=ttl)
+        # number of changes seen by the members whose rooms are being read
+        self._generations: dict[tuple[str, str], list[int]] = {}
+
+    async def rooms(
+        self, org_id: str, member_id: str
+    ) -> Optional[dict[str, dict[str, Any]]]:
+        """Gets the rooms of a member.
+
+        Args:
+            org_id (str): The organization id.
+            member_id (str): The member id.
+
+        Returns:
+            dict: The `room_type`, `role`, `starred` and `closed` flags of every
+            room of the member, by room id. None if zc_core failed.
+
+            {
+                "61e59de865934b58b8e5d1c8": {
+                    "room_type": "DM",
+                    "role": "admin",
+                    "starred": false,
+                    "closed": false
+                },
+                ...
+            }
+        """
+        key = (org_id, member_id)
+        rooms = self._members.get(key)
+        if rooms is not None:
+            return copy.deepcopy(rooms)
+
+        reading = self._generations.setdefault(key, [0, 0])
+        reading[0] += 1
+        generation = reading[1]
+        try:
+            rooms = await self._read(org_id, member_id)
+        finally:
+            reading[0] -= 1
+            if not reading[0]:
+                self._generations.pop(key, None)
+
+        if rooms is None:
+            return None
+        if reading[1] == generation:
+            self._members.set(key, rooms)
+        return copy.deepcopy(rooms)
+
+    async def _read(
+        self, org_id: str, member_id: str
+    ) -> Optional[dict[str, dict[str, Any]]]:
+        response = await DataStorage(org_id).read(
+            settings.ROOM_COLLECTION,
+            query={f"room_members.{member_id}": {"$exists": True}},
+            options={
+                "projection": {
+                    "_id": 1,
+                    "room_type": 1,
+                    f"room_members.{member_id}": 1,
+                }
+            },
+        )
+        if response is not None and "status_code" in response:
+            return None
+        if isinstance(response, dict):
+            response = [response]
+
+        rooms = {
+            room["_id"]: self._entry(room["room_type"], room["room_members"][member_id])
+            for room in response or []
+        }
+
+        # only channels are large enough to have their members spilled
+        memberships = await get_member_memberships(org_id, member_id)
+        if memberships is None:
+            return None
+        for membership in memberships:
+            rooms[membership["room_id"]] = self._entry("CHANNEL", membership)
+        return rooms
+
+    def _changed(self, org_id: str, member_id: str) -> None:
+        reading = self._generations.get((org_id, member_id))
+        if reading is not None:
+            reading[1] += 1
+
+    @staticmethod
+    def _entry(room_type: str, member: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "room_type": str(room_type).upper(),
+            **{flag: member.get(flag) for flag in MEMBER_FLAGS},
+        }
+
+    def add_room(self, org_id: str, room: dict[str, Any]) -> None:
+        """Records a room, or its new member flags, for every indexed member of it.
+
+        Args:
+            org_id (str): The organization id.
+            room (dict): The room document, with its `_id`, `room_type` and
+                `room_members`.
+        """
+        for member_id, member in room.get("room_members", {}).items():
+            self._changed(org_id, member_id)
+            rooms = self._members.peek((org_id, member_id))
+            if rooms is not None:
+                rooms[room["_id"]] = self._entry(room["room_type"], dict(member))
+
+    def remove_member(self, org_id: str, member_id: str, room_id: str) -> None:
+        """Forgets a room a member left."""
+        self._changed(org_id, member_id)
+        rooms = self._members.peek((org_id, member_id))
+        if rooms is not None:
+            rooms.pop(room_id, None)
+
+    def remove_room(self, org_id: str, room: dict[str, Any]) -> None:
+        """Forgets a deleted room for every member of it."""
+        for member_id in room.get("room_members", {}):
+            self.remove_member(org_id, member_id, room["_id"])
+
+    def invalidate(self, org_id: str, member_id: str) -> None:
+        """Drops the rooms of a member, they are read again when next needed."""
+        self._changed(org_id, member_id)
+        self._members.pop((org_id, member_id))
+
+    def clear(self) -> None:
+        """Drops every indexed member."""
+        self._members.clear()
+        for reading in self._generations.values():
+            reading[1] += 1
+
+
+# An instance of MemberRoomIndex
+# This will be used when importing the class
+member_rooms = MemberRoomIndex()
@@ -0,0 +1,318 @@
+import json
+from collections import OrderedDict, deque
+from typing import Any, Hashable, Optional
+
+from config.settings import settings
+
+
+class RoomBuffer:
+    """The latest messages of one room, serialized, oldest first.
+
+    Attributes:
+        messages (deque): Serialized messages, at most `maxlen` of them.
+        complete (bool): Whether the buffer holds every message of the room.
+        nbytes (int): Size of the serialized messages.
+    """
+
+    def __init__(self, maxlen: int) -> None:
+        self.messages: deque = deque(maxlen=maxlen)
+        self.complete = False
+        self.nbytes = 0
+
+    def replace(self, messages: list[str]) -> None:
+        """Replaces every buffered message."""
+        self.messages.clear()
+        self.messages.extend(messages)
+        self.nbytes = sum(len(message) for message in self.messages)
+
+    def append(self, message: str) -> None:
+        """Adds the newest message, dropping the oldest one if the buffer is full."""
+        if len(self.messages) == self.messages.maxlen:
+            self.nbytes -= len(self.messages[0])
+            self.complete = False
+        self.messages.append(message)
+        self.nbytes += len(message)
+
+    def find(self, message_id: str) -> Optional[int]:
+        """Gets the position of a message in the buffer."""
+        for index in range(len(self.messages) - 1, -1, -1):
+            if json.loads(self.messages[index])["_id"] == message_id:
+                return index
+        return None
+
+    def set(self, index: int, message: str) -> None:
+        """Replaces the message at `index`."""
+        self.nbytes += len(message) - len(self.messages[index])
+        self.messages[index] = message
+
+
+class MessageBuffer:
+    """Keeps the latest messages of the most active rooms in memory.
+
+    Every room gets a ring buffer of its last `size` messages, filled as messages
+    are sent, edited or replied to in this process, so the first page of an active
+    room can be served without reading zc_core. Messages are stored serialized, and
+    once they use more than `max_bytes` the least recently active rooms are dropped.
+
+    Attributes:
+        size (int): Number of messages kept per room.
+        max_bytes (int): Memory budget of the serialized messages across rooms.
+    """
+
+    def __init__(
+        self,
+        size: int = settings.MESSAGE_BUFFER_SIZE,
+        max_bytes: int = settings.MESSAGE_BUFFER_MAX_BYTES,
+    ) -> None:
+        self.size = size
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._rooms: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def _dumps(message: dict[str, Any]) -> str:
+        return json.dumps(message, default=str)
+
+    def _touch(self, key: Hashable) -> Optional[RoomBuffer]:
+        buffer = self._rooms.get(key)
+        if buffer is not None:
+            self._rooms.move_to_end(key)
+        return buffer
+
+    def _resize(self, buffer: RoomBuffer, nbytes: int) -> None:
+        self.nbytes += buffer.nbytes - nbytes
+        while self.nbytes > self.max_bytes and self._rooms:
+            _, evicted = self._rooms.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def latest(
+        self, org_id: str, room_id: str, size: int
+    ) -> Optional[tuple[list[dict[str, Any]], bool]]:
+        """Gets the first page of a room's messages, newest first.
+
+        Args:
+            org_id (str): The organization id.
+            room_id (str): The room id.
+            size (int): The page size.
+
+        Returns:
+            tuple[list[dict], bool]: The messages and whether older messages exist,
+            None if the buffer cannot answer for the page.
+        """
+        buffer = self._touch((org_id, room_id))
+        if buffer is None:
+            return None
+
+        count = len(buffer.messages)
+        if count <= size and not buffer.complete:
+            return None
+
+        newest = range(count - 1, max(count - size, 0) - 1, -1)
+        return [json.loads(buffer.messages[index]) for index in newest], count > size
+
+    def prime(
+        self,
+        org_id: str,
+        room_id: str,
+        messages: list[dict[str, Any]],
+        complete: bool,
+    ) -> None:
+        """Seeds a room's buffer with its first page read from zc_core.
+
+        Messages already buffered for the room are kept, as they may be newer
+        than the page that was read.
+
+        Args:
+            org_id (str): The organization id.
+            room_id (str): The room id.
+            messages (list[dict]): The newest messages of the room, newest first.
+            complete (bool): Whether `messages` are all the messages of the room.
+        """
+        key = (org_id, room_id)
+        buffer = self._touch(key)
+        if buffer is None:
+            buffer = self._rooms[key] = RoomBuffer(self.size)
+
+        merged = {message["_id"]: message for message in messages}
+        for message in map(json.loads, buffer.messages):
+            merged[message["_id"]] = message
+        ordered = sorted(
+            merged.values(), key=lambda message: (message["created_at"], message["_id"])
+        )
+
+        nbytes = buffer.nbytes
+        buffer.replace([self._dumps(message) for message in ordered[-self.size :]])
+        buffer.complete = complete and len(ordered) <= self.size
+        self._resize(buffer, nbytes)
+
+    def append(self, org_id: str, room_id: str, message: dict[str, Any]) -> None:
+        """Adds a message that was just sent to its room's buffer.
+
+        Args:
+            org_id (str): The organization id.
+            room_id (str): The room id.
+            message (dict): The message document, including its `_id`.
+        """
+        key = (org_id, room_id)
+        buffer = self._touch(key)
+        if buffer is None:
+            buffer = self._rooms[key] = RoomBuffer(self.size)
+
+        nbytes = buffer.nbytes
+        buffer.append(self._dumps(message))
+        self._resize(buffer, nbytes)
+
+    def update(
+        self, org_id: str, room_id: str, message_id: str, data: dict[str, Any]
+    ) -> None:
+        """Applies the fields written to a message to its buffered copy.
+
+        Nothing happens if the message is not buffered.
+
+        Args:
+            org_id (str): The organization id.
+            room_id (str): The room id.
+            message_id (str): The id of the message.
+            data (dict): The top level fields that were written to the message.
+        """
+        self._patch(org_id, room_id, message_id, lambda message: message.update(data))
+
+    def add_thread(
+        self,
+        org_id: str,
+        room_id: str,
+        message_id: str,
+        thread_message: dict[str, Any],
+    ) -> None:
+        """Adds a thread reply to the buffered copy of its parent message."""
+
+        def add(message: dict[str, Any]) -> None:
+            if not message.get("threads_spilled"):
+                message.setdefault("threads", []).insert(0, thread_message)
+            if message.get("thread_count") is not None:
+                message["thread_count"] += 1
+            message["last_reply_at"] = thread_message.get("created_at")
+            participants = [thread_message.get("sender_id")]
+            participants += message.get("thread_participants") or []
+            message["thread_participants"] = participants[
+                : settings.THREAD_PARTICIPANTS_WINDOW
+            ]
+
+        self._patch(org_id, room_id, message_id, add)
+
+    def update_thread(
+        self,
+        org_id: str,
+        room_id: str,
+        message_id: str,
+        thread_message: dict[str, Any],
+    ) -> None:
+        """Replaces a thread reply in the buffered copy of its parent message."""
+
+        def replace(message: dict[str, Any]) -> None:
+            threads = message.get("threads", [])
+            for index, thread in enumerate(threads):
+                if thread.get("thread_id") == thread_message["thread_id"]:
+                    threads[index] = {**thread, **thread_message}
+
+        self._patch(org_id, room_id, message_id, replace)
+
+    def update_reactions(
+        self,
+        org_id: str,
+        room_id: str,
+        message_id: str,
+        reaction: dict[str, Any],
+    ) -> None:
+        """Applies the members who added or removed an emoji to the buffered message.
+
+        Args:
+            org_id (str): The organization id.
+            room_id (str): The room id.
+            message_id (str): The id of the message.
+            reaction (dict): The `name` and `emoji` reacted with, and the ids of
+                the members who `added` and `removed` it.
+        """
+
+        def react(message: dict[str, Any]) -> None:
+            emojis = message.setdefault("emojis", [])
+            entry = next(
+                (emoji for emoji in emojis if emoji.get("name") == reaction["name"]),
+                None,
+            )
+            if entry is None:
+                entry = {
+                    "name": reaction["name"],
+                    "count": 0,
+                    "emoji": reaction["emoji"],
+                    "reactedUsersId": [],
+                }
+                emojis.append(entry)
+
+            members = [
+                member_id
+                for member_id in entry["reactedUsersId"]
+                if member_id not in reaction["removed"]
+            ]
+            members += [
+                member_id for member_id in reaction["added"] if member_id not in members
+            ]
+            entry["reactedUsersId"] = members
+            entry["count"] = len(members)
+            if not members:
+                emojis.remove(entry)
+
+        self._patch(org_id, room_id, message_id, react)
+
+    def _patch(self, org_id: str, room_id: str, message_id: str, apply) -> None:
+        buffer = self._touch((org_id, room_id))
+        if buffer is None:
+            return
+
+        index = buffer.find(message_id)
+        if index is None:
+            return
+
+        message = json.loads(buffer.messages[index])
+        apply(message)
+        nbytes = buffer.nbytes
+        buffer.set(index, self._dumps(message))
+        self._resize(buffer, nbytes)
+
+    def remove(self, org_id: str, room_id: str, message_ids: list[str]) -> None:
+        """Drops deleted messages from their room's buffer.
+
+        Args:
+            org_id (str): The organization id.
+            room_id (str): The room id.
+            message_ids (list[str]): The ids of the deleted messages.
+        """
+        buffer = self._touch((org_id, room_id))
+        if buffer is None:
+            return
+
+        deleted = set(message_ids)
+        kept = [
+            message
+            for message in buffer.messages
+            if json.loads(message)["_id"] not in deleted
+        ]
+        nbytes = buffer.nbytes
+        buffer.replace(kept)
+        self._resize(buffer, nbytes)
+
+    def invalidate(self, org_id: str, room_id: str) -> None:
+        """Drops the buffer of a room."""
+        buffer = self._rooms.pop((org_id, room_id), None)
+        if buffer is not None:
+            self.nbytes -= buffer.nbytes
+
+    def clear(self) -> None:
+        """Drops every buffered room."""
+        self._rooms.clear()
+        self.nbytes = 0
+
+
+# An instance of MessageBuffer
+# This will be used when importing the class
+message_buffer = MessageBuffer()
@@ -1,10 +1,19 @@
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta
 from typing import Any, Optional
 
 from config.settings import settings
+from fastapi import HTTPException, status
 from schema.message import Message
 from utils.db import DataStorage
-from utils.paginator import off_set
+from utils.message_buffer import message_buffer
+from utils.paginator import (
+    decode_sync_cursor,
+    encode_sync_cursor,
+    keyset_query,
+    off_set,
+)
+from utils.room_utils import allocate_message_seq, update_room_counters
 
 
 async def get_org_messages(
@@ -48,21 +57,139 @@ async def get_org_messages(
     return response
 
 
+def thread_activity(replies: list[dict[str, Any]]) -> dict[str, Any]:
+    """Computes the thread fields stored on a parent message from its replies.
+
+    Args:
+        replies (list[dict]): The replies of the thread, newest first.
+
+    Returns:
+        dict: The `thread_count`, `last_reply_at` and `thread_participants` fields.
+    """
+    return {
+        "thread_count": len(replies),
+        "last_reply_at": replies[0].get("created_at") if replies else None,
+        "thread_participants": [
+            reply.get("sender_id")
+            for reply in replies[: settings.THREAD_PARTICIPANTS_WINDOW]
+        ],
+    }
+
+
+def summarize_threads(message: dict[str, Any]) -> dict[str, Any]:
+    """Replaces the replies of a message with a summary of its thread.
+
+    Args:
+        message (dict): The message, with its thread fields or its replies.
+
+    Returns:
+        dict: A copy of the message without `threads` and with a `thread_summary`.
+
+        {
+            "_id": "61e6878165934b58b8e5d1e0",
+            ...
+            "thread_summary": {
+                "reply_count": 12,
+                "last_reply_at": "2022-01-18 09:05:32.479911",
+                "participants": ["619ba4671a5f54782939d385"]
+            }
+        }
+    """
+    message = dict(message)
+    replies = message.pop("threads", None)
+    activity = {
+        "thread_count": message.pop("thread_count", None),
+        "last_reply_at": message.pop("last_reply_at", None),
+        "thread_participants": message.pop("thread_participants", None),
+    }
+    if activity["thread_count"] is None:
+        activity = thread_activity(replies or [])
+
+    participants = []
+    for sender_id in activity["thread_participants"] or []:
+        if sender_id not in participants:
+            participants.append(sender_id)
+
+    message["thread_summary"] = {
+        "reply_count": activity["thread_count"],
+        "last_reply_at": activity["last_reply_at"],
+        "participants": participants[: settings.THREAD_SUMMARY_PARTICIPANTS],
+    }
+    return message
+
+
+async def summarize_room_messages(
+    org_id: str, messages: list[dict[str, Any]]
+) -> Optional[list[dict[str, Any]]]:
+    """Summarizes the threads of a page of messages read without their replies.
+
+    Messages stored before their thread fields existed have the senders and dates
+    of their replies read in one extra request.
+
+    Args:
+        org_id (str): The organization id
+        messages (list[dict]): The messages, read without `threads`.
+
+    Returns:
+        list[dict]: The messages with a `thread_summary`, None if zc_core failed.
+    """
+    legacy_ids = [
+        message["_id"] for message in messages if message.get("thread_count") is None
+    ]
+    replies = {}
+    if legacy_ids:
+        response = await DataStorage(org_id).read(
+            settings.MESSAGE_COLLECTION,
+            raw_query={"_id": {"$in": legacy_ids}},
+            options={"projection": {"threads.sender_id": 1, "threads.created_at": 1}},
+        )
+        if response is not None and "status_code" in response:
+            return None
+        if isinstance(response, dict):
+            response = [response]
+        replies = {
+            message["_id"]: message.get("threads") or [] for message in response or []
+        }
+
+    return [
+        summarize_threads({**message, "threads": replies.get(message["_id"], [])})
+        for message in messages
+    ]
+
+
 async def get_room_messages(
     org_id: str,
     room_id: str,
     page: int,
     size: int,
     created_at: int = None,
-) -> Optional[list[dict[str, Any]]]:
+    before: str = None,
+    after: str = None,
+    include_threads: bool = True,
+) -> Optional[tuple[list[dict[str, Any]], bool]]:
+
+    """Gets a page of the messages sent inside a room, newest first.
+
+    Messages are ordered on (created_at, _id). When a `before` or `after` cursor
+    is given the page is selected with a keyset query, otherwise `page` is used
+    as an offset. One extra message is read to tell if the page is the last one.
+    The first page of a room is served from the message buffer when it holds it.
+    Without `include_threads` the replies are not read, each message carries a
+    `thread_summary` instead.
 
-    """Gets all messages sent inside  a room.
     Args:
         org_id (str): The organization id
         room_id (str): The room id
+        page (int): The page number, ignored when a cursor is given.
+        size (int): The number of messages per page.
+        created_at (int): Only return messages sent in the last `created_at` days.
+        before (str): Cursor of the message to read older messages from.
+        after (str): Cursor of the message to read newer messages from.
+        include_threads (bool): Whether to return the replies of every message.
 
     Returns:
-        list[dict]: A list of key value pairs of messages info mapped according to message schema.
+        tuple[list[dict], bool]: The messages mapped according to message schema
+        and whether more messages exist past the page, in the direction read.
 
         [
             {
@@ -79,30 +206,102 @@ async def get_room_messages(
             },
             ...
         ]
+
+    Raises:
+        HTTPException [400]: Invalid cursor
     """
 
+    first_page = page == 1 and not (before or after or created_at)
+    if first_page:
+        buffered = message_buffer.latest(org_id, room_id, size)
+        if buffered is not None and not include_threads:
+            return list(map(summarize_threads, buffered[0])), buffered[1]
+        if buffered is not None:
+            return buffered
+
     DB = DataStorage(org_id)
 
-    skip = await off_set(page, size)
-    options = {"limit": size, "skip": skip, "sort": {"created_at": -1}}
-    raw_query = {}
+    filters = [{"room_id": room_id}]
     if created_at:
-        date = datetime.datetime.now() - datetime.timedelta(days=created_at)
-        raw_query = {"room_id": room_id, "created_at": {"$gte": str(date).split()[0]}}
+        date = datetime.utcnow() - timedelta(days=created_at)
+        filters.append({"created_at": {"$gte": str(date).split()[0]}})
+
+    options = {"limit": size + 1, "sort": {"created_at": -1, "_id": -1}}
+    if after:
+        filters.append(keyset_query(after, older=False))
+        options["sort"] = {"created_at": 1, "_id": 1}
+    elif before:
+        filters.append(keyset_query(before, older=True))
     else:
-        raw_query = {"room_id": room_id}
+        options["skip"] = await off_set(page, size)
+    if not include_threads:
+        options["projection"] = {"threads": 0}
+
+    raw_query = filters[0] if len(filters) == 1 else {"$and": filters}
     response = await DB.read(
         settings.MESSAGE_COLLECTION,
         options=options,
         raw_query=raw_query,
     )
 
+    if response is None:
+        return [], False
+
+    if "status_code" in response:
+        return None
+
+    if isinstance(response, dict):
+        response = [response]
+
+    has_more = len(response) > size
+    if first_page and include_threads:
+        message_buffer.prime(org_id, room_id, response, complete=not has_more)
+
+    messages = response[:size]
+    if after:
+        messages.reverse()
+    if not include_threads:
+        messages = await summarize_room_messages(org_id, messages)
+        if messages is None:
+            return None
+    return messages, has_more
+
+
+async def get_room_messages_by_seq(
+    org_id: str, room_id: str, from_seq: int, to_seq: int
+) -> Optional[list[dict[str, Any]]]:
+    """Gets the messages of a room within a range of sequence numbers.
+
+    Clients use it to fill the gaps they detect in the sequence numbers of
+    the messages they received.
+
+    Args:
+        org_id (str): The organization id
+        room_id (str): The room id
+        from_seq (int): The sequence number of the first message, inclusive.
+        to_seq (int): The sequence number of the last message, inclusive.
+
+    Returns:
+        list[dict]: The messages in the range ordered by sequence number,
+        None if zc_core failed.
+    """
+
+    DB = DataStorage(org_id)
+    response = await DB.read(
+        settings.MESSAGE_COLLECTION,
+        raw_query={"room_id": room_id, "seq": {"$gte": from_seq, "$lte": to_seq}},
+        options={"limit": to_seq - from_seq + 1, "sort": {"seq": 1}},
+    )
+
     if response is None:
         return []
 
     if "status_code" in response:
         return None
 
+    if isinstance(response, dict):
+        return [response]
+
     return response
 
 
@@ -149,38 +348,388 @@ async def get_message(
 async def create_message(org_id: str, message: Message) -> dict[str, Any]:
     """Creates a message document in the database.
 
+    The message is given the next sequence number of its room, and the room's
+    message and attachment counters are incremented once the message is written.
+
     Args:
         org_id (str): The organization id where the message is created.
         message (Message): The message object to be saved.
 
     Returns:
         dict[str, Any]: The response returned by DataStorage's write method.
+
+    Raises:
+        HTTPException [424]: Unable to allocate a sequence number.
     """
 
     db = DataStorage(org_id)
+    message.seq = await allocate_message_seq(org_id, message.room_id)
     message.created_at = str(datetime.utcnow())
-    return await db.write(settings.MESSAGE_COLLECTION, message.dict())
+    message.updated_at = message.created_at
+    response = await db.write(settings.MESSAGE_COLLECTION, message.dict())
+
+    if response and response.get("status_code") is None:
+        await update_room_counters(
+            org_id,
+            message.room_id,
+            message_count=1,
+            attachment_count=len(message.files),
+        )
+    return response
 
 
 async def update_message(
-    org_id: str, message_id: str, message: dict[str, Any]
+    org_id: str,
+    room_id: str,
+    message_id: str,
+    message: dict[str, Any],
+    version: Optional[int] = None,
 ) -> dict[str, Any]:
     """Updates a message document in the database.
 
+    The edit is a single conditional update matching the message, its sender
+    and, when given, the version the sender edited, and it increments the
+    version so that concurrent edits cannot silently overwrite each other.
+    Only when nothing matched is the message read, to tell why.
+
     Args:
         org_id (str): The organization id where the message is being updated.
+        room_id (str): The id of the room the message was sent in.
         message_id (str): The id of the message to be edited.
-        message (dict[str, Any]): The new data.
+        message (dict[str, Any]): The new data, including the `sender_id`.
+        version (int, optional): The version of the message being edited,
+            None to edit whichever version is stored.
 
     Returns:
         dict[str, Any]: The response returned by DataStorage's update method.
+
+    Raises:
+        HTTPException [401]: You are not authorized to edit this message.
+        HTTPException [404]: Message not found.
+        HTTPException [409]: Message was edited since it was read.
     """
 
     db = DataStorage(org_id)
     message["edited"] = True
+    message["updated_at"] = str(datetime.utcnow())
+
+    query = {"_id": message_id, "room_id": room_id, "sender_id": message["sender_id"]}
+    if version is not None:
+        # messages stored before versions existed are at version 0
+        query["version"] = {"$in": [version, None]} if version == 0 else version
 
-    return await db.update(
+    response = await db.update(
         collection_name=settings.MESSAGE_COLLECTION,
-        document_id=message_id,
-        data=message,
+        raw_query={"$set": message, "$inc": {"version": 1}},
+        query=query,
+    )
+
+    if not response or response.get("status_code"):
+        return response
+
+    if not response.get("data", {}).get("matched_documents"):
+        await raise_message_edit_error(org_id, room_id, message_id, message)
+
+    return response
+
+
+async def raise_message_edit_error(
+    org_id: str, room_id: str, message_id: str, message: dict[str, Any]
+) -> None:
+    """Explains why a message edit matched nothing.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The id of the room the message was sent in.
+        message_id (str): The id of the message.
+        message (dict[str, Any]): The new data, including the `sender_id`.
+
+    Raises:
+        HTTPException [401]: You are not authorized to edit this message.
+        HTTPException [404]: Message not found.
+        HTTPException [409]: Message was edited since it was read.
+    """
+    response = await DataStorage(org_id).read(
+        settings.MESSAGE_COLLECTION,
+        query={"_id": message_id, "room_id": room_id},
+        options={"projection": {"sender_id": 1, "version": 1}},
+    )
+
+    if not response or "status_code" in response:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Message not found"
+        )
+
+    if response.get("sender_id") != message["sender_id"]:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="You are not authorized to edit this message",
+        )
+
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail={
+            "message": "Message was edited since it was read",
+            "version": response.get("version", 0),
+        },
     )
+
+
+async def record_tombstones(
+    org_id: str, room_id: str, message_ids: list[str]
+) -> dict[str, Any]:
+    """Remembers that messages were deleted so that syncing clients can drop them.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The id of the room the messages were sent in.
+        message_ids (list[str]): The ids of the deleted messages.
+
+    Returns:
+        dict[str, Any]: The response returned by DataStorage's write method.
+    """
+
+    deleted_at = str(datetime.utcnow())
+    tombstones = [
+        {"room_id": room_id, "message_id": message_id, "deleted_at": deleted_at}
+        for message_id in message_ids
+    ]
+    return await DataStorage(org_id).write(
+        settings.TOMBSTONE_COLLECTION, tombstones, bulk_write=True
+    )
+
+
+async def get_messages_by_ids(
+    org_id: str, room_id: str, message_ids: list[str]
+) -> Optional[list[dict[str, Any]]]:
+    """Reads the messages of a room that are about to be deleted.
+
+    Only the fields needed to authorize the deletion and to update the room's
+    counters are read.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The id of the room the messages were sent in.
+        message_ids (list[str]): The ids of the messages.
+
+    Returns:
+        list[dict]: The messages found in the room, None if zc_core failed.
+    """
+    response = await DataStorage(org_id).read(
+        settings.MESSAGE_COLLECTION,
+        raw_query={"_id": {"$in": message_ids}, "room_id": room_id},
+        options={
+            "projection": {
+                "sender_id": 1,
+                "files": 1,
+                "thread_count": 1,
+                "threads.files": 1,
+                "threads_spilled": 1,
+            }
+        },
+    )
+    if response is None:
+        return []
+    if "status_code" in response:
+        return None
+    if isinstance(response, dict):
+        return [response]
+    return response
+
+
+async def delete_messages(
+    org_id: str, room_id: str, messages: list[dict[str, Any]]
+) -> list[str]:
+    """Deletes messages of a room along with their thread replies.
+
+    Every deleted message leaves a tombstone for syncing clients, is dropped from
+    the room's message buffer and is taken off the room's counters.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The id of the room the messages were sent in.
+        messages (list[dict]): The messages, as read by `get_messages_by_ids`.
+
+    Returns:
+        list[str]: The ids of the messages that were deleted.
+    """
+
+    DB = DataStorage(org_id)
+    deleted = await DB.delete_many(
+        settings.MESSAGE_COLLECTION, [message["_id"] for message in messages]
+    )
+    if not deleted:
+        return deleted
+
+    deleted_ids = set(deleted)
+    messages = [message for message in messages if message["_id"] in deleted_ids]
+    spilled = [message["_id"] for message in messages if message.get("threads_spilled")]
+    replies = []
+    if spilled:
+        replies = await DB.read(
+            settings.THREAD_REPLIES_COLLECTION,
+            raw_query={"parent_id": {"$in": spilled}, "room_id": room_id},
+            options={"projection": {"_id": 1, "files": 1}},
+        )
+        if replies is None or "status_code" in replies:
+            replies = []
+        elif isinstance(replies, dict):
+            replies = [replies]
+        await DB.delete_many(
+            settings.THREAD_REPLIES_COLLECTION, [reply["_id"] for reply in replies]
+        )
+
+    thread_reply_count = 0
+    attachment_count = sum(len(reply.get("files") or []) for reply in replies)
+    for message in messages:
+        threads = message.get("threads") or []
+        thread_count = message.get("thread_count")
+        thread_reply_count += len(threads) if thread_count is None else thread_count
+        attachment_count += len(message.get("files") or []) + sum(
+            len(thread.get("files") or []) for thread in threads
+        )
+
+    message_buffer.remove(org_id, room_id, deleted)
+    await asyncio.gather(
+        record_tombstones(org_id, room_id, deleted),
+        update_room_counters(
+            org_id,
+            room_id,
+            message_count=-len(deleted),
+            thread_reply_count=-thread_reply_count,
+            attachment_count=-attachment_count,
+        ),
+    )
+    return deleted
+
+
+def changed_at(message: dict[str, Any]) -> str:
+    """Gets the time a message was last created or edited."""
+    return message.get("updated_at") or message["created_at"]
+
+
+async def get_room_changes(
+    org_id: str, room_id: str, since: str, size: int
+) -> Optional[dict[str, Any]]:
+    """Gets the messages created, edited or deleted in a room after a watermark.
+
+    Changes are returned oldest first, ordered on their time then on the id of
+    their message, so that changes made at the same time are neither skipped
+    nor repeated across calls. When more than `size` changes happened, only the
+    oldest ones are returned and the returned watermark points at the last
+    change included, so that the next call picks up where this one stopped.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The room id.
+        since (str): The watermark returned by the previous call, or the time of
+            the last change the client saw.
+        size (int): The maximum number of changes to return.
+
+    Returns:
+        dict: The changed messages, the deleted message ids and the new watermark,
+        None if zc_core failed.
+
+        {
+            "messages": [
+                {
+                    "_id": "61e6878165934b58b8e5d1e0",
+                    "created_at": "2022-01-18 09:05:32.479911",
+                    "updated_at": "2022-01-18 09:06:10.023181",
+                    "edited": true,
+                    ...
+                },
+                ...
+            ],
+            "deleted": [
+                {
+                    "message_id": "61e6878165934b58b8e5d1e1",
+                    "deleted_at": "2022-01-18 09:07:41.194512"
+                }
+            ],
+            "watermark": "WyIyMDIyLTAxLTE4IDA5OjA3OjQxLjE5NDUxMiIsIjYxZTY4Nzg...",
+            "has_more": false
+        }
+    """
+    last_changed_at, last_id = decode_sync_cursor(since)
+
+    def after(field: str, id_field: str) -> dict[str, Any]:
+        return {
+            "$or": [
+                {field: {"$gt": last_changed_at}},
+                {field: last_changed_at, id_field: {"$gt": last_id}},
+            ]
+        }
+
+    DB = DataStorage(org_id)
+    responses = await asyncio.gather(
+        DB.read(
+            settings.MESSAGE_COLLECTION,
+            raw_query={"room_id": room_id, **after("updated_at", "_id")},
+            options={"limit": size + 1, "sort": {"updated_at": 1, "_id": 1}},
+        ),
+        # messages stored before updated_at was set on creation
+        DB.read(
+            settings.MESSAGE_COLLECTION,
+            raw_query={
+                "room_id": room_id,
+                "updated_at": None,
+                **after("created_at", "_id"),
+            },
+            options={"limit": size + 1, "sort": {"created_at": 1, "_id": 1}},
+        ),
+        DB.read(
+            settings.TOMBSTONE_COLLECTION,
+            raw_query={"room_id": room_id, **after("deleted_at", "message_id")},
+            options={
+                "limit": size + 1,
+                "sort": {"deleted_at": 1, "message_id": 1},
+                "projection": {"_id": 0, "message_id": 1, "deleted_at": 1},
+            },
+        ),
+    )
+
+    streams = []
+    for response in responses:
+        if response is None:
+            response = []
+        elif "status_code" in response:
+            return None
+        elif isinstance(response, dict):
+            response = [response]
+        streams.append(response)
+    updated, legacy, tombstones = streams
+
+    def message_key(message: dict[str, Any]) -> tuple[str, str]:
+        return changed_at(message), message["_id"]
+
+    def tombstone_key(tombstone: dict[str, Any]) -> tuple[str, str]:
+        return tombstone["deleted_at"], tombstone["message_id"]
+
+    changes = sorted(
+        [(message_key(message), False, message) for message in updated + legacy]
+        + [(tombstone_key(tombstone), True, tombstone) for tombstone in tombstones],
+        key=lambda change: change[0],
+    )
+
+    # a truncated stream is only complete up to the last change it returned
+    bounds = [
+        key(stream[-1])
+        for stream, key in (
+            (updated, message_key),
+            (legacy, message_key),
+            (tombstones, tombstone_key),
+        )
+        if len(stream) > size
+    ]
+    if bounds:
+        changes = [change for change in changes if change[0] <= min(bounds)]
+    has_more = bool(bounds) or len(changes) > size
+    changes = changes[:size]
+
+    return {
+        "messages": [change for _, deleted, change in changes if not deleted],
+        "deleted": [change for _, deleted, change in changes if deleted],
+        "watermark": encode_sync_cursor(*changes[-1][0]) if changes else since,
+        "has_more": has_more,
+    }
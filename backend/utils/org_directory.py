@@ -0,0 +1,196 @@
+import asyncio
+import time
+from typing import Any, Optional
+
+from config.settings import settings
+from utils.db import DataStorage
+
+
+class OrgMembers:
+    """Holds the members of one organization indexed for constant time lookups.
+
+    Attributes:
+        members (list[dict]): The members as returned by zc_core.
+        by_id (dict): Members keyed by their `_id`.
+        by_email (dict): Members keyed by their lower cased email.
+        by_username (dict): Members keyed by their `user_name`.
+        fetched_at (float): Monotonic time at which the members were fetched.
+    """
+
+    def __init__(self, members: list[dict[str, Any]]) -> None:
+        self.members = members
+        self.by_id = {}
+        self.by_email = {}
+        self.by_username = {}
+        for member in members:
+            self.by_id[member.get("_id")] = member
+            if member.get("email"):
+                self.by_email[member["email"].lower()] = member
+            if member.get("user_name"):
+                self.by_username[member["user_name"]] = member
+        self.fetched_at = time.monotonic()
+
+    @property
+    def age(self) -> float:
+        """Number of seconds since the members were fetched."""
+        return time.monotonic() - self.fetched_at
+
+
+class OrgDirectory:
+    """Caches the member directory of every organization.
+
+    The member list of an organization is downloaded from zc_core at most once per
+    `ttl` seconds. Past the TTL the cached directory keeps being served for up to
+    `stale_ttl` more seconds while a single background refresh replaces it; after
+    that lookups wait for a fresh copy.
+
+    Attributes:
+        ttl (int): Number of seconds a directory is considered fresh.
+        stale_ttl (int): Number of seconds a stale directory may still be served.
+    """
+
+    def __init__(
+        self,
+        ttl: int = settings.ORG_DIRECTORY_TTL,
+        stale_ttl: int = settings.ORG_DIRECTORY_STALE_TTL,
+    ) -> None:
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._directories: dict[str, OrgMembers] = {}
+        self._refresh_tasks: dict[str, asyncio.Task] = {}
+
+    async def _fetch(self, org_id: str) -> Optional[OrgMembers]:
+        members = await DataStorage(org_id).get_all_members()
+        if members is None:
+            return self._directories.get(org_id)
+
+        directory = OrgMembers(members)
+        if members:
+            self._directories[org_id] = directory
+        return directory
+
+    async def refresh(self, org_id: str) -> Optional[OrgMembers]:
+        """Downloads the member list of an organization and indexes it.
+
+        Concurrent callers for the same organization share one in-flight request.
+
+        Args:
+            org_id (str): The organization id.
+
+        Returns:
+            OrgMembers: The indexed members, None if zc_core failed and nothing is cached.
+        """
+        loop = asyncio.get_running_loop()
+        task = self._refresh_tasks.get(org_id)
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = self._refresh_tasks[org_id] = loop.create_task(self._fetch(org_id))
+        return await asyncio.shield(task)
+
+    async def _background_refresh(self, org_id: str) -> None:
+        try:
+            await self.refresh(org_id)
+        except Exception as error:  # pylint: disable=broad-except
+            # keep serving the stale directory, the next lookup will try again
+            print("org directory refresh failed", error)
+
+    async def _get_directory(self, org_id: str) -> Optional[OrgMembers]:
+        directory = self._directories.get(org_id)
+        if directory is not None and directory.age < self.ttl:
+            return directory
+
+        if directory is not None and directory.age < self.ttl + self.stale_ttl:
+            task = self._refresh_tasks.get(org_id)
+            if task is None or task.done():
+                asyncio.get_running_loop().create_task(self._background_refresh(org_id))
+            return directory
+
+        return await self.refresh(org_id)
+
+    async def get_members(self, org_id: str) -> list[dict[str, Any]]:
+        """Gets all members registered in an organization.
+
+        Args:
+            org_id (str): The organization id.
+
+        Returns:
+            list[dict]: The organization's members, empty if none could be fetched.
+        """
+        directory = await self._get_directory(org_id)
+        return directory.members if directory else []
+
+    async def get_member(self, org_id: str, member_id: str) -> dict[str, Any]:
+        """Gets a member of an organization by id.
+
+        Args:
+            org_id (str): The organization id.
+            member_id (str): The member's id.
+
+        Returns:
+            dict: The member's information, empty if the member is not found.
+        """
+        directory = await self._get_directory(org_id)
+        return directory.by_id.get(member_id, {}) if directory else {}
+
+    async def get_members_by_id(
+        self, org_id: str, member_ids: list[str]
+    ) -> dict[str, dict[str, Any]]:
+        """Gets several members of an organization by id.
+
+        Args:
+            org_id (str): The organization id.
+            member_ids (list[str]): The members' ids.
+
+        Returns:
+            dict: The information of every member found, by member id.
+        """
+        directory = await self._get_directory(org_id)
+        if directory is None:
+            return {}
+        return {
+            member_id: directory.by_id[member_id]
+            for member_id in member_ids
+            if member_id in directory.by_id
+        }
+
+    async def get_member_by_email(self, org_id: str, email: str) -> dict[str, Any]:
+        """Gets a member of an organization by email.
+
+        Args:
+            org_id (str): The organization id.
+            email (str): The member's email, compared case insensitively.
+
+        Returns:
+            dict: The member's information, empty if the member is not found.
+        """
+        directory = await self._get_directory(org_id)
+        return directory.by_email.get(email.lower(), {}) if directory else {}
+
+    async def get_member_by_username(
+        self, org_id: str, username: str
+    ) -> dict[str, Any]:
+        """Gets a member of an organization by username.
+
+        Args:
+            org_id (str): The organization id.
+            username (str): The member's `user_name`.
+
+        Returns:
+            dict: The member's information, empty if the member is not found.
+        """
+        directory = await self._get_directory(org_id)
+        return directory.by_username.get(username, {}) if directory else {}
+
+    def invalidate(self, org_id: str) -> None:
+        """Drops the cached directory of an organization."""
+        self._directories.pop(org_id, None)
+        self._refresh_tasks.pop(org_id, None)
+
+    def clear(self) -> None:
+        """Drops every cached directory."""
+        self._directories.clear()
+        self._refresh_tasks.clear()
+
+
+# An instance of OrgDirectory
+# This will be used when importing the class
+org_directory = OrgDirectory()
@@ -1,31 +1,238 @@
-from config.settings import settings
-from utils.db import DataStorage
+import base64
+import binascii
+import json
+from typing import Any, Optional
+
+from fastapi import HTTPException, status
 
 
 async def off_set(page: int, size: int):
     return (page - 1) * size
 
 
-async def page_urls(page: int, size: int, org_id: int, room_id: int, endpoint: str):
+def _encode(values: list[Any]) -> str:
+    key = json.dumps(values, separators=(",", ":"))
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> Any:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError, TypeError) as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        ) from error
+
+
+def encode_cursor(message: dict[str, Any]) -> str:
+    """Builds an opaque cursor pointing at a message.
+
+    Args:
+        message (dict): The message document, it must contain `created_at` and `_id`.
+
+    Returns:
+        str: A url safe token encoding the message's sort key.
+    """
+    return _encode([message["created_at"], message["_id"]])
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    """Reads the sort key out of a cursor built by `encode_cursor`.
+
+    Args:
+        cursor (str): The cursor sent by the client.
+
+    Returns:
+        tuple[str, str]: The `created_at` and `_id` of the message.
+
+    Raises:
+        HTTPException [400]: Invalid cursor
+    """
+    key = _decode(cursor)
+    if (
+        not isinstance(key, list)
+        or len(key) != 2
+        or not all(isinstance(value, str) for value in key)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+    return key[0], key[1]
+
+
+def encode_sync_cursor(changed_at: str, document_id: str) -> str:
+    """Builds the watermark pointing at the last change returned by a sync.
+
+    Args:
+        changed_at (str): The time of the change.
+        document_id (str): The id of the changed or deleted message.
+
+    Returns:
+        str: A url safe token encoding the change's sort key.
+    """
+    return _encode([changed_at, document_id])
+
+
+def decode_sync_cursor(since: str) -> tuple[str, str]:
+    """Reads the sort key out of a watermark built by `encode_sync_cursor`.
+
+    A plain timestamp, such as the `created_at` of a message or a watermark
+    returned before watermarks were cursors, points before every change made
+    at that time.
+
+    Args:
+        since (str): The watermark sent by the client.
+
+    Returns:
+        tuple[str, str]: The time and the message id of the last change seen.
+    """
+    try:
+        key = _decode(since)
+    except HTTPException:
+        return since, ""
+    if (
+        not isinstance(key, list)
+        or len(key) != 2
+        or not all(isinstance(value, str) for value in key)
+    ):
+        return since, ""
+    return key[0], key[1]
+
+
+def encode_member_cursor(member_id: str) -> str:
+    """Builds an opaque cursor pointing at a room member.
+
+    Args:
+        member_id (str): The id of the last member of a page.
+
+    Returns:
+        str: A url safe token encoding the member id.
+    """
+    return _encode([member_id])
+
+
+def decode_member_cursor(cursor: str) -> str:
+    """Reads the member id out of a cursor built by `encode_member_cursor`.
+
+    Args:
+        cursor (str): The cursor sent by the client.
+
+    Returns:
+        str: The id of the last member of the previous page.
+
+    Raises:
+        HTTPException [400]: Invalid cursor
+    """
+    key = _decode(cursor)
+    if not isinstance(key, list) or len(key) != 1 or not isinstance(key[0], str):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+    return key[0]
+
+
+def encode_thread_cursor(remaining: int) -> str:
+    """Builds an opaque cursor pointing at the next page of thread replies.
+
+    Replies are stored newest first and new ones are inserted at the front,
+    so the cursor counts the older replies left from the end of the thread,
+    which does not move when new replies arrive.
+
+    Args:
+        remaining (int): Number of older replies not returned yet.
+
+    Returns:
+        str: A url safe token.
+    """
+    return _encode(["threads", remaining])
+
+
+def decode_thread_cursor(cursor: str) -> int:
+    """Reads the number of replies left out of a cursor built by `encode_thread_cursor`.
+
+    Raises:
+        HTTPException [400]: Invalid cursor
+    """
+    key = _decode(cursor)
+    if (
+        not isinstance(key, list)
+        or len(key) != 2
+        or key[0] != "threads"
+        or not isinstance(key[1], int)
+        or key[1] < 1
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+    return key[1]
+
+
+def keyset_query(cursor: str, older: bool) -> dict[str, Any]:
+    """Builds the filter selecting the messages on one side of a cursor.
+
+    Messages are ordered on (created_at, _id) so that messages sharing a
+    timestamp are neither skipped nor repeated across pages.
+
+    Args:
+        cursor (str): The cursor of the boundary message.
+        older (bool): True to select older messages, False for newer ones.
 
-    DB = DataStorage(org_id)
-    messages = await DB.read(settings.MESSAGE_COLLECTION, query={"room_id": room_id})
+    Returns:
+        dict: A raw query fragment.
+    """
+    created_at, message_id = decode_cursor(cursor)
+    operator = "$lt" if older else "$gt"
+    return {
+        "$or": [
+            {"created_at": {operator: created_at}},
+            {"created_at": created_at, "_id": {operator: message_id}},
+        ]
+    }
 
-    if messages is None:
-        total_count = 0
-    else:
-        total_count = len(messages)
 
-    paging = {}
+def page_urls(
+    endpoint: str,
+    size: int,
+    messages: list[dict[str, Any]],
+    has_older: bool,
+    has_newer: bool,
+    page: Optional[int] = None,
+) -> dict[str, Optional[str]]:
+    """Builds the links to the pages around a page of messages.
 
-    if (size + await off_set(page, size)) >= total_count:
-        paging["next"] = None
-    else:
-        paging["next"] = f"{endpoint}?page={page+1}&size={size}"
+    Links keep using page numbers when the page was requested by number, and
+    point at cursors otherwise. The cursors are always returned.
 
-    if page > 1:
-        paging["previous"] = f"{endpoint}?page={page-1}&size={size}"
-    else:
-        paging["previous"] = None
+    Args:
+        endpoint (str): The path of the paginated endpoint.
+        size (int): The page size.
+        messages (list[dict]): The page of messages, newest first.
+        has_older (bool): Whether older messages exist.
+        has_newer (bool): Whether newer messages exist.
+        page (int, optional): The page number, None for cursor pagination.
 
-    return paging, total_count
+    Returns:
+        dict: The `next` (older) and `previous` (newer) links and their cursors.
+    """
+    paging = {
+        "next": None,
+        "previous": None,
+        "next_cursor": None,
+        "previous_cursor": None,
+    }
+    if messages and has_older:
+        paging["next_cursor"] = encode_cursor(messages[-1])
+        paging["next"] = (
+            f"{endpoint}?page={page + 1}&size={size}"
+            if page
+            else f"{endpoint}?before={paging['next_cursor']}&size={size}"
+        )
+    if messages and has_newer:
+        paging["previous_cursor"] = encode_cursor(messages[0])
+        paging["previous"] = (
+            f"{endpoint}?page={page - 1}&size={size}"
+            if page
+            else f"{endpoint}?after={paging['previous_cursor']}&size={size}"
+        )
+    return paging
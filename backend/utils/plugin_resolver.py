@@ -0,0 +1,165 @@
+import asyncio
+import time
+from typing import Any, Optional
+
+import requests
+from config.settings import settings
+from fastapi import status
+from fastapi.exceptions import HTTPException
+from utils.http_client import http_client
+
+
+class PluginResolver:
+    """Resolves the zc_messaging plugin id once for the whole process.
+
+    The plugin id is looked up in the plugins marketplace on zc_core when the
+    application starts and is kept for `settings.PLUGIN_ID_TTL` seconds. After the
+    TTL elapses the cached id is still served while a single background refresh
+    replaces it, so constructing `DataStorage` or `FileStorage` objects never waits
+    on the network once the id is known.
+
+    Attributes:
+        ttl (int): Number of seconds a resolved plugin id is considered fresh.
+    """
+
+    def __init__(self, ttl: int = settings.PLUGIN_ID_TTL) -> None:
+        self.ttl = ttl
+        self._plugin_id: Optional[str] = None
+        self._fetched_at: float = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def marketplace_api(self) -> str:
+        """Zc_core API endpoint listing the plugins in the marketplace."""
+        return f"{settings.BASE_URL}/marketplace/plugins"
+
+    @staticmethod
+    def _find_plugin_id(payload: dict[str, Any]) -> str:
+        """Picks the zc_messaging plugin id out of the marketplace response.
+
+        Args:
+            payload (dict): The JSON body returned by the marketplace endpoint.
+
+        Returns:
+            str: The zc_messaging plugin id.
+        """
+        plugins = payload.get("data").get("plugins")
+        plugin = next(
+            item for item in plugins if settings.PLUGIN_KEY in item["template_url"]
+        )
+        return plugin.get("id")
+
+    def _store(self, plugin_id: str) -> str:
+        self._plugin_id = plugin_id
+        self._fetched_at = time.monotonic()
+        return plugin_id
+
+    def is_stale(self) -> bool:
+        """Checks if the cached plugin id is older than the configured TTL."""
+        return time.monotonic() - self._fetched_at >= self.ttl
+
+    def clear(self) -> None:
+        """Forgets the cached plugin id so that the next lookup resolves it again."""
+        self._plugin_id = None
+        self._fetched_at = 0.0
+        self._refresh_task = None
+
+    def _fetch_sync(self) -> str:
+        """Fetches the plugin id with a blocking request.
+
+        Only used when no plugin id has been resolved yet, e.g. when the
+        startup refresh failed or the module is used outside of the application.
+
+        Raises:
+            HTTPException: {"detail": "Request Timeout"}
+        """
+        try:
+            response = requests.get(url=self.marketplace_api)
+            response.raise_for_status()
+        except requests.Timeout as timed_out_error:
+            raise HTTPException(
+                status_code=status.HTTP_408_REQUEST_TIMEOUT,
+                detail=timed_out_error.response,
+            ) from timed_out_error
+        except requests.HTTPError as http_error:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail=http_error.response
+            ) from http_error
+        except requests.ConnectionError as connection_error:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=connection_error.response,
+            ) from connection_error
+        except requests.RequestException as exception:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=exception.response,
+            ) from exception
+
+        return self._store(self._find_plugin_id(response.json()))
+
+    async def _fetch(self) -> str:
+        """Fetches the plugin id without blocking the event loop."""
+        response = await http_client.get(url=self.marketplace_api)
+        response.raise_for_status()
+        return self._store(self._find_plugin_id(response.json()))
+
+    async def refresh(self) -> str:
+        """Resolves the plugin id from zc_core and caches it.
+
+        Concurrent callers share the same in-flight request, so only one
+        refresh ever runs at a time.
+
+        Returns:
+            str: The freshly resolved plugin id.
+
+        Raises:
+            httpx.HTTPError: Unable to get the plugins from zc_core
+        """
+        loop = asyncio.get_running_loop()
+        task = self._refresh_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = self._refresh_task = loop.create_task(self._fetch())
+        return await asyncio.shield(task)
+
+    async def _background_refresh(self) -> None:
+        try:
+            await self.refresh()
+        except Exception as error:  # pylint: disable=broad-except
+            # keep serving the stale id, the next lookup will try again
+            print("plugin id refresh failed", error)
+
+    def _schedule_refresh(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no event loop to refresh on, keep serving the cached id
+
+        task = self._refresh_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            loop.create_task(self._background_refresh())
+
+    def get_plugin_id(self) -> str:
+        """Gets the zc_messaging plugin id without touching the network.
+
+        A stale id is returned as is while a refresh runs in the background.
+        The network is only hit synchronously when nothing has been resolved yet.
+
+        Returns:
+            str: The zc_messaging plugin id.
+
+        Raises:
+            HTTPException: Unable to get the plugins from zc_core
+        """
+        if self._plugin_id is None:
+            return self._fetch_sync()
+
+        if self.is_stale():
+            self._schedule_refresh()
+
+        return self._plugin_id
+
+
+# An instance of PluginResolver
+# This will be used when importing the class
+plugin_resolver = PluginResolver()
@@ -0,0 +1,356 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Optional
+
+from config.settings import settings
+from fastapi import HTTPException, status
+from utils.centrifugo import Events, centrifugo_client
+from utils.db import DataStorage
+from utils.message_buffer import message_buffer
+
+
+async def _update_message(
+    DB: DataStorage,
+    room_id: str,
+    message_id: str,
+    query: dict[str, Any],
+    raw_query: dict[str, Any],
+) -> bool:
+    # a reacted message is a change that /sync must return
+    raw_query = {
+        **raw_query,
+        "$set": {**raw_query.get("$set", {}), "updated_at": str(datetime.utcnow())},
+    }
+    response = await DB.update(
+        collection_name=settings.MESSAGE_COLLECTION,
+        raw_query=raw_query,
+        query={"_id": message_id, "room_id": room_id, **query},
+    )
+    if not response or response.get("status_code"):
+        raise HTTPException(
+            status_code=status.HTTP_424_FAILED_DEPENDENCY,
+            detail="Reaction not saved",
+        )
+    return bool(response.get("data", {}).get("matched_documents"))
+
+
+async def add_reactions(
+    DB: DataStorage,
+    room_id: str,
+    message_id: str,
+    name: str,
+    emoji: str,
+    members: list[str],
+) -> bool:
+    """Adds the reactions of several members with one emoji to a message.
+
+    All the members are added and counted in one update, unless some of them
+    had already reacted with the emoji, in which case they are added one by
+    one so that nobody is counted twice.
+
+    Args:
+        DB (DataStorage): The organization's storage.
+        room_id (str): The id of the room the message was sent in.
+        message_id (str): The id of the message.
+        name (str): The name of the emoji.
+        emoji (str): The emoji.
+        members (list[str]): The ids of the members reacting.
+
+    Returns:
+        bool: Whether the message was updated.
+
+    Raises:
+        HTTPException [424]: Reaction not saved.
+    """
+    if await _update_message(
+        DB,
+        room_id,
+        message_id,
+        {"emojis": {"$elemMatch": {"name": name, "reactedUsersId": {"$nin": members}}}},
+        {
+            "$addToSet": {"emojis.$.reactedUsersId": {"$each": members}},
+            "$inc": {"emojis.$.count": len(members)},
+        },
+    ):
+        return True
+
+    if await _update_message(
+        DB,
+        room_id,
+        message_id,
+        {"emojis.name": {"$ne": name}},
+        {
+            "$push": {
+                "emojis": {
+                    "name": name,
+                    "count": len(members),
+                    "emoji": emoji,
+                    "reactedUsersId": members,
+                }
+            }
+        },
+    ):
+        return True
+
+    matched = await asyncio.gather(
+        *(
+            _update_message(
+                DB,
+                room_id,
+                message_id,
+                {
+                    "emojis": {
+                        "$elemMatch": {"name": name, "reactedUsersId": {"$ne": member}}
+                    }
+                },
+                {
+                    "$addToSet": {"emojis.$.reactedUsersId": member},
+                    "$inc": {"emojis.$.count": 1},
+                },
+            )
+            for member in members
+        )
+    )
+    return any(matched)
+
+
+async def remove_reactions(
+    DB: DataStorage,
+    room_id: str,
+    message_id: str,
+    name: str,
+    members: list[str],
+) -> bool:
+    """Removes the reactions of several members with one emoji from a message.
+
+    All the members are removed in one update, unless some of them had not
+    reacted with the emoji, in which case they are removed one by one. The emoji
+    is dropped from the message once nobody reacts with it anymore.
+
+    Args:
+        DB (DataStorage): The organization's storage.
+        room_id (str): The id of the room the message was sent in.
+        message_id (str): The id of the message.
+        name (str): The name of the emoji.
+        members (list[str]): The ids of the members removing their reaction.
+
+    Returns:
+        bool: Whether the message was updated.
+
+    Raises:
+        HTTPException [424]: Reaction not saved.
+    """
+    matched = await _update_message(
+        DB,
+        room_id,
+        message_id,
+        {"emojis": {"$elemMatch": {"name": name, "reactedUsersId": {"$all": members}}}},
+        {
+            "$pull": {"emojis.$.reactedUsersId": {"$in": members}},
+            "$inc": {"emojis.$.count": -len(members)},
+        },
+    )
+
+    if not matched:
+        removed = await asyncio.gather(
+            *(
+                _update_message(
+                    DB,
+                    room_id,
+                    message_id,
+                    {
+                        "emojis": {
+                            "$elemMatch": {"name": name, "reactedUsersId": member}
+                        }
+                    },
+                    {
+                        "$pull": {"emojis.$.reactedUsersId": member},
+                        "$inc": {"emojis.$.count": -1},
+                    },
+                )
+                for member in members
+            )
+        )
+        matched = any(removed)
+
+    if matched:
+        await _update_message(
+            DB,
+            room_id,
+            message_id,
+            {"emojis": {"$elemMatch": {"name": name, "count": {"$lte": 0}}}},
+            {"$pull": {"emojis": {"name": name, "count": {"$lte": 0}}}},
+        )
+    return matched
+
+
+async def save_reactions(
+    org_id: str, room_id: str, message_id: str, reactions: dict[str, dict[str, Any]]
+) -> list[dict[str, Any]]:
+    """Writes the reactions sent to a message within a window.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The id of the room the message was sent in.
+        message_id (str): The id of the message.
+        reactions (dict): The `emoji` of every emoji name and whether each of the
+            `members` who reacted with it added (True) or removed (False) it.
+
+    Returns:
+        list[dict]: The `name` and `emoji` of every emoji, with the ids of the
+        members who `added` and `removed` it.
+
+    Raises:
+        HTTPException [404]: Message not found.
+        HTTPException [424]: Reaction not saved.
+    """
+    DB = DataStorage(org_id)
+    changes = [
+        {
+            "name": name,
+            "emoji": reaction["emoji"],
+            "added": [member for member, added in reaction["members"].items() if added],
+            "removed": [
+                member for member, added in reaction["members"].items() if not added
+            ],
+        }
+        for name, reaction in reactions.items()
+    ]
+
+    async def save(change: dict[str, Any]) -> bool:
+        added = removed = False
+        if change["added"]:
+            added = await add_reactions(
+                DB,
+                room_id,
+                message_id,
+                change["name"],
+                change["emoji"],
+                change["added"],
+            )
+        if change["removed"]:
+            removed = await remove_reactions(
+                DB, room_id, message_id, change["name"], change["removed"]
+            )
+        return added or removed
+
+    matched = await asyncio.gather(*(save(change) for change in changes))
+
+    if not any(matched):
+        # nothing changed, either the reactions were already applied
+        # or the message does not exist
+        response = await DB.read(
+            settings.MESSAGE_COLLECTION,
+            query={"_id": message_id, "room_id": room_id},
+            options={"projection": {"_id": 1}},
+        )
+        if response is not None and "status_code" in response:
+            raise HTTPException(
+                status_code=status.HTTP_424_FAILED_DEPENDENCY,
+                detail="Reaction not saved",
+            )
+        if not response:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Message not found"
+            )
+
+    for change in changes:
+        message_buffer.update_reactions(org_id, room_id, message_id, change)
+    return changes
+
+
+class ReactionBatcher:
+    """Coalesces the reactions sent to the messages of a room.
+
+    Reactions are collected for `window` seconds from the first one, then the
+    reactions of every message are written together and published to the room
+    in a single event. When a member adds and removes the same reaction within
+    the window, only the last choice is written.
+
+    Attributes:
+        window (float): Seconds reactions are collected for before being written.
+    """
+
+    def __init__(self, window: float = settings.REACTION_WINDOW) -> None:
+        self.window = window
+        self._pending: dict[tuple[str, str], dict[str, Any]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def react(
+        self,
+        org_id: str,
+        room_id: str,
+        message_id: str,
+        member_id: str,
+        name: str,
+        emoji: Optional[str],
+        added: bool,
+    ) -> None:
+        """Adds or removes a member's reaction to a message.
+
+        Returns once the reactions of the window are written.
+
+        Args:
+            org_id (str): The organization id.
+            room_id (str): The id of the room the message was sent in.
+            message_id (str): The id of the message.
+            member_id (str): The id of the member reacting.
+            name (str): The name of the emoji.
+            emoji (str): The emoji, only needed to add the reaction.
+            added (bool): True to add the reaction, False to remove it.
+
+        Raises:
+            HTTPException [404]: Message not found.
+            HTTPException [424]: Reaction not saved.
+        """
+        key = (org_id, room_id)
+        messages = self._pending.get(key)
+        if messages is None:
+            messages = self._pending[key] = {}
+            task = asyncio.create_task(self._flush_later(key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        batch = messages.setdefault(message_id, {"reactions": {}, "waiters": []})
+        reaction = batch["reactions"].setdefault(name, {"emoji": None, "members": {}})
+        reaction["emoji"] = emoji or reaction["emoji"]
+        reaction["members"][member_id] = added
+
+        waiter = asyncio.get_running_loop().create_future()
+        batch["waiters"].append(waiter)
+        await waiter
+
+    async def _flush_later(self, key: tuple[str, str]) -> None:
+        await asyncio.sleep(self.window)
+        messages = self._pending.pop(key)
+        org_id, room_id = key
+
+        results = await asyncio.gather(
+            *(
+                save_reactions(org_id, room_id, message_id, batch["reactions"])
+                for message_id, batch in messages.items()
+            ),
+            return_exceptions=True,
+        )
+
+        published = []
+        for (message_id, batch), result in zip(messages.items(), results):
+            for waiter in batch["waiters"]:
+                if waiter.done():
+                    continue
+                if isinstance(result, BaseException):
+                    waiter.set_exception(result)
+                else:
+                    waiter.set_result(None)
+            if not isinstance(result, BaseException):
+                published.append({"_id": message_id, "reactions": result})
+
+        if published:
+            await centrifugo_client.publish(
+                room_id, Events.MESSAGE_REACTION, {"messages": published}
+            )
+
+
+# An instance of ReactionBatcher
+# This will be used when importing the class
+reaction_batcher = ReactionBatcher()
@@ -0,0 +1,344 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from config.settings import settings
+from utils.db import DataStorage
+
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+def _now() -> str:
+    return str(datetime.utcnow())
+
+
+def _lease_until() -> str:
+    return str(datetime.utcnow() + timedelta(seconds=settings.ROOM_DELETION_LEASE))
+
+
+async def get_room_deletion(org_id: str, room_id: str) -> Optional[dict[str, Any]]:
+    """Reads the deletion job of a room.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The id of the deleted room.
+
+    Returns:
+        dict: The job, empty if the room has none, None if zc_core failed.
+
+        {
+            "room_id": "61e59de865934b58b8e5d1c8",
+            "status": "running",
+            "total_messages": 5400,
+            "deleted_messages": 1200,
+            "created_at": "2022-01-18 09:05:32.479911",
+            "updated_at": "2022-01-18 09:05:41.031154",
+            "lease_until": "2022-01-18 09:06:41.031154",
+            "error": null
+        }
+    """
+    response = await DataStorage(org_id).read(
+        settings.ROOM_DELETION_COLLECTION,
+        query={"room_id": room_id},
+        options={"projection": {"_id": 0}},
+    )
+    if response is None:
+        return {}
+    if "status_code" in response:
+        return None
+    if isinstance(response, list):
+        return response[0] if response else {}
+    return response
+
+
+async def delete_message_batch(DB: DataStorage, room_id: str) -> tuple[int, bool]:
+    """Deletes the oldest messages left in a deleted room, with their thread replies.
+
+    Args:
+        DB (DataStorage): The organization's storage.
+        room_id (str): The id of the deleted room.
+
+    Returns:
+        tuple[int, bool]: The number of messages deleted and whether the whole
+        batch was deleted.
+    """
+    messages = await DB.read(
+        settings.MESSAGE_COLLECTION,
+        query={"room_id": room_id},
+        options={
+            "limit": settings.ROOM_DELETION_BATCH_SIZE,
+            "sort": {"created_at": 1},
+            "projection": {"_id": 1, "threads_spilled": 1},
+        },
+    )
+    if messages is None:
+        return 0, True
+    if "status_code" in messages:
+        return 0, False
+    if isinstance(messages, dict):
+        messages = [messages]
+
+    spilled = [message["_id"] for message in messages if message.get("threads_spilled")]
+    if spilled:
+        replies = await DB.read(
+            settings.THREAD_REPLIES_COLLECTION,
+            raw_query={"parent_id": {"$in": spilled}, "room_id": room_id},
+            options={"projection": {"_id": 1}},
+        )
+        if replies is not None and "status_code" in replies:
+            return 0, False
+        if isinstance(replies, dict):
+            replies = [replies]
+        reply_ids = [reply["_id"] for reply in replies or []]
+        deleted = await DB.delete_many(
+            settings.THREAD_REPLIES_COLLECTION,
+            reply_ids,
+            chunk_size=settings.ROOM_DELETION_CHUNK_SIZE,
+        )
+        if len(deleted) < len(reply_ids):
+            return 0, False
+
+    message_ids = [message["_id"] for message in messages]
+    deleted = await DB.delete_many(
+        settings.MESSAGE_COLLECTION,
+        message_ids,
+        chunk_size=settings.ROOM_DELETION_CHUNK_SIZE,
+    )
+    return len(deleted), len(deleted) == len(message_ids)
+
+
+async def delete_member_batch(DB: DataStorage, room_id: str) -> tuple[int, bool]:
+    """Deletes memberships left in the room members collection by a deleted room.
+
+    Args:
+        DB (DataStorage): The organization's storage.
+        room_id (str): The id of the deleted room.
+
+    Returns:
+        tuple[int, bool]: The number of memberships deleted and whether the
+        whole batch was deleted.
+    """
+    memberships = await DB.read(
+        settings.ROOM_MEMBERS_COLLECTION,
+        query={"room_id": room_id},
+        options={"limit": settings.ROOM_DELETION_BATCH_SIZE, "projection": {"_id": 1}},
+    )
+    if memberships is None:
+        return 0, True
+    if "status_code" in memberships:
+        return 0, False
+    if isinstance(memberships, dict):
+        memberships = [memberships]
+
+    membership_ids = [membership["_id"] for membership in memberships]
+    deleted = await DB.delete_many(
+        settings.ROOM_MEMBERS_COLLECTION,
+        membership_ids,
+        chunk_size=settings.ROOM_DELETION_CHUNK_SIZE,
+    )
+    return len(deleted), len(deleted) == len(membership_ids)
+
+
+class RoomDeletionJobs:
+    """Deletes the messages of deleted rooms in the background.
+
+    Every deleted room gets a job document recording its progress. The job
+    deletes the room's messages, then its spilled members, in bounded batches
+    and checkpoints the number of messages deleted after every batch, so a job
+    interrupted by a failure or a restart resumes with what is left. A job is
+    only run by the process holding its lease, which is renewed after every
+    batch, and is only completed once two reads `ROOM_DELETION_CONFIRM_DELAY`
+    seconds apart found nothing left to delete.
+
+    Jobs are throttled so that they never keep zc_core busy for more than
+    `ROOM_DELETION_DUTY_CYCLE` of the time, and at most
+    `ROOM_DELETION_CONCURRENCY` jobs run at once in a process. A job idles for
+    at most a quarter of its lease between batches, so slow batches use more
+    than their share rather than let the lease expire.
+    """
+
+    def __init__(self) -> None:
+        self._tasks: dict[tuple[str, str], asyncio.Task] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def create(
+        self, org_id: str, room_id: str, total_messages: Optional[int] = None
+    ) -> Optional[dict[str, Any]]:
+        """Saves the deletion job of a room, without starting it.
+
+        The job is saved before the room is deleted, so that the messages of a
+        deleted room always have a job to delete them.
+
+        Args:
+            org_id (str): The organization id.
+            room_id (str): The id of the room to delete.
+            total_messages (int, optional): The number of messages of the room,
+                if known.
+
+        Returns:
+            dict: The job, with the `_id` of its document, None if it could not
+            be saved.
+        """
+        now = _now()
+        job = {
+            "room_id": room_id,
+            "status": PENDING,
+            "total_messages": total_messages,
+            "deleted_messages": 0,
+            "created_at": now,
+            "updated_at": now,
+            "lease_until": None,
+            "error": None,
+        }
+        response = await DataStorage(org_id).write(
+            settings.ROOM_DELETION_COLLECTION, job
+        )
+        if not response or response.get("status_code"):
+            return None
+        return {"_id": response.get("data", {}).get("object_id"), **job}
+
+    async def discard(self, org_id: str, job: dict[str, Any]) -> None:
+        """Deletes a job saved for a room that could not be deleted.
+
+        Args:
+            org_id (str): The organization id.
+            job (dict): The job returned by `create`.
+        """
+        if job.get("_id"):
+            await DataStorage(org_id).delete(
+                settings.ROOM_DELETION_COLLECTION, job["_id"]
+            )
+
+    def start(self, org_id: str, room_id: str) -> None:
+        """Runs the deletion job of a room, unless it already runs in this process.
+
+        Args:
+            org_id (str): The organization id.
+            room_id (str): The id of the deleted room.
+        """
+        key = (org_id, room_id)
+        if key in self._tasks:
+            return
+
+        task = asyncio.get_running_loop().create_task(self._run(org_id, room_id))
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+
+    async def progress(self, org_id: str, room_id: str) -> Optional[dict[str, Any]]:
+        """Gets the progress of a room's deletion job.
+
+        A job left unfinished by a process that stopped, or that failed, is
+        resumed once its lease expired.
+
+        Args:
+            org_id (str): The organization id.
+            room_id (str): The id of the deleted room.
+
+        Returns:
+            dict: The job, empty if the room has none, None if zc_core failed.
+        """
+        job = await get_room_deletion(org_id, room_id)
+        if (
+            job
+            and job["status"] != COMPLETED
+            and (job.get("lease_until") or "") < _now()
+        ):
+            self.start(org_id, room_id)
+        return job
+
+    async def _claim(self, DB: DataStorage, room_id: str) -> bool:
+        response = await DB.update(
+            collection_name=settings.ROOM_DELETION_COLLECTION,
+            raw_query={
+                "$set": {
+                    "status": RUNNING,
+                    "lease_until": _lease_until(),
+                    "updated_at": _now(),
+                    "error": None,
+                }
+            },
+            query={
+                "room_id": room_id,
+                "status": {"$ne": COMPLETED},
+                "$or": [{"lease_until": None}, {"lease_until": {"$lt": _now()}}],
+            },
+        )
+        if not response or response.get("status_code"):
+            return False
+        return bool(response.get("data", {}).get("matched_documents"))
+
+    async def _checkpoint(
+        self, DB: DataStorage, room_id: str, deleted: int, **fields: Any
+    ) -> None:
+        await DB.update(
+            collection_name=settings.ROOM_DELETION_COLLECTION,
+            raw_query={
+                "$set": {"updated_at": _now(), **fields},
+                "$inc": {"deleted_messages": deleted},
+            },
+            query={"room_id": room_id},
+        )
+
+    async def _run(self, org_id: str, room_id: str) -> None:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(settings.ROOM_DELETION_CONCURRENCY)
+
+        DB = DataStorage(org_id)
+        async with self._slots:
+            if not await self._claim(DB, room_id):
+                return
+
+            confirming = False
+            while True:
+                started = time.monotonic()
+                deleted, complete = await delete_message_batch(DB, room_id)
+                removed = 0
+                if complete and not deleted:
+                    # the members of a spilled channel go once its messages are gone
+                    removed, complete = await delete_member_batch(DB, room_id)
+                if not complete:
+                    await self._checkpoint(
+                        DB,
+                        room_id,
+                        deleted,
+                        status=FAILED,
+                        lease_until=None,
+                        error="zc_core failed to delete a batch of messages",
+                    )
+                    return
+                if not deleted and not removed:
+                    # zc_core reads return None both when nothing is left and
+                    # when they fail, so the room only counts as empty once a
+                    # second read after a pause agrees
+                    if confirming:
+                        await self._checkpoint(
+                            DB, room_id, 0, status=COMPLETED, lease_until=None
+                        )
+                        return
+                    confirming = True
+                    await self._checkpoint(DB, room_id, 0, lease_until=_lease_until())
+                    await asyncio.sleep(settings.ROOM_DELETION_CONFIRM_DELAY)
+                    continue
+
+                confirming = False
+                await self._checkpoint(DB, room_id, deleted, lease_until=_lease_until())
+
+                # stay idle long enough to only use a share of zc_core, but
+                # never so long that the lease runs out before the next batch
+                busy = time.monotonic() - started
+                duty_cycle = settings.ROOM_DELETION_DUTY_CYCLE
+                await asyncio.sleep(
+                    min(
+                        busy * (1 - duty_cycle) / duty_cycle,
+                        settings.ROOM_DELETION_LEASE / 4,
+                    )
+                )
+
+
+# An instance of RoomDeletionJobs
+# This will be used when importing the class
+room_deletion_jobs = RoomDeletionJobs()
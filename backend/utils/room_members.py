@@ -0,0 +1,215 @@
+from typing import Any, Optional
+
+from config.settings import settings
+from utils.db import DataStorage
+
+# The members of a channel stay embedded in the room document until the
+# channel has ROOM_MEMBERS_SPILL_THRESHOLD of them. The members are then
+# spilled: they move to the room members collection, one document per member
+# carrying its `room_id` and `member_id`, and the room is flagged with
+# `members_spilled` and keeps a `member_count`. The collection is read by
+# (room_id, member_id) and by member_id, and needs a unique index on the first.
+
+MEMBER_PROJECTION = {"_id": 0, "room_id": 0}
+MEMBER_FIELDS = ("role", "starred", "closed")
+
+
+def _as_list(response: Any) -> Optional[list[dict[str, Any]]]:
+    if response is None:
+        return []
+    if "status_code" in response:
+        return None
+    if isinstance(response, dict):
+        return [response]
+    return response
+
+
+def _by_member(memberships: list[dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    return {
+        membership["member_id"]: {
+            field: membership.get(field) for field in MEMBER_FIELDS
+        }
+        for membership in memberships
+    }
+
+
+async def get_memberships(
+    org_id: str, room_id: str, member_ids: list[str]
+) -> Optional[dict[str, dict[str, Any]]]:
+    """Reads the membership of some members of a spilled room.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The room id.
+        member_ids (list[str]): The ids of the members.
+
+    Returns:
+        dict: The role, starred and closed flags of the members who belong to
+        the room, by member id. None if zc_core failed.
+    """
+    memberships = _as_list(
+        await DataStorage(org_id).read(
+            settings.ROOM_MEMBERS_COLLECTION,
+            raw_query={"room_id": room_id, "member_id": {"$in": member_ids}},
+            options={"projection": MEMBER_PROJECTION},
+        )
+    )
+    if memberships is None:
+        return None
+    return _by_member(memberships)
+
+
+async def get_all_memberships(
+    org_id: str, room_id: str
+) -> Optional[dict[str, dict[str, Any]]]:
+    """Reads every membership of a spilled room.
+
+    Returns:
+        dict: The flags of every member of the room, by member id. None if
+        zc_core failed.
+    """
+    memberships = _as_list(
+        await DataStorage(org_id).read(
+            settings.ROOM_MEMBERS_COLLECTION,
+            query={"room_id": room_id},
+            options={"projection": MEMBER_PROJECTION},
+        )
+    )
+    if memberships is None:
+        return None
+    return _by_member(memberships)
+
+
+async def get_membership_page(
+    org_id: str,
+    room_id: str,
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    role: Optional[str] = None,
+) -> Optional[tuple[dict[str, dict[str, Any]], bool]]:
+    """Reads a page of the memberships of a spilled room, ordered by member id.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The room id.
+        limit (int, optional): The size of the page, None for every membership.
+        after (str, optional): Only read the members with a greater id.
+        role (str, optional): Only read the members with this role.
+
+    Returns:
+        tuple[dict, bool]: The flags of the members of the page, by member id,
+        and whether more members follow. None if zc_core failed.
+    """
+    query: dict[str, Any] = {"room_id": room_id}
+    if after is not None:
+        query["member_id"] = {"$gt": after}
+    if role is not None:
+        query["role"] = role
+
+    options: dict[str, Any] = {
+        "sort": {"member_id": 1},
+        "projection": MEMBER_PROJECTION,
+    }
+    if limit is not None:
+        # one more membership tells whether another page follows
+        options["limit"] = limit + 1
+
+    memberships = _as_list(
+        await DataStorage(org_id).read(
+            settings.ROOM_MEMBERS_COLLECTION, raw_query=query, options=options
+        )
+    )
+    if memberships is None:
+        return None
+    has_more = limit is not None and len(memberships) > limit
+    return _by_member(memberships[:limit]), has_more
+
+
+async def get_member_memberships(
+    org_id: str, member_id: str
+) -> Optional[list[dict[str, Any]]]:
+    """Reads the memberships of a member in every spilled room.
+
+    Returns:
+        list[dict]: The `room_id` and flags of every membership. None if zc_core
+        failed.
+    """
+    return _as_list(
+        await DataStorage(org_id).read(
+            settings.ROOM_MEMBERS_COLLECTION,
+            query={"member_id": member_id},
+            options={"projection": {"_id": 0}},
+        )
+    )
+
+
+async def save_memberships(
+    org_id: str, room_id: str, members: dict[str, Optional[dict[str, Any]]]
+) -> Optional[tuple[int, int]]:
+    """Writes membership changes to the room members collection.
+
+    Members are updated in place, written if they were not members yet, and
+    deleted when their change is None. A member written concurrently by another
+    request is updated instead, and only counted once.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The room id.
+        members (dict): The fields to write to every changed member, by member
+            id, None for the members to remove.
+
+    Returns:
+        tuple[int, int]: The number of members changed and the change of the
+        room's member count. None if zc_core failed.
+    """
+    DB = DataStorage(org_id)
+    changed = count = 0
+
+    async def set_member(member_id: str, member: dict[str, Any]) -> Optional[bool]:
+        response = await DB.update(
+            settings.ROOM_MEMBERS_COLLECTION,
+            raw_query={"$set": member},
+            query={"room_id": room_id, "member_id": member_id},
+        )
+        if not response or response.get("status_code"):
+            return None
+        return bool(response.get("data", {}).get("matched_documents"))
+
+    for member_id, member in members.items():
+        if member is None:
+            continue
+        matched = await set_member(member_id, member)
+        if matched is None:
+            return None
+        if not matched:
+            response = await DB.write(
+                settings.ROOM_MEMBERS_COLLECTION,
+                {"room_id": room_id, "member_id": member_id, **member},
+            )
+            if response and not response.get("status_code"):
+                count += 1
+            elif not await set_member(member_id, member):
+                # the write is only rejected by the unique index if a concurrent
+                # write added the member first, whose flags are then overwritten
+                return None
+        changed += 1
+
+    removed = [member_id for member_id, member in members.items() if member is None]
+    if removed:
+        memberships = _as_list(
+            await DB.read(
+                settings.ROOM_MEMBERS_COLLECTION,
+                raw_query={"room_id": room_id, "member_id": {"$in": removed}},
+                options={"projection": {"_id": 1}},
+            )
+        )
+        if memberships is None:
+            return None
+        document_ids = [membership["_id"] for membership in memberships]
+        deleted = await DB.delete_many(settings.ROOM_MEMBERS_COLLECTION, document_ids)
+        changed += len(deleted)
+        count -= len(deleted)
+        if len(deleted) < len(document_ids):
+            return None
+
+    return changed, count
@@ -1,13 +1,309 @@
+import asyncio
+import copy
+import weakref
+from datetime import datetime
 from typing import Any, Optional
 
 from config.settings import settings
+from fastapi import HTTPException, status
+from utils.cache import LRUCache
 from utils.db import DataStorage
+from utils.dm_index import dm_index
+from utils.member_rooms import MEMBER_FLAGS, member_rooms
+from utils.message_buffer import message_buffer
+from utils.room_members import (get_all_memberships, get_membership_page,
+                                get_memberships, save_memberships)
 
 DEFAULT_DM_IMG = (
     "https://cdn.iconscout.com/icon/free/png-256/"
     "account-avatar-profile-human-man-user-30448.png"
 )
 
+# Read-through cache of room documents keyed by (org_id, room_id).
+# Room write paths patch or invalidate their entry so that reads stay consistent.
+room_cache = LRUCache(maxsize=settings.ROOM_CACHE_SIZE)
+
+# Per-room locks serializing sequence number allocation within this process.
+_seq_locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
+
+def cache_room(org_id: str, room: dict[str, Any]) -> None:
+    """Stores a copy of a room document in the room cache.
+
+    Args:
+        org_id (str): The organization id.
+        room (dict): The room document, it must contain its `_id`.
+    """
+    room_cache.set((org_id, room["_id"]), copy.deepcopy(room))
+
+
+def patch_cached_room(org_id: str, room_id: str, data: dict[str, Any]) -> None:
+    """Applies the fields written to a room document to its cached copy.
+
+    Nothing happens if the room is not cached.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The room id.
+        data (dict): The top level fields that were written to the room document.
+    """
+    room = room_cache.peek((org_id, room_id))
+    if room is not None:
+        room.update(copy.deepcopy(data))
+
+
+def patch_cached_members(
+    org_id: str, room_id: str, members: dict[str, Optional[dict[str, Any]]]
+) -> None:
+    """Applies membership changes to the cached copy of a room.
+
+    Nothing happens if the room is not cached.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The room id.
+        members (dict): The fields written to every changed member, by member id,
+            None for the members removed.
+    """
+    room = room_cache.peek((org_id, room_id))
+    if room is None:
+        return
+
+    room_members = room.setdefault("room_members", {})
+    for member_id, member in members.items():
+        if member is None:
+            room_members.pop(member_id, None)
+        else:
+            room_members[member_id] = {
+                **room_members.get(member_id, {}),
+                **copy.deepcopy(member),
+            }
+
+
+def invalidate_room(org_id: str, room_id: str) -> None:
+    """Drops a room document from the room cache."""
+    room_cache.pop((org_id, room_id))
+
+
+ROOM_COUNTERS = ("message_count", "thread_reply_count", "attachment_count")
+
+
+async def _read_before(
+    org_id: str, collection: str, room_id: str, before: str, projection: dict
+) -> Optional[list[dict[str, Any]]]:
+    response = await DataStorage(org_id).read(
+        collection,
+        query={"room_id": room_id, "created_at": {"$not": {"$gte": before}}},
+        options={"projection": projection},
+    )
+    if response is None:
+        return []
+    if "status_code" in response:
+        return None
+    if isinstance(response, dict):
+        return [response]
+    return response
+
+
+async def count_room_activity(
+    org_id: str, room_id: str, before: str
+) -> Optional[dict[str, int]]:
+    """Counts the messages, thread replies and attachments of a room from scratch.
+
+    This scans the room's messages and the replies of its spilled threads and is
+    only used once per room, to backfill the counters of rooms created before
+    they were maintained. Only what was sent before `before` is counted, later
+    activity is left to `update_room_counters`.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The room id.
+        before (str): The time the counters started to be maintained.
+
+    Returns:
+        dict: The value of every room counter, None if zc_core failed.
+    """
+    messages = await _read_before(
+        org_id,
+        settings.MESSAGE_COLLECTION,
+        room_id,
+        before,
+        {"files": 1, "threads.files": 1, "threads.created_at": 1},
+    )
+    replies = await _read_before(
+        org_id, settings.THREAD_REPLIES_COLLECTION, room_id, before, {"files": 1}
+    )
+    if messages is None or replies is None:
+        return None
+
+    counters = dict.fromkeys(ROOM_COUNTERS, 0)
+    counters["message_count"] = len(messages)
+    for message in messages:
+        counters["attachment_count"] += len(message.get("files") or [])
+        replies.extend(
+            thread
+            for thread in message.get("threads") or []
+            if thread.get("created_at", "") < before
+        )
+    counters["thread_reply_count"] = len(replies)
+    counters["attachment_count"] += sum(
+        len(reply.get("files") or []) for reply in replies
+    )
+    return counters
+
+
+async def get_room_counters(org_id: str, room_id: str) -> Optional[dict[str, int]]:
+    """Gets the message, thread reply and attachment counters of a room.
+
+    The counters are read from the (cached) room document. Rooms that predate the
+    counters are backfilled once: their counters are first set to zero, so that
+    `update_room_counters` applies from then on, and what was sent before is
+    then counted and added with `$inc`.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The room id.
+
+    Returns:
+        dict: The value of every room counter, None if the room does not exist
+        or zc_core failed.
+    """
+    room = await get_room(org_id, room_id)
+    if not room:
+        return None
+
+    if all(counter in room for counter in ROOM_COUNTERS):
+        return {counter: room[counter] for counter in ROOM_COUNTERS}
+
+    db = DataStorage(org_id)
+    started_at = str(datetime.utcnow())
+    zeroed = dict.fromkeys(ROOM_COUNTERS, 0)
+    response = await db.update(
+        settings.ROOM_COLLECTION,
+        raw_query={"$set": zeroed},
+        query={"_id": room_id, "message_count": {"$exists": False}},
+    )
+    if not response or response.get("status_code"):
+        return None
+
+    if not response["data"]["matched_documents"]:
+        # another request started the backfill first
+        invalidate_room(org_id, room_id)
+        room = await get_room(org_id, room_id)
+        if not room or "message_count" not in room:
+            return None
+        return {counter: room.get(counter, 0) for counter in ROOM_COUNTERS}
+
+    patch_cached_room(org_id, room_id, zeroed)
+    counters = await count_room_activity(org_id, room_id, started_at)
+    if counters is None:
+        # nothing was added yet, the next read starts the backfill over
+        await db.update(
+            settings.ROOM_COLLECTION,
+            raw_query={"$unset": dict.fromkeys(ROOM_COUNTERS, "")},
+            query={"_id": room_id},
+        )
+        invalidate_room(org_id, room_id)
+        return None
+
+    response = await db.update(
+        settings.ROOM_COLLECTION,
+        raw_query={"$inc": counters},
+        query={"_id": room_id},
+    )
+    if not response or response.get("status_code"):
+        invalidate_room(org_id, room_id)
+        return None
+
+    room = room_cache.peek((org_id, room_id))
+    if room is not None:
+        for counter, count in counters.items():
+            room[counter] = room.get(counter, 0) + count
+        return {counter: room[counter] for counter in ROOM_COUNTERS}
+    return counters
+
+
+async def update_room_counters(org_id: str, room_id: str, **deltas: int) -> None:
+    """Increments the counters of a room by the given amounts.
+
+    Negative amounts decrement the counters, e.g. when messages are deleted.
+    Rooms whose counters were never backfilled are left alone, their backfill
+    counts everything sent before it started.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The room id.
+        **deltas (int): The amount to add to each counter of `ROOM_COUNTERS`.
+    """
+    deltas = {counter: delta for counter, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    response = await DataStorage(org_id).update(
+        settings.ROOM_COLLECTION,
+        raw_query={"$inc": deltas},
+        query={"_id": room_id, "message_count": {"$exists": True}},
+    )
+    if not response or response.get("status_code"):
+        invalidate_room(org_id, room_id)
+        return
+
+    room = room_cache.peek((org_id, room_id))
+    if room is not None and "message_count" in room:
+        for counter, delta in deltas.items():
+            room[counter] = room.get(counter, 0) + delta
+
+
+async def allocate_message_seq(org_id: str, room_id: str) -> int:
+    """Allocates the next sequence number of a room's messages.
+
+    Sequence numbers are dense and strictly increasing per room. The room's
+    `last_seq` is advanced with a compare-and-set on the room document, so
+    concurrent senders on other processes can never be handed the same number.
+    Senders in this process are queued on a per-room lock and usually succeed
+    on the first write, as the cached room already holds the latest value.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The room id.
+
+    Returns:
+        int: The sequence number of the next message.
+
+    Raises:
+        HTTPException [424]: Unable to allocate a sequence number.
+    """
+    key = (org_id, room_id)
+    lock = _seq_locks.get(key)
+    if lock is None:
+        lock = _seq_locks[key] = asyncio.Lock()
+
+    async with lock:
+        room = await get_room(org_id, room_id)
+        for _ in range(settings.MESSAGE_SEQ_RETRIES):
+            last_seq = room.get("last_seq", 0)
+            query = {"_id": room_id, "last_seq": last_seq}
+            if not last_seq:
+                query = {"_id": room_id, "last_seq": {"$in": [0, None]}}
+
+            response = await DataStorage(org_id).update(
+                settings.ROOM_COLLECTION,
+                raw_query={"$set": {"last_seq": last_seq + 1}},
+                query=query,
+            )
+            if response and (response.get("data") or {}).get("matched_documents"):
+                patch_cached_room(org_id, room_id, {"last_seq": last_seq + 1})
+                return last_seq + 1
+
+            # another process advanced the sequence, read it again
+            invalidate_room(org_id, room_id)
+            room = await get_room(org_id, room_id)
+
+    raise HTTPException(
+        status_code=status.HTTP_424_FAILED_DEPENDENCY,
+        detail="unable to allocate a message sequence number",
+    )
+
 
 async def get_org_rooms(
     org_id: str,
@@ -82,12 +378,96 @@ async def get_org_rooms(
     return response
 
 
-async def get_room(org_id: str, room_id: str) -> dict[str, Any]:
+async def get_rooms(org_id: str, room_ids: list[str]) -> Optional[list[dict[str, Any]]]:
+    """Get several rooms of an organization, reading only the uncached ones.
+
+    Args:
+        org_id (str): The organization id.
+        room_ids (list[str]): The room ids.
+
+    Returns:
+        list[dict]: The rooms found, newest first. None if zc_core failed.
+    """
+    rooms = {}
+    for room_id in room_ids:
+        cached_room = room_cache.get((org_id, room_id))
+        if cached_room is not None:
+            rooms[room_id] = copy.deepcopy(cached_room)
+
+    missing = [room_id for room_id in room_ids if room_id not in rooms]
+    if missing:
+        response = await DataStorage(org_id).read(
+            settings.ROOM_COLLECTION, raw_query={"_id": {"$in": missing}}
+        )
+        if response is not None and "status_code" in response:
+            return None
+        if isinstance(response, dict):
+            response = [response]
+        for room in response or []:
+            cache_room(org_id, room)
+            rooms[room["_id"]] = room
+
+    return sorted(
+        rooms.values(), key=lambda room: room.get("created_at") or "", reverse=True
+    )
+
+
+async def get_member_rooms(
+    org_id: str,
+    member_id: str,
+    room_types: Optional[tuple[str, ...]] = None,
+    starred: Optional[bool] = None,
+) -> Optional[list[dict[str, Any]]]:
+    """Get the rooms a member belongs to from the member's room index.
+
+    Args:
+        org_id (str): The organization id.
+        member_id (str): The member id.
+        room_types (tuple[str], optional): Only return rooms of these types.
+        starred (bool, optional): Only return rooms the member starred, or not.
+
+    Returns:
+        list[dict]: The rooms of the member, newest first. None if zc_core failed.
+    """
+    rooms = await member_rooms.rooms(org_id, member_id)
+    if rooms is None:
+        return None
+
+    room_ids = [
+        room_id
+        for room_id, room in rooms.items()
+        if (room_types is None or room["room_type"] in room_types)
+        and (starred is None or bool(room["starred"]) is starred)
+    ]
+    found = await get_rooms(org_id, room_ids)
+    if found is None:
+        return None
+
+    member_rooms_found = []
+    for room in found:
+        if room.get("members_spilled"):
+            # only the member's own membership is returned for spilled rooms
+            member = {flag: rooms[room["_id"]][flag] for flag in MEMBER_FLAGS}
+            room["room_members"] = {member_id: member}
+        if member_id in room.get("room_members", {}):
+            member_rooms_found.append(room)
+    return member_rooms_found
+
+
+async def get_room(
+    org_id: str, room_id: str, member_ids: Optional[list[str]] = None
+) -> dict[str, Any]:
     """Get information of a specific room of an organization.
 
+    The members of a channel spilled to the room members collection are not
+    returned, the room has a `member_count` and only holds the memberships of
+    `member_ids` in its `room_members`.
+
     Args:
         org_id (str): The organization id.
         room_id (str): The room id.
+        member_ids (list[str], optional): The members whose membership is needed
+            if the room's members are spilled, e.g. the member making the request.
 
     Returns:
         dict: A key value pair of room info mapped according to room schema.
@@ -108,16 +488,58 @@ async def get_room(org_id: str, room_id: str) -> dict[str, Any]:
         }
     """
 
-    db = DataStorage(org_id)
-    query = {"_id": room_id}
-    options = {"sort": {"created_at": -1}}
+    room = room_cache.get((org_id, room_id))
+    if room is not None:
+        room = copy.deepcopy(room)
+    else:
+        db = DataStorage(org_id)
+        query = {"_id": room_id}
+        options = {"sort": {"created_at": -1}}
 
-    response = await db.read(settings.ROOM_COLLECTION, query=query, options=options)
+        room = await db.read(settings.ROOM_COLLECTION, query=query, options=options)
 
-    if not response or "status_code" in response:
-        return {}
+        if not room or "status_code" in room:
+            return {}
 
-    return response
+        room_cache.set((org_id, room_id), copy.deepcopy(room))
+
+    if room.get("members_spilled"):
+        member_ids = [member_id for member_id in member_ids or [] if member_id]
+        memberships = (
+            await get_memberships(org_id, room_id, member_ids) if member_ids else {}
+        )
+        room["room_members"] = memberships or {}
+    return room
+
+
+async def get_member_room(org_id: str, room_id: str, member_id: str) -> dict[str, Any]:
+    """Get a room after checking that a member belongs to it.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The room id.
+        member_id (str): The id of the member, e.g. the sender of a message.
+
+    Returns:
+        dict: A key value pair of room info mapped according to room schema.
+
+    Raises:
+        HTTPException [404]: Room does not exist or member not in the room.
+    """
+
+    room = await get_room(org_id, room_id, [member_id])
+    if not room:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Room does not exist"
+        )
+
+    if member_id not in room["room_members"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Sender not a member of this room",
+        )
+
+    return room
 
 
 async def get_room_members(org_id: str, room_id: str) -> dict[str, dict[str, Any]]:
@@ -141,17 +563,62 @@ async def get_room_members(org_id: str, room_id: str) -> dict[str, dict[str, Any
         },
     """
 
-    db = DataStorage(org_id)
-    query = {"_id": room_id}
-    options = {"sort": {"created_at": -1},
-               "projection": {"room_members": 1, "_id": 0}}
+    cached_room = room_cache.get((org_id, room_id))
+    if cached_room is not None and not cached_room.get("members_spilled"):
+        return copy.deepcopy(cached_room.get("room_members", {}))
 
-    response = await db.read(settings.ROOM_COLLECTION, query=query, options=options)
+    if cached_room is None:
+        db = DataStorage(org_id)
+        query = {"_id": room_id}
+        options = {"projection": {"room_members": 1, "members_spilled": 1, "_id": 0}}
 
-    if not response or "status_code" in response:
-        return {}
+        response = await db.read(settings.ROOM_COLLECTION, query=query, options=options)
+
+        if not response or "status_code" in response:
+            return {}
+        if not response.get("members_spilled"):
+            return response.get("room_members")
+
+    return await get_all_memberships(org_id, room_id) or {}
+
+
+async def get_room_members_page(
+    org_id: str,
+    room: dict[str, Any],
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    role: Optional[str] = None,
+) -> Optional[tuple[dict[str, dict[str, Any]], bool]]:
+    """Get a page of the members of a room, ordered by member id.
 
-    return response.get("room_members")
+    The members of a spilled room are read a page at a time from the room
+    members collection, those of other rooms are paged from the room document.
+
+    Args:
+        org_id (str): The organization id.
+        room (dict): The room, as returned by `get_room`.
+        limit (int, optional): The size of the page, None for every member.
+        after (str, optional): Only return the members with a greater id.
+        role (str, optional): Only return the members with this role.
+
+    Returns:
+        tuple[dict, bool]: The members of the page, by member id, and whether
+        more members follow. None if zc_core failed.
+    """
+    if room.get("members_spilled"):
+        return await get_membership_page(
+            org_id, room["_id"], limit=limit, after=after, role=role
+        )
+
+    member_ids = sorted(
+        member_id
+        for member_id, member in room.get("room_members", {}).items()
+        if (after is None or member_id > after)
+        and (role is None or member.get("role") == role)
+    )
+    page = member_ids if limit is None else member_ids[:limit]
+    members = {member_id: room["room_members"][member_id] for member_id in page}
+    return members, len(page) < len(member_ids)
 
 
 async def get_member_starred_rooms(org_id: str, member_id: str) -> list[dict[str, Any]]:
@@ -193,16 +660,7 @@ async def get_member_starred_rooms(org_id: str, member_id: str) -> list[dict[str
             ]
     """
 
-    db = DataStorage(org_id)
-    query = {f"room_members.{member_id}.starred": True}
-    options = {"sort": {"created_at": -1}}
-
-    response = await db.read(settings.ROOM_COLLECTION, query=query, options=options)
-
-    if not response or "status_code" in response:
-        return []
-
-    return response
+    return await get_member_rooms(org_id, member_id, starred=True) or []
 
 
 async def is_starred_room(org_id: str, room_id: str, member_id: str) -> bool:
@@ -231,6 +689,106 @@ async def is_starred_room(org_id: str, room_id: str, member_id: str) -> bool:
     return response["room_members"][member_id]["starred"]
 
 
+async def update_room_members(
+    org_id: str,
+    room_id: str,
+    members: dict[str, Optional[dict[str, Any]]],
+    data: Optional[dict[str, Any]] = None,
+    query: Optional[dict[str, Any]] = None,
+    spilled: bool = False,
+) -> bool:
+    """Changes some members of a room without rewriting the others.
+
+    Every change is a `$set` or `$unset` of its `room_members.<member_id>` path,
+    so concurrent changes to different members do not overwrite each other.
+    The members of a spilled room are changed in the room members collection
+    instead, and its `member_count` is kept up to date.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The room id.
+        members (dict): The fields to write to every changed member, by member
+            id, None for the members to remove.
+        data (dict, optional): Other top level fields of the room to write.
+        query (dict, optional): Conditions the room must match to be updated.
+        spilled (bool): Whether the room's members are spilled.
+
+    Returns:
+        bool: Whether the room matched and was updated.
+
+    Raises:
+        ConnectionError: ZC Core fails to update the room.
+    """
+    if spilled:
+        return await _update_spilled_members(org_id, room_id, members, data)
+
+    updates = {
+        f"room_members.{member_id}.{field}": value
+        for member_id, member in members.items()
+        if member is not None
+        for field, value in member.items()
+    }
+    updates.update(data or {})
+    removals = {
+        f"room_members.{member_id}": ""
+        for member_id, member in members.items()
+        if member is None
+    }
+    # the version lets a spill tell whether members changed while it copied them
+    raw_query = {"$inc": {"members_version": 1}}
+    if updates:
+        raw_query["$set"] = updates
+    if removals:
+        raw_query["$unset"] = removals
+
+    response = await DataStorage(org_id).update(
+        settings.ROOM_COLLECTION,
+        raw_query=raw_query,
+        query={"_id": room_id, "members_spilled": {"$ne": True}, **(query or {})},
+    )
+    if not response or response.get("status_code") is not None:
+        invalidate_room(org_id, room_id)
+        raise ConnectionError("Unable to update room members")
+    if not response.get("data", {}).get("matched_documents"):
+        # the room may have been deleted or spilled since it was cached
+        invalidate_room(org_id, room_id)
+        return False
+
+    patch_cached_members(org_id, room_id, members)
+    if data:
+        patch_cached_room(org_id, room_id, data)
+    return True
+
+
+async def _update_spilled_members(
+    org_id: str,
+    room_id: str,
+    members: dict[str, Optional[dict[str, Any]]],
+    data: Optional[dict[str, Any]],
+) -> bool:
+    saved = await save_memberships(org_id, room_id, members)
+    if saved is None:
+        raise ConnectionError("Unable to update room members")
+
+    changed, count = saved
+    if count or data:
+        raw_query = {"$inc": {"member_count": count}}
+        if data:
+            raw_query["$set"] = data
+        response = await DataStorage(org_id).update(
+            settings.ROOM_COLLECTION, raw_query=raw_query, query={"_id": room_id}
+        )
+        if not response or response.get("status_code") is not None:
+            invalidate_room(org_id, room_id)
+            raise ConnectionError("Unable to update room members")
+
+        room = room_cache.peek((org_id, room_id))
+        if room is not None:
+            room["member_count"] = room.get("member_count", 0) + count
+            room.update(copy.deepcopy(data or {}))
+    return bool(changed)
+
+
 async def remove_room_member(
     org_id: str, room_data: dict[str, Any], member_id: str
 ) -> dict[str, Any]:
@@ -254,62 +812,74 @@ async def remove_room_member(
         RequestException: ZC Core fails to remove user from room.
     """
 
-    db = DataStorage(org_id)
-    remove_member = room_data["room_members"].pop(member_id, "not_found")
-
-    if remove_member == "not_found":
-        raise ValueError("Not a member of this room")
-
     room_id = room_data["_id"]
-    room_members = {"room_members": room_data["room_members"]}
-
-    update_room = await db.update(settings.ROOM_COLLECTION, room_id, room_members)
+    if member_id not in room_data["room_members"]:
+        raise ValueError("Not a member of this room")
 
-    if update_room is None or update_room.get("status_code") is not None:
-        raise ConnectionError("Unable to remove room member")
+    spilled = bool(room_data.get("members_spilled"))
+    try:
+        removed = await update_room_members(
+            org_id,
+            room_id,
+            {member_id: None},
+            query=None if spilled else {f"room_members.{member_id}": {"$exists": True}},
+            spilled=spilled,
+        )
+    except ConnectionError as connect_error:
+        raise ConnectionError("Unable to remove room member") from connect_error
+    if not removed:
+        invalidate_room(org_id, room_id)
+        raise ValueError("Not a member of this room")
 
+    member_rooms.remove_member(org_id, member_id, room_id)
     return {"member_id": member_id, "room_id": room_id}
 
 
-async def remove_room(
-        org_id: str, room: str):
+async def remove_room(org_id: str, room: str):
     """Removes a room.
 
-    Args:
-        org_id (str): The organization id
-        room (str): The room to be removed.
+     Args:
+         org_id (str): The organization id
+         room (str): The room to be removed.
 
-   Returns:
-            On success, a dict containing the success status and
-            and how many documents were successfully deleted.
+    Returns:
+             On success, a dict containing the success status and
+             and how many documents were successfully deleted.
 
-            {
-                "status": 200,
-                "message": "success",
-                "data": {
-                    "deleted_count": 1
-                }
-            }
+             {
+                 "status": 200,
+                 "message": "success",
+                 "data": {
+                     "deleted_count": 1
+                 }
+             }
 
-            In case of error:
+             In case of error:
 
-            {
-                "status": 200,
-                "message": "success",
-                "data": {
-                    "deleted_count": 0
-                }
-            }
+             {
+                 "status": 200,
+                 "message": "success",
+                 "data": {
+                     "deleted_count": 0
+                 }
+             }
 
 
 
-    Raises:
-        ValueError:room not found.
-        RequestException: ZC Core fails to remove user from room.
+     Raises:
+         ValueError:room not found.
+         RequestException: ZC Core fails to remove user from room.
     """
 
     db = DataStorage(org_id)
     response = await db.delete(settings.ROOM_COLLECTION, room)
+    cached_room = room_cache.peek((org_id, room))
+    if cached_room is not None:
+        member_rooms.remove_room(org_id, cached_room)
+        if cached_room.get("member_key"):
+            dm_index.remove(org_id, cached_room["member_key"])
+    invalidate_room(org_id, room)
+    message_buffer.invalidate(org_id, room)
     if not response or "status_code" in response:
         return {}
 
@@ -1,7 +1,7 @@
 from schema.room import RoomType
 from utils.centrifugo import Events, centrifugo_client
-from utils.db import DataStorage
-from utils.room_utils import DEFAULT_DM_IMG, get_org_rooms
+from utils.org_directory import org_directory
+from utils.room_utils import DEFAULT_DM_IMG, get_member_rooms, get_org_rooms
 
 
 class Sidebar:
@@ -13,15 +13,13 @@ class Sidebar:
     """
 
     @classmethod
-    async def __get_room_members(
-        cls, member_id: str, room: dict, org_members: list, DB: DataStorage
-    ) -> dict:
+    async def __get_room_members(cls, member_id: str, room: dict, org_id: str) -> dict:
         """Gets the room members excluding the current user
 
         Args:
             member_id (str): member_id of the current user
             room (dict): room object data
-            org_members (list): list of all members in the organization
+            org_id (str): id of the organization the room belongs to
 
         Returns:
             [dict]: key value pair of room members
@@ -42,7 +40,7 @@ class Sidebar:
         ):  # checks if it's not a personal DM
             room_members.pop(member_id, "not-found")  # remove self from room members
         for room_member_id in room_members.keys():
-            member_data = await DB.get_member(room_member_id, org_members)
+            member_data = await org_directory.get_member(org_id, room_member_id)
             username = member_data.get("user_name", "no user name")
             image_url = member_data.get("image_url") or DEFAULT_DM_IMG
             room_members[room_member_id].update(username=username, image_url=image_url)
@@ -73,24 +71,20 @@ class Sidebar:
         members = list(room_members.values())
         return members[0]["image_url"] if len(members) > 0 else DEFAULT_DM_IMG
 
-    async def __get_room_profile(
-        self, member_id: str, room: dict, org_members: list, DB: DataStorage
-    ) -> dict:
+    async def __get_room_profile(self, member_id: str, room: dict, org_id: str) -> dict:
         """Stores the room profile data for the sidebar
 
         Args:
             member_id (str): member_id of the current user
             room (dict): room object data
-            org_members (list): list of all members in the organization
+            org_id (str): id of the organization the room belongs to
 
         Returns:
             dict: key value pair of room profile
         """
         room_profile = {}
         if room.get("room_type") in (RoomType.DM, RoomType.GROUP_DM):
-            room_members = await self.__get_room_members(
-                member_id, room, org_members, DB
-            )
+            room_members = await self.__get_room_members(member_id, room, org_id)
             room_profile["room_name"] = await self.__get_dm_room_name(room_members)
             room_profile["image_url"] = await self.__get_dm_room_image_url(room_members)
 
@@ -104,14 +98,14 @@ class Sidebar:
         return room_profile
 
     async def __get_joined_rooms(
-        self, member_id: str, user_rooms: list, org_members: list, DB: DataStorage
+        self, member_id: str, user_rooms: list, org_id: str
     ) -> dict:
         """Gets the profiles for all rooms for the sidebar
 
         Args:
             member_id (str): member_id of the current user
             user_rooms (list): list of all rooms of the current user
-            org_members (list): list of all members in the organization
+            org_id (str): id of the organization the rooms belong to
 
         Returns:
             dict: contains data as key value store of room profiles
@@ -126,22 +120,18 @@ class Sidebar:
             if room.get("is_archived"):
                 continue
             if room.get("room_members").get(member_id).get("closed") is False:
-                room_profile = await self.__get_room_profile(
-                    member_id, room, org_members, DB
-                )
+                room_profile = await self.__get_room_profile(member_id, room, org_id)
                 rooms.append(room_profile)
             if room.get("room_members").get(member_id, {}).get("starred"):
                 starred_rooms.append(room_profile)
         return {"rooms": rooms, "starred_rooms": starred_rooms}
 
-    async def __get_public_rooms(
-        self, member_id: str, org_id: str, org_members: list, DB: DataStorage
-    ) -> dict:
+    async def __get_public_rooms(self, member_id: str, org_id: str) -> dict:
         """Gets the public rooms for the sidebar
 
         Args:
             member_id (str): member_id of the current user
-            org_members (list): list of all members in the organization
+            org_id (str): id of the organization
 
         Returns:
             dict: contains data as key value store of room profiles
@@ -153,9 +143,7 @@ class Sidebar:
             for room in public_rooms:
                 if room.get("is_archived"):
                     continue
-                room_profile = await self.__get_room_profile(
-                    member_id, room, org_members, DB
-                )
+                room_profile = await self.__get_room_profile(member_id, room, org_id)
                 rooms.append(room_profile)
         return rooms
 
@@ -170,21 +158,15 @@ class Sidebar:
             {dict}: {dict containing user info}
         """
 
-        DB = DataStorage(org_id)
-        room_type_query = room_type
+        room_types = (RoomType.CHANNEL,)
         if room_type != RoomType.CHANNEL:
-            room_type_query = {"$ne": RoomType.CHANNEL}
+            room_types = (RoomType.DM, RoomType.GROUP_DM)
 
-        user_rooms = await get_org_rooms(
-            member_id=member_id, org_id=org_id, room_type=room_type_query
-        )
+        user_rooms = await get_member_rooms(org_id, member_id, room_types=room_types)
 
-        org_members = await DB.get_all_members()
-        joined_rooms = await self.__get_joined_rooms(
-            member_id, user_rooms, org_members, DB
-        )
+        joined_rooms = await self.__get_joined_rooms(member_id, user_rooms, org_id)
         public_rooms = (
-            await self.__get_public_rooms(member_id, org_id, org_members, DB)
+            await self.__get_public_rooms(member_id, org_id)
             if room_type == RoomType.CHANNEL
             else []
         )
@@ -0,0 +1,343 @@
+import asyncio
+import sys
+from datetime import datetime
+from typing import Any, Optional
+
+from config.settings import settings
+from utils.db import DataStorage
+from utils.http_client import http_client
+from utils.message_buffer import message_buffer
+from utils.message_utils import thread_activity
+
+# Replies of a thread stay embedded in their parent message until the thread
+# holds THREAD_SPILL_THRESHOLD of them. The thread is then spilled: its replies
+# move to the thread replies collection, one document per reply carrying the
+# `parent_id` and `room_id` of its parent, and the parent is flagged with
+# `threads_spilled` while keeping its `thread_count`, `last_reply_at` and
+# `thread_participants`. The collection is read by `parent_id` and needs an
+# index on (parent_id, created_at, thread_id).
+
+REPLY_PROJECTION = {"_id": 0, "parent_id": 0, "room_id": 0}
+
+
+def _as_list(response: Any) -> Optional[list[dict[str, Any]]]:
+    if response is None:
+        return []
+    if "status_code" in response:
+        return None
+    if isinstance(response, dict):
+        return [response]
+    return response
+
+
+async def save_reply(
+    org_id: str, room_id: str, message_id: str, reply: dict[str, Any]
+) -> dict[str, Any]:
+    """Stores a reply of a spilled thread.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The id of the room the parent message was sent in.
+        message_id (str): The id of the parent message.
+        reply (dict): The reply, including its `thread_id`.
+
+    Returns:
+        dict[str, Any]: The response returned by DataStorage's write method.
+    """
+    return await DataStorage(org_id).write(
+        settings.THREAD_REPLIES_COLLECTION,
+        {**reply, "parent_id": message_id, "room_id": room_id},
+    )
+
+
+async def get_replies(
+    org_id: str,
+    room_id: str,
+    message_id: str,
+    limit: Optional[int] = None,
+    remaining: Optional[int] = None,
+) -> Optional[list[dict[str, Any]]]:
+    """Reads a page of the replies of a spilled thread, newest first.
+
+    Pages are addressed like `$slice` pages of embedded replies: the first
+    page holds the newest replies and later pages are counted from the oldest.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The id of the room the parent message was sent in.
+        message_id (str): The id of the parent message.
+        limit (int): The maximum number of replies to return, None for all of them.
+        remaining (int): Number of older replies not returned yet, None for
+            the first page.
+
+    Returns:
+        list[dict]: The replies, None if zc_core failed.
+    """
+    options = {"projection": REPLY_PROJECTION}
+    if remaining is None:
+        options["sort"] = {"created_at": -1, "thread_id": -1}
+        if limit is not None:
+            options["limit"] = limit
+    else:
+        count = min(limit, remaining)
+        options["sort"] = {"created_at": 1, "thread_id": 1}
+        options["skip"] = remaining - count
+        options["limit"] = count
+
+    replies = _as_list(
+        await DataStorage(org_id).read(
+            settings.THREAD_REPLIES_COLLECTION,
+            query={"parent_id": message_id, "room_id": room_id},
+            options=options,
+        )
+    )
+    if replies is not None and remaining is not None:
+        replies.reverse()
+    return replies
+
+
+async def get_reply(
+    org_id: str, room_id: str, message_id: str, thread_id: str
+) -> Optional[dict[str, Any]]:
+    """Reads one reply of a spilled thread.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The id of the room the parent message was sent in.
+        message_id (str): The id of the parent message.
+        thread_id (str): The id of the reply.
+
+    Returns:
+        dict: The reply, empty if it does not exist, None if zc_core failed.
+    """
+    replies = _as_list(
+        await DataStorage(org_id).read(
+            settings.THREAD_REPLIES_COLLECTION,
+            query={"parent_id": message_id, "room_id": room_id, "thread_id": thread_id},
+            options={"projection": REPLY_PROJECTION},
+        )
+    )
+    if replies is None:
+        return None
+    return replies[0] if replies else {}
+
+
+async def update_reply(
+    org_id: str,
+    room_id: str,
+    message_id: str,
+    thread_id: str,
+    sender_id: str,
+    data: dict[str, Any],
+) -> dict[str, Any]:
+    """Edits a reply of a spilled thread, provided it was sent by `sender_id`.
+
+    The parent message's `updated_at` is bumped once the reply is edited, so
+    that the edit is picked up by room syncs.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The id of the room the parent message was sent in.
+        message_id (str): The id of the parent message.
+        thread_id (str): The id of the reply.
+        sender_id (str): The id of the member editing the reply.
+        data (dict): The fields to set on the reply.
+
+    Returns:
+        dict[str, Any]: The response returned by DataStorage's update method.
+    """
+    DB = DataStorage(org_id)
+    response = await DB.update(
+        collection_name=settings.THREAD_REPLIES_COLLECTION,
+        raw_query={"$set": data},
+        query={
+            "parent_id": message_id,
+            "room_id": room_id,
+            "thread_id": thread_id,
+            "sender_id": sender_id,
+        },
+    )
+    if not response or response.get("status_code"):
+        return response
+
+    if response.get("data", {}).get("matched_documents"):
+        updated_at = data.get("updated_at") or str(datetime.utcnow())
+        await DB.update(
+            collection_name=settings.MESSAGE_COLLECTION,
+            raw_query={"$set": {"updated_at": updated_at}},
+            query={"_id": message_id, "room_id": room_id},
+        )
+    return response
+
+
+async def copy_replies(
+    org_id: str, room_id: str, message_id: str, replies: list[dict[str, Any]]
+) -> bool:
+    """Copies embedded replies to the thread replies collection.
+
+    Replies copied by an earlier attempt are only written again if they were
+    edited since.
+
+    Returns:
+        bool: False if zc_core failed.
+    """
+    DB = DataStorage(org_id)
+    copied = _as_list(
+        await DB.read(
+            settings.THREAD_REPLIES_COLLECTION,
+            query={"parent_id": message_id, "room_id": room_id},
+            options={"projection": {"_id": 0, "thread_id": 1, "updated_at": 1}},
+        )
+    )
+    if copied is None:
+        return False
+
+    versions = {reply["thread_id"]: reply.get("updated_at") for reply in copied}
+    missing = [
+        {**reply, "parent_id": message_id, "room_id": room_id}
+        for reply in replies
+        if reply["thread_id"] not in versions
+    ]
+    stale = [
+        reply
+        for reply in replies
+        if reply["thread_id"] in versions
+        and versions[reply["thread_id"]] != reply.get("updated_at")
+    ]
+
+    writes = [
+        DB.update(
+            collection_name=settings.THREAD_REPLIES_COLLECTION,
+            raw_query={"$set": reply},
+            query={"parent_id": message_id, "thread_id": reply["thread_id"]},
+        )
+        for reply in stale
+    ]
+    if missing:
+        writes.append(
+            DB.write(settings.THREAD_REPLIES_COLLECTION, missing, bulk_write=True)
+        )
+
+    responses = await asyncio.gather(*writes)
+    return all(response and not response.get("status_code") for response in responses)
+
+
+async def spill_thread(org_id: str, room_id: str, message_id: str) -> bool:
+    """Moves the replies of a thread out of its parent message.
+
+    Replies are copied first, then the parent is flagged and its `threads`
+    removed in one update that only applies if the parent was not replied to
+    or edited in the meantime, so readers always see every reply either
+    embedded or spilled. Failed or interrupted attempts can be run again.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The id of the room the parent message was sent in.
+        message_id (str): The id of the parent message.
+
+    Returns:
+        bool: True once the thread is spilled, False if the parent was not found,
+        kept changing or zc_core failed.
+    """
+    DB = DataStorage(org_id)
+    for _ in range(settings.THREAD_SPILL_RETRIES):
+        parent = await DB.read(
+            settings.MESSAGE_COLLECTION,
+            query={"_id": message_id, "room_id": room_id},
+            options={
+                "projection": {
+                    "threads": 1,
+                    "thread_count": 1,
+                    "updated_at": 1,
+                    "threads_spilled": 1,
+                }
+            },
+        )
+        if not parent or "status_code" in parent:
+            return False
+        if parent.get("threads_spilled"):
+            return True
+
+        replies = parent.get("threads") or []
+        if not await copy_replies(org_id, room_id, message_id, replies):
+            return False
+
+        data = {"threads_spilled": True}
+        if parent.get("thread_count") is None:
+            data.update(thread_activity(replies))
+
+        response = await DB.update(
+            collection_name=settings.MESSAGE_COLLECTION,
+            raw_query={"$set": data, "$unset": {"threads": ""}},
+            query={
+                "_id": message_id,
+                "room_id": room_id,
+                "threads_spilled": {"$ne": True},
+                "thread_count": parent.get("thread_count"),
+                "updated_at": parent.get("updated_at"),
+            },
+        )
+        if not response or response.get("status_code"):
+            return False
+        if response.get("data", {}).get("matched_documents"):
+            message_buffer.update(org_id, room_id, message_id, {**data, "threads": []})
+            return True
+        # a reply or an edit landed after the parent was read
+
+    return False
+
+
+async def migrate_oversized_threads(
+    org_id: str, batch_size: int = settings.THREAD_MIGRATION_BATCH_SIZE
+) -> int:
+    """Spills every thread of an organization holding more replies than allowed.
+
+    Spilled threads no longer match the scan, so the job can be interrupted
+    and run again. It stops once a whole batch of threads failed to spill.
+
+    Args:
+        org_id (str): The organization id.
+        batch_size (int): Number of threads spilled concurrently.
+
+    Returns:
+        int: The number of threads spilled.
+    """
+    spilled = 0
+    while True:
+        parents = _as_list(
+            await DataStorage(org_id).read(
+                settings.MESSAGE_COLLECTION,
+                raw_query={
+                    f"threads.{settings.THREAD_SPILL_THRESHOLD}": {"$exists": True},
+                    "threads_spilled": {"$ne": True},
+                },
+                options={"limit": batch_size, "projection": {"_id": 1, "room_id": 1}},
+            )
+        )
+        if not parents:
+            return spilled
+
+        results = await asyncio.gather(
+            *(
+                spill_thread(org_id, parent["room_id"], parent["_id"])
+                for parent in parents
+            )
+        )
+        if not any(results):
+            return spilled
+        spilled += sum(results)
+
+
+async def main(org_ids: list[str]) -> None:
+    """Runs the oversized thread migration for the given organizations."""
+    try:
+        for org_id in org_ids:
+            spilled = await migrate_oversized_threads(org_id)
+            print(f"{org_id}: {spilled} threads spilled")
+    finally:
+        await http_client.shutdown()
+
+
+if __name__ == "__main__":
+    # python -m utils.thread_replies <org_id> [<org_id> ...]
+    asyncio.run(main(sys.argv[1:]))
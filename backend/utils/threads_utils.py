@@ -6,27 +6,138 @@ from config.settings import settings
 from fastapi import HTTPException, status
 from schema.message import Thread
 from utils.db import DataStorage
-from utils.message_utils import get_message, update_message
+from utils.message_buffer import message_buffer
+from utils.message_utils import thread_activity
+from utils.paginator import decode_thread_cursor, encode_thread_cursor
+from utils.room_utils import update_room_counters
+from utils.thread_replies import (
+    get_replies,
+    get_reply,
+    save_reply,
+    spill_thread,
+    update_reply,
+)
+
+
+async def get_thread_activity(org_id, room_id, message_id):
+    """Reads who replied to a parent message and when, without the replies' content.
+
+    Only used for parent messages stored before their thread fields existed, and
+    to tell why a reply could not be pushed onto its parent.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The id of the room the message was sent in.
+        message_id (str): The id of the parent message.
+
+    Returns:
+        dict: The `thread_count`, `last_reply_at` and `thread_participants` of
+        the message and whether its thread is `threads_spilled`, None if the
+        message was not found.
+    """
+
+    response = await DataStorage(org_id).read(
+        collection_name=settings.MESSAGE_COLLECTION,
+        query={"_id": message_id, "room_id": room_id},
+        options={
+            "projection": {
+                "threads.sender_id": 1,
+                "threads.created_at": 1,
+                "threads_spilled": 1,
+            }
+        },
+    )
+
+    if not response or "status_code" in response:
+        return None
+
+    return {
+        **thread_activity(response.get("threads") or []),
+        "threads_spilled": bool(response.get("threads_spilled")),
+    }
+
 
 # List all messages in a thread
 
 
-async def get_message_threads(org_id, room_id, message_id):
-    """Retrieves all the messages in a thread.
+async def get_message_threads(org_id, room_id, message_id, limit=None, cursor=None):
+    """Retrieves the messages in a thread, newest first.
+
+    Only the requested page of replies is read from zc_core, using a `$slice`
+    projection of the parent's `threads`, or from the thread replies collection
+    once the thread has been spilled.
 
     Args:
         org_id (str): The organization id where the message is being updated.
         room_id (str): The id of the room the message was sent in.
         message_id (str): The id of the message to be edited.
-
+        limit (int): The maximum number of replies to return, None for all of them.
+        cursor (str): The cursor returned with the previous page of replies.
 
     Returns:
-        [dict]: Returns an array of message objects.
+        dict: The page of replies, the total number of replies and the cursor of
+        the next page, None if zc_core failed.
+
+        {
+            "data": [{...}, {...}],
+            "reply_count": 42,
+            "next_cursor": "WyJ0aHJlYWRzIiwyMl0"
+        }
+
+    Raises:
+        HTTPException [400]: Invalid cursor
+        HTTPException [404]: Message not found
     """
 
-    # fetch message parent of the thread
-    message = await get_message(org_id, room_id, message_id)
-    return message["threads"]
+    remaining = decode_thread_cursor(cursor) if cursor else None
+    if remaining is not None and limit is None:
+        limit = settings.THREAD_PAGE_SIZE
+
+    projection = {"thread_count": 1, "threads": 1, "threads_spilled": 1}
+    if limit is not None:
+        # replies are inserted at the front, so later pages are counted from the end
+        start = 0 if remaining is None else -remaining
+        projection["threads"] = {"$slice": [start, limit]}
+
+    response = await DataStorage(org_id).read(
+        collection_name=settings.MESSAGE_COLLECTION,
+        query={"_id": message_id, "room_id": room_id},
+        options={"projection": projection},
+    )
+
+    if response is not None and "status_code" in response:
+        return None
+
+    if not response:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Message not found"
+        )
+
+    replies = response.get("threads") or []
+    if response.get("threads_spilled"):
+        replies = await get_replies(org_id, room_id, message_id, limit, remaining)
+        if replies is None:
+            return None
+
+    reply_count = response.get("thread_count")
+    if reply_count is None:
+        reply_count = len(replies)
+        if limit is not None:
+            activity = await get_thread_activity(org_id, room_id, message_id)
+            if activity is None:
+                return None
+            reply_count = activity["thread_count"]
+
+    if remaining is None:
+        remaining = reply_count
+    remaining -= len(replies)
+
+    next_cursor = None
+    if limit is not None and remaining > 0:
+        next_cursor = encode_thread_cursor(remaining)
+
+    return {"data": replies, "reply_count": reply_count, "next_cursor": next_cursor}
+
 
 async def get_message_thread(org_id, room_id, message_id, thread_id):
     """Retrieves a single thread message.
@@ -42,29 +153,38 @@ async def get_message_thread(org_id, room_id, message_id, thread_id):
         [dict]: Returns an array containing a single thread message.
     """
 
-    query = {
-        "_id": message_id,
-        "threads.thread_id": thread_id
-    }
+    query = {"_id": message_id, "threads.thread_id": thread_id}
 
-    options = { "projection": {"threads.$": 1} }
+    options = {"projection": {"threads.$": 1}}
 
     response = await DataStorage(org_id).read(
-        collection_name=settings.MESSAGE_COLLECTION,
-        query=query,
-        options=options
+        collection_name=settings.MESSAGE_COLLECTION, query=query, options=options
     )
-    
-    if not response or "status_code" in response:
+
+    if response is not None and "status_code" in response:
         return []
 
-    return response["threads"]
+    if not response:
+        reply = await get_reply(org_id, room_id, message_id, thread_id)
+        return [reply] if reply else []
 
+    return response["threads"]
 
 
 async def add_message_to_thread_list(org_id, room_id, message_id, request: Thread):
     """Adds a message to a thread.
 
+    The reply is pushed at the front of the parent's `threads` and the parent's
+    thread summary fields (`thread_count`, `last_reply_at` and
+    `thread_participants`) are updated in a single update, so the parent message
+    is never read and concurrent replies cannot overwrite each other. Parents
+    stored before these fields existed get them backfilled on their next reply.
+    Once a thread holds `THREAD_SPILL_THRESHOLD` replies it is spilled, and its
+    replies are stored in the thread replies collection instead, before the
+    parent's summary fields count them.
+    The room's thread reply and attachment counters are incremented once the
+    reply is saved.
+
     Args:
         org_id (str): The organization id where the message is being updated.
         room_id (str): The id of the room the message was sent in.
@@ -73,24 +193,117 @@ async def add_message_to_thread_list(org_id, room_id, message_id, request: Threa
 
     Returns:
         dict[str, Any]: Returns an update success response.
+
+    Raises:
+        HTTPException [404]: Message not found.
     """
 
-    # add message to a parent thread
-    message = await get_message(org_id, room_id, message_id)
+    thread_message = request.dict(exclude_unset=True)
+    thread_message["thread_id"] = str(uuid.uuid1())
+    thread_message["created_at"] = str(datetime.utcnow())
+
+    db = DataStorage(org_id)
+    sender_id = thread_message.get("sender_id")
+    push = {
+        "threads": {"$each": [thread_message], "$position": 0},
+        "thread_participants": {
+            "$each": [sender_id],
+            "$position": 0,
+            "$slice": settings.THREAD_PARTICIPANTS_WINDOW,
+        },
+    }
+    replied_at = {
+        "updated_at": thread_message["created_at"],
+        "last_reply_at": thread_message["created_at"],
+    }
 
-    if not message:
+    async def push_reply(activity=None, spilled=False):
+        query = {"_id": message_id, "room_id": room_id}
+        if spilled:
+            query["threads_spilled"] = True
+            raw_query = {
+                "$push": {"thread_participants": push["thread_participants"]},
+                "$inc": {"thread_count": 1},
+                "$set": replied_at,
+            }
+        elif activity is None:
+            query["threads_spilled"] = {"$ne": True}
+            query["thread_count"] = {
+                "$exists": True,
+                "$lt": settings.THREAD_SPILL_THRESHOLD,
+            }
+            raw_query = {"$push": push, "$inc": {"thread_count": 1}, "$set": replied_at}
+        else:
+            query["thread_count"] = {"$exists": False}
+            participants = [sender_id] + activity["thread_participants"]
+            raw_query = {
+                "$push": {"threads": push["threads"]},
+                "$set": {
+                    **replied_at,
+                    "thread_count": activity["thread_count"] + 1,
+                    "thread_participants": participants[
+                        : settings.THREAD_PARTICIPANTS_WINDOW
+                    ],
+                },
+            }
+        response = await db.update(
+            collection_name=settings.MESSAGE_COLLECTION,
+            raw_query=raw_query,
+            query=query,
+        )
+        if not response or response.get("status_code"):
+            return response, True
+        return response, bool(response.get("data", {}).get("matched_documents"))
+
+    async def push_spilled_reply():
+        # the reply is stored before the parent counts it, and removed again
+        # if the parent could not count it
+        saved = await save_reply(org_id, room_id, message_id, thread_message)
+        if not saved or saved.get("status_code"):
+            return saved, True
+        response, matched = await push_reply(spilled=True)
+        if not matched or not response or response.get("status_code"):
+            reply_id = saved.get("data", {}).get("object_id")
+            if reply_id:
+                await db.delete(settings.THREAD_REPLIES_COLLECTION, reply_id)
+        return response, matched
+
+    response, matched = await push_reply()
+    if not matched:
+        # the parent is missing, spilled, predates its thread fields or its
+        # thread is full
+        activity = await get_thread_activity(org_id, room_id, message_id)
+        if activity is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Message not found"
+            )
+        if activity["threads_spilled"]:
+            response, matched = await push_spilled_reply()
+        elif activity["thread_count"] >= settings.THREAD_SPILL_THRESHOLD:
+            if not await spill_thread(org_id, room_id, message_id):
+                return None, thread_message
+            response, matched = await push_spilled_reply()
+        else:
+            response, matched = await push_reply(activity)
+            if not matched:
+                # a concurrent reply backfilled the thread fields first
+                response, matched = await push_reply()
+
+    if not matched:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Message not found"
         )
-    del message["_id"]
-
-    thread_message = request.dict(exclude_unset=True)
-    thread_message["thread_id"] = str(uuid.uuid1())
-    thread_message["created_at"] = str(datetime.utcnow())
 
-    message["threads"].insert(0, thread_message)
+    if not response or response.get("status_code"):
+        return response, thread_message
 
-    response = await update_message(org_id, message_id, message)
+    message_buffer.add_thread(org_id, room_id, message_id, thread_message)
+    await update_room_counters(
+        org_id,
+        room_id,
+        thread_reply_count=1,
+        attachment_count=len(thread_message.get("files", [])),
+    )
 
     return response, thread_message
 
@@ -99,44 +312,117 @@ async def update_message_thread(
     org_id, room_id, message_id, thread_id, payload: Thread
 ) -> dict[str, Any]:
     """Updates a message document in the database.
+
+    The edit is a single conditional update matching the reply by its id and
+    sender, applied to the thread replies collection instead when the thread
+    has been spilled. Only when nothing matched is the parent read, to tell a
+    missing reply apart from an edit by someone else.
+
     Args:
         org_id (str): The organization id where the message is being updated.
+        room_id (str): The id of the room the message was sent in.
         message_id (str): The id of the parent message whose thread message is to be edited.
         thread_id (str): The id of the thread message to be edited
         payload (dict[str, Any]): the new thread mesage
+
     Returns:
         dict[str, Any]: The response returned by DataStorage's update method.
-    """
-    message = await get_message(org_id, room_id, message_id)
-
-    if not message:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Parent message not found"
-        )
-
-    loaded_message_thread = await get_message_thread(org_id, room_id, message_id, thread_id)   
-
-
-    if loaded_message_thread[0]["sender_id"] != payload["sender_id"]:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="You are not authorized to edit this thread message",
-        )
 
+    Raises:
+        HTTPException [401]: You are not authorized to edit this thread message.
+        HTTPException [404]: Parent message or thread message not found.
+    """
+    updated_at = str(datetime.utcnow())
     payload["edited"] = True
     payload["thread_id"] = thread_id
+    payload["updated_at"] = updated_at
 
     raw_query = {
-        "$set": {"threads.$": payload},
+        "$set": {
+            **{f"threads.$.{field}": value for field, value in payload.items()},
+            "updated_at": updated_at,
+        },
     }
 
     query = {
         "_id": message_id,
-        "threads.thread_id": thread_id,
+        "room_id": room_id,
+        "threads": {
+            "$elemMatch": {"thread_id": thread_id, "sender_id": payload["sender_id"]}
+        },
     }
-    
-    return await DataStorage(org_id).update(
+
+    response = await DataStorage(org_id).update(
         collection_name=settings.MESSAGE_COLLECTION,
         raw_query=raw_query,
-        query=query
+        query=query,
+    )
+
+    if not response or response.get("status_code"):
+        return response
+
+    if not response.get("data", {}).get("matched_documents"):
+        response = await update_reply(
+            org_id, room_id, message_id, thread_id, payload["sender_id"], payload
+        )
+        if not response or response.get("status_code"):
+            return response
+        if not response.get("data", {}).get("matched_documents"):
+            await raise_thread_edit_error(org_id, room_id, message_id, thread_id)
+
+    message_buffer.update_thread(org_id, room_id, message_id, payload)
+    return response
+
+
+async def raise_thread_edit_error(org_id, room_id, message_id, thread_id):
+    """Explains why a thread message edit matched nothing.
+
+    Args:
+        org_id (str): The organization id.
+        room_id (str): The id of the room the message was sent in.
+        message_id (str): The id of the parent message.
+        thread_id (str): The id of the thread message.
+
+    Raises:
+        HTTPException [401]: You are not authorized to edit this thread message.
+        HTTPException [404]: Parent message or thread message not found.
+        HTTPException [424]: thread not updated.
+    """
+    response = await DataStorage(org_id).read(
+        collection_name=settings.MESSAGE_COLLECTION,
+        query={"_id": message_id, "room_id": room_id},
+        options={
+            "projection": {
+                "threads": {"$elemMatch": {"thread_id": thread_id}},
+                "threads_spilled": 1,
+            }
+        },
+    )
+
+    if response is not None and "status_code" in response:
+        raise HTTPException(
+            status_code=status.HTTP_424_FAILED_DEPENDENCY, detail="thread not updated"
+        )
+    if not response:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Parent message not found"
+        )
+
+    replies = response.get("threads")
+    if response.get("threads_spilled"):
+        replies = await get_reply(org_id, room_id, message_id, thread_id)
+        if replies is None:
+            raise HTTPException(
+                status_code=status.HTTP_424_FAILED_DEPENDENCY,
+                detail="thread not updated",
+            )
+
+    if not replies:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Thread message not found"
+        )
+
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="You are not authorized to edit this thread message",
     )
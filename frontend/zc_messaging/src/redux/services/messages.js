@@ -128,9 +128,9 @@ export const messagesApi = createApi({
         const parent = await fetchWithBQ(
           `/org/${orgId}/rooms/${roomId}/messages/${threadId}`
         )
-        if (Array.isArray(getMessagesInRoomResponse?.data?.data)) {
+        if (Array.isArray(getMessagesInRoomResponse?.data?.data?.data)) {
           const workspaceUsers = await getCurrentWorkspaceUsers()
-          const roomMessages = getMessagesInRoomResponse.data.data
+          const roomMessages = getMessagesInRoomResponse.data.data.data
           const parentMessage = [parent?.data?.data]
           return {
             data: {